@@ -0,0 +1,63 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from api.models.analytics import TransactionRollup
+
+# Every query reads transaction_rollups only. Its cost depends on the number of
+# buckets in the range, never on the number of transactions.
+
+_TOTALS = [
+    func.coalesce(func.sum(TransactionRollup.transaction_count), 0).label("transaction_count"),
+    func.coalesce(func.sum(TransactionRollup.fraud_count), 0).label("fraud_count"),
+    func.coalesce(func.sum(TransactionRollup.total_amount), 0.0).label("total_amount"),
+    func.coalesce(func.sum(TransactionRollup.fraud_amount), 0.0).label("fraud_amount"),
+    func.coalesce(func.sum(TransactionRollup.scored_count), 0).label("scored_count"),
+    func.coalesce(func.sum(TransactionRollup.fraud_probability_sum), 0.0).label("fraud_probability_sum")
+]
+
+def _filtered(query, granularity: str, start: Optional[datetime], end: Optional[datetime],
+              source: Optional[str], model_id: Optional[int]):
+    query = query.where(TransactionRollup.granularity == granularity)
+    if start is not None:
+        query = query.where(TransactionRollup.bucket_start >= func.date_trunc(granularity, start))
+    if end is not None:
+        query = query.where(TransactionRollup.bucket_start < end)
+    if source is not None:
+        query = query.where(TransactionRollup.source == source)
+    if model_id is not None:
+        query = query.where(TransactionRollup.model_id == model_id)
+    return query
+
+def _analytics(row):
+    total = row.transaction_count
+    return {
+        "total_transactions": total,
+        "fraud_count": row.fraud_count,
+        "fraud_rate": row.fraud_count / total if total else 0.0,
+        "average_transaction_amount": row.total_amount / total if total else 0.0,
+        "total_amount": row.total_amount,
+        "fraud_amount": row.fraud_amount,
+        "average_fraud_probability": row.fraud_probability_sum / row.scored_count if row.scored_count else None
+    }
+
+def get_summary(db: Session, granularity: str = "day", start: Optional[datetime] = None,
+                end: Optional[datetime] = None, source: Optional[str] = None, model_id: Optional[int] = None):
+    query = _filtered(select(*_TOTALS), granularity, start, end, source, model_id)
+    return _analytics(db.execute(query).one())
+
+def get_timeseries(db: Session, granularity: str, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None, source: Optional[str] = None,
+                   model_id: Optional[int] = None, limit: int = 1000):
+    # The most recent buckets when the range holds more than limit, returned oldest first
+    query = _filtered(
+        select(TransactionRollup.bucket_start, *_TOTALS), granularity, start, end, source, model_id
+    ).group_by(TransactionRollup.bucket_start).order_by(TransactionRollup.bucket_start.desc()).limit(limit)
+    rows = db.execute(query).all()
+    return [{"bucket_start": row.bucket_start, **_analytics(row)} for row in reversed(rows)]
+
+def get_breakdown(db: Session, by: str, granularity: str = "day", start: Optional[datetime] = None,
+                  end: Optional[datetime] = None, source: Optional[str] = None, model_id: Optional[int] = None):
+    key = TransactionRollup.source if by == "source" else TransactionRollup.model_id
+    query = _filtered(select(key, *_TOTALS), granularity, start, end, source, model_id).group_by(key).order_by(key)
+    return [{by: getattr(row, by), **_analytics(row)} for row in db.execute(query).all()]
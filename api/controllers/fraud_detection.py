@@ -1,48 +1,83 @@
-from sqlalchemy.orm import Session
-from api.models.transaction import Transaction, FraudPrediction, MLModel
+import time
+import logging
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.models.transaction import MLModel
 from api.schemas.transaction import TransactionCreate
-from api.services.ml_model import model_service
-from datetime import datetime
+from api.services.ml_model import model_service, FEATURE_COLUMNS
+from api.services.model_registry import active_model_cache, to_active_model
+from api.services.metrics import count_verdicts
+from typing import List
 
-def get_active_model(db: Session):
-    return db.query(MLModel).filter(MLModel.active == True).first()
+logger = logging.getLogger(__name__)
 
-def process_transaction(db: Session, transaction: TransactionCreate):
-    # Process a transaction for fraud detection.
+async def get_active_model(db: AsyncSession):
+    active_model = active_model_cache.get()
+    if active_model is not None:
+        return active_model
+    
+    result = await db.execute(select(MLModel).where(MLModel.active == True).limit(1))
+    active_model = to_active_model(result.scalars().first())
+    if active_model is not None:
+        active_model_cache.set(active_model)
+    return active_model
+
+async def _attribute_model(db: AsyncSession, prediction_results):
+    # Record the model that actually scored the rows, not whatever is active afterwards.
+    # Only artifacts loaded without the registry need the active row.
+    if prediction_results and prediction_results[0]["model_id"] is None:
+        active_model = await get_active_model(db)
+        for prediction_result in prediction_results:
+            prediction_result["model_id"] = active_model.model_id if active_model else None
+    count_verdicts(prediction_results)
+    return prediction_results
+
+async def process_transaction(db: AsyncSession, transaction: TransactionCreate):
+    # Score a transaction for fraud detection, before anything is written.
     
     # 1. Convert transaction to the right format for the model
-    # 2. Use the model to predict fraud
-    # 3. Store prediction in database
-    # 4. Return the prediction result
+    # 2. Use the model to predict fraud (off the event loop)
+    # 3. Attribute the prediction to a model; the caller persists it
+    started = time.perf_counter()
     try:
         transaction_dict = transaction.dict()
         
-        prediction_result = model_service.predict(transaction_dict)
-        
-        active_model = get_active_model(db)
-        if active_model:
-            latest_transaction = db.query(Transaction).order_by(Transaction.transaction_id.desc()).first()
-            
-            prediction = FraudPrediction(
-                transaction_id=latest_transaction.transaction_id,
-                model_id=active_model.model_id,
-                fraud_probability=prediction_result["fraud_probability"],
-                prediction_threshold=0.5,
-                predicted_class=prediction_result["is_fraud"],
-                features_used=["time", "v1", "v2", "v3", "v4", "v5", "v6", "v7", "v8", "v9", "v10",
-                              "v11", "v12", "v13", "v14", "v15", "v16", "v17", "v18", "v19", "v20",
-                              "v21", "v22", "v23", "v24", "v25", "v26", "v27", "v28", "amount"],
-                explanation={"importance": {}}
-            )
-            db.add(prediction)
-            db.commit()
-            db.refresh(prediction)
-        
-        prediction_result["transaction_id"] = latest_transaction.transaction_id
-        prediction_result["prediction_time"] = datetime.now()
+        prediction_result = await model_service.predict_async(transaction_dict)
         
+        await _attribute_model(db, [prediction_result])
         return prediction_result
         
     except Exception as e:
-        print(f"Error processing transaction: {e}")
-        raise
\ No newline at end of file
+        logger.error("Error processing transaction", extra={
+            "error": str(e),
+            "score_ms": round((time.perf_counter() - started) * 1000, 3)
+        })
+        raise
+
+async def process_transactions_batch(db: AsyncSession, transactions: List[TransactionCreate]):
+    # Score a batch of transactions in one vectorized call; the caller persists them.
+    prediction_results = await model_service.predict_batch_async(
+        [transaction.dict() for transaction in transactions]
+    )
+    return await _attribute_model(db, prediction_results)
+
+def build_prediction_row(transaction_id: int, prediction_result):
+    return {
+        "transaction_id": transaction_id,
+        "model_id": prediction_result["model_id"],
+        "fraud_probability": prediction_result["fraud_probability"],
+        "prediction_threshold": prediction_result["prediction_threshold"],
+        "predicted_class": prediction_result["is_fraud"],
+        "features_used": FEATURE_COLUMNS,
+        "explanation": {"importance": {}}
+    }
+def prediction_from_row(row, model_version=None):
+    # The inverse of build_prediction_row: a stored FraudPrediction as a prediction result
+    return {
+        "fraud_probability": row.fraud_probability,
+        "is_fraud": row.predicted_class,
+        "confidence": 2 * abs(row.fraud_probability - 0.5),
+        "prediction_threshold": row.prediction_threshold,
+        "model_version": model_version,
+        "model_id": row.model_id
+    }
@@ -1,47 +1,307 @@
-import uuid
+import asyncio
+import json
+import logging
 from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import insert, select, text
 from sqlalchemy.orm import Session
-from api.models.transaction import Transaction
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.core.config import settings
+from api.models.transaction import Transaction, FraudPrediction
 from api.schemas.transaction import TransactionCreate
 from api.services.message_queue import rabbitmq_client
-from api.dependencies.storage import minio_client
-from api.controllers.fraud_detection import process_transaction
-
-def create_transaction(db: Session, transaction: TransactionCreate):
-    db_transaction = Transaction(
-        time=transaction.time,
-        v1=transaction.v1, v2=transaction.v2, v3=transaction.v3,
-        v4=transaction.v4, v5=transaction.v5, v6=transaction.v6,
-        v7=transaction.v7, v8=transaction.v8, v9=transaction.v9,
-        v10=transaction.v10, v11=transaction.v11, v12=transaction.v12,
-        v13=transaction.v13, v14=transaction.v14, v15=transaction.v15,
-        v16=transaction.v16, v17=transaction.v17, v18=transaction.v18,
-        v19=transaction.v19, v20=transaction.v20, v21=transaction.v21,
-        v22=transaction.v22, v23=transaction.v23, v24=transaction.v24,
-        v25=transaction.v25, v26=transaction.v26, v27=transaction.v27,
-        v28=transaction.v28,
-        amount=transaction.amount,
-        source="api"
+from api.services.group_commit import GroupCommitter
+from api.services.ml_model import FEATURE_COLUMNS
+from api.services.archiver import transaction_archiver
+from api.services.metrics import StageTimer
+from api.dependencies.database import AsyncSessionLocal
+from api.controllers.fraud_detection import (
+    process_transaction, process_transactions_batch, build_prediction_row
+)
+
+logger = logging.getLogger(__name__)
+
+_TRANSACTION_COLUMNS = ", ".join(FEATURE_COLUMNS + ["source"])
+_TRANSACTION_VALUES = ", ".join(f":{col}" for col in FEATURE_COLUMNS + ["source"])
+
+# Transaction and prediction in one statement and one round trip; RETURNING
+# hands back the generated id and server defaults, so no refresh is needed.
+INSERT_SCORED_TRANSACTION = text(f"""
+    WITH new_transaction AS (
+        INSERT INTO transactions ({_TRANSACTION_COLUMNS})
+        VALUES ({_TRANSACTION_VALUES})
+        RETURNING transaction_id, processed_at
+    ), new_prediction AS (
+        INSERT INTO fraud_predictions (
+            transaction_id, model_id, fraud_probability, prediction_threshold,
+            predicted_class, features_used, explanation
+        )
+        SELECT
+            transaction_id,
+            CAST(:model_id AS INTEGER),
+            CAST(:fraud_probability AS DOUBLE PRECISION),
+            CAST(:prediction_threshold AS DOUBLE PRECISION),
+            CAST(:predicted_class AS BOOLEAN),
+            CAST(:features_used AS JSONB),
+            CAST(:explanation AS JSONB)
+        FROM new_transaction
+        RETURNING prediction_id
     )
+    SELECT new_transaction.transaction_id, new_transaction.processed_at, new_prediction.prediction_id
+    FROM new_transaction LEFT JOIN new_prediction ON TRUE
+""")
+
+INSERT_TRANSACTION = text(f"""
+    INSERT INTO transactions ({_TRANSACTION_COLUMNS})
+    VALUES ({_TRANSACTION_VALUES})
+    RETURNING transaction_id, processed_at
+""")
+
+async def insert_scored_transaction(db: AsyncSession, transaction: TransactionCreate, prediction, source: str = "api"):
+    params = {**transaction.dict(), "source": source}
+    if prediction["model_id"] is None:
+        result = await db.execute(INSERT_TRANSACTION, params)
+        return result.one()
     
-    db.add(db_transaction)
-    db.commit()
-    db.refresh(db_transaction)
+    prediction_row = build_prediction_row(None, prediction)
+    params.update(
+        model_id=prediction_row["model_id"],
+        fraud_probability=prediction_row["fraud_probability"],
+        prediction_threshold=prediction_row["prediction_threshold"],
+        predicted_class=prediction_row["predicted_class"],
+        features_used=json.dumps(prediction_row["features_used"]),
+        explanation=json.dumps(prediction_row["explanation"])
+    )
+    result = await db.execute(INSERT_SCORED_TRANSACTION, params)
+    return result.one()
+
+async def insert_scored_transactions(db: AsyncSession, transactions: List[TransactionCreate], predictions, source: str = "api"):
+    # One multi-row INSERT ... RETURNING for the transactions (rows come back in
+    # parameter order) and one multi-row INSERT for their predictions
+    result = await db.execute(
+        insert(Transaction).returning(
+            Transaction.transaction_id, Transaction.processed_at, sort_by_parameter_order=True
+        ),
+        [{**transaction.dict(), "source": source} for transaction in transactions]
+    )
+    rows = result.all()
     
+    prediction_rows = [
+        build_prediction_row(row.transaction_id, prediction)
+        for row, prediction in zip(rows, predictions)
+        if prediction["model_id"] is not None
+    ]
+    if prediction_rows:
+        await db.execute(insert(FraudPrediction), prediction_rows)
+    return rows
+
+group_committer = None
+if settings.DB_GROUP_COMMIT_ENABLED:
+    group_committer = GroupCommitter(
+        session_factory=AsyncSessionLocal,
+        write_batch=insert_scored_transactions,
+        interval_ms=settings.DB_GROUP_COMMIT_INTERVAL_MS,
+        max_size=settings.DB_GROUP_COMMIT_MAX_SIZE
+    )
+
+def _to_record(transaction: TransactionCreate, row, source: str = "api"):
+    return {
+        **transaction.dict(),
+        "transaction_id": row.transaction_id,
+        "processed_at": row.processed_at,
+        "is_fraud": None,
+        "source": source
+    }
+
+def _archive_transactions(transaction_data_list):
+    # Buffered; only blocks when the archiver is applying backpressure
+    transaction_archiver.submit(transaction_data_list)
+
+def _publish_transactions(transaction_data_list, predictions=None):
+    # Only appends to the publisher's buffer; confirms arrive on its I/O thread.
+    # Stored predictions travel with the message so the queue worker does not score it again.
+    # Without an active model nothing was stored, so the worker scores and stores it.
+    for i, transaction_data in enumerate(transaction_data_list):
+        if predictions is not None and predictions[i]["model_id"] is not None:
+            transaction_data = {**transaction_data, "prediction": _prediction_message(predictions[i])}
+        rabbitmq_client.publish_transaction(transaction_data)
+
+def _prediction_message(prediction):
+    return {
+        "fraud_probability": prediction["fraud_probability"],
+        "is_fraud": prediction["is_fraud"],
+        "confidence": prediction["confidence"],
+        "prediction_threshold": prediction["prediction_threshold"],
+        "model_version": prediction["model_version"],
+        "model_id": prediction["model_id"]
+    }
+
+async def dispatch_side_effects(transaction_data_list, predictions, timer):
+    _publish_transactions(transaction_data_list, predictions)
+    timer.lap("publish")
+    # The archiver may block while applying backpressure, so keep it off the event loop
+    await asyncio.to_thread(_archive_transactions, transaction_data_list)
+    timer.lap("archive")
+
+def _finish(timer, **fields):
+    # Every request feeds the histograms; slow ones are also logged with their stage breakdown
+    timer.finish()
+    slow = settings.LOG_SLOW_TRANSACTION_MS > 0 and timer.total() * 1000 >= settings.LOG_SLOW_TRANSACTION_MS
+    if slow or logger.isEnabledFor(logging.DEBUG):
+        logger.log(
+            logging.WARNING if slow else logging.DEBUG,
+            f"Slow {timer.operation} request" if slow else f"{timer.operation} request",
+            extra={"operation": timer.operation, **fields, **timer.fields()}
+        )
+
+def _transaction_data(transaction: TransactionCreate, transaction_id: int, timestamp: str):
     transaction_data = transaction.dict()
-    transaction_data["transaction_id"] = db_transaction.transaction_id
-    transaction_data["timestamp"] = datetime.now().isoformat()
+    transaction_data["transaction_id"] = transaction_id
+    transaction_data["timestamp"] = timestamp
+    return transaction_data
+
+async def create_transaction(db: AsyncSession, transaction: TransactionCreate):
+    # Score first, then persist transaction and prediction together
+    timer = StageTimer("create")
+    prediction = await process_transaction(db, transaction)
+    timer.lap("score")
+    
+    if group_committer is not None:
+        row = await group_committer.submit(transaction, prediction)
+    else:
+        row = await insert_scored_transaction(db, transaction, prediction)
+        await db.commit()
+    timer.lap("db_write")
+    
+    prediction["transaction_id"] = row.transaction_id
+    prediction["prediction_time"] = datetime.now()
+    
+    await dispatch_side_effects([
+        _transaction_data(transaction, row.transaction_id, datetime.now().isoformat())
+    ], [prediction], timer)
+    _finish(timer, transaction_id=row.transaction_id, model_id=prediction["model_id"])
+    
+    return _to_record(transaction, row), prediction
+
+async def create_transactions_batch(db: AsyncSession, transactions: List[TransactionCreate]):
+    timer = StageTimer("batch")
+    predictions = await process_transactions_batch(db, transactions)
+    timer.lap("score")
+    
+    rows = await insert_scored_transactions(db, transactions, predictions)
+    await db.commit()
+    timer.lap("db_write")
     
-    minio_key = minio_client.store_transaction(transaction_data)
+    prediction_time = datetime.now()
+    for row, prediction in zip(rows, predictions):
+        prediction["transaction_id"] = row.transaction_id
+        prediction["prediction_time"] = prediction_time
     
-    rabbitmq_client.publish_transaction(transaction_data)
+    timestamp = prediction_time.isoformat()
+    await dispatch_side_effects([
+        _transaction_data(transaction, row.transaction_id, timestamp)
+        for transaction, row in zip(transactions, rows)
+    ], predictions, timer)
+    _finish(timer, rows=len(rows))
     
-    prediction = process_transaction(db, transaction)
+    return [_to_record(transaction, row) for transaction, row in zip(transactions, rows)], predictions
+
+async def enqueue_transaction(db: AsyncSession, transaction: TransactionCreate, callback_url: Optional[str] = None):
+    # Persist and hand off to the scoring workers; the client polls or receives a webhook
+    timer = StageTimer("enqueue")
+    result = await db.execute(INSERT_TRANSACTION, {**transaction.dict(), "source": "api"})
+    row = result.one()
+    await db.commit()
+    timer.lap("db_write")
+    
+    transaction_data = _transaction_data(transaction, row.transaction_id, datetime.now().isoformat())
+    message = {**transaction_data, "callback_url": callback_url} if callback_url else transaction_data
+    rabbitmq_client.publish_transaction(message)
+    timer.lap("publish")
+    await asyncio.to_thread(_archive_transactions, [transaction_data])
+    timer.lap("archive")
+    _finish(timer, transaction_id=row.transaction_id)
     
-    return db_transaction, prediction
+    return _to_record(transaction, row)
 
 def get_transaction(db: Session, transaction_id: int):
     return db.query(Transaction).filter(Transaction.transaction_id == transaction_id).first()
 
-def get_transactions(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Transaction).offset(skip).limit(limit).all()
\ No newline at end of file
+TRANSACTION_FIELDS = [column.name for column in Transaction.__table__.columns]
+
+def _transactions_query(filters: dict, fields: Optional[List[str]], after_id: Optional[int], limit: int):
+    """
+    Keyset query over transaction_id: each page starts strictly after the last
+    id of the previous one, so deep pages cost the same as the first. Only the
+    requested columns are selected, and rows come back as plain mappings
+    instead of ORM objects.
+    """
+    columns = [Transaction.__table__.c[name] for name in (fields or TRANSACTION_FIELDS)]
+    query = select(*columns).order_by(Transaction.transaction_id).limit(limit)
+    if after_id is not None:
+        query = query.where(Transaction.transaction_id > after_id)
+    if filters.get("source") is not None:
+        query = query.where(Transaction.source == filters["source"])
+    if filters.get("is_fraud") is not None:
+        query = query.where(Transaction.is_fraud == filters["is_fraud"])
+    if filters.get("processed_after") is not None:
+        query = query.where(Transaction.processed_at >= filters["processed_after"])
+    if filters.get("processed_before") is not None:
+        query = query.where(Transaction.processed_at < filters["processed_before"])
+    return query
+
+def get_transactions(db: Session, filters: dict, fields: Optional[List[str]] = None,
+                     after_id: Optional[int] = None, limit: int = 100, skip: int = 0):
+    """
+    One page of transactions and the id to continue after, or None on the last page.
+    """
+    # transaction_id is always selected: the next page is keyed on it
+    selected = fields if fields is None or "transaction_id" in fields else ["transaction_id"] + fields
+    # One extra row tells whether another page exists without a COUNT
+    query = _transactions_query(filters, selected, after_id, limit + 1)
+    if skip:
+        query = query.offset(skip)
+    rows = [dict(row) for row in db.execute(query).mappings()]
+
+    next_after_id = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after_id = rows[-1]["transaction_id"]
+    if selected is not fields:
+        for row in rows:
+            del row["transaction_id"]
+    return rows, next_after_id
+
+async def stream_transactions(filters: dict, fields: Optional[List[str]] = None,
+                              after_id: Optional[int] = None, limit: Optional[int] = None):
+    """
+    Yield matching transactions one page at a time for export.
+
+    Each page is a short keyset query in its own session, so an export of any
+    size holds one page in memory and never keeps a long transaction open.
+    """
+    selected = fields if fields is None or "transaction_id" in fields else ["transaction_id"] + fields
+    remaining = limit
+    while remaining is None or remaining > 0:
+        page_size = settings.TRANSACTIONS_STREAM_PAGE_SIZE
+        if remaining is not None:
+            page_size = min(page_size, remaining)
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(_transactions_query(filters, selected, after_id, page_size))
+            rows = [dict(row) for row in result.mappings()]
+        if not rows:
+            return
+        after_id = rows[-1]["transaction_id"]
+        if remaining is not None:
+            remaining -= len(rows)
+        for row in rows:
+            if selected is not fields:
+                del row["transaction_id"]
+            yield row
+        if len(rows) < page_size:
+            return
+
+def get_transaction_prediction(db: Session, transaction_id: int):
+    return db.query(FraudPrediction).filter(
+        FraudPrediction.transaction_id == transaction_id
+    ).order_by(FraudPrediction.prediction_id.desc()).first()
\ No newline at end of file
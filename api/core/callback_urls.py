@@ -0,0 +1,57 @@
+import ipaddress
+import socket
+from urllib.parse import urlsplit
+
+# Callback URLs are supplied by API clients but requested by the scoring
+# workers from inside the deployment, so they are checked twice: when the
+# transaction is submitted, and again right before each delivery, whose
+# connection then goes to exactly the address that was checked. Only public
+# addresses pass unless allow_private is set (for local development).
+
+class UnsafeCallbackURL(ValueError):
+    pass
+
+def parse_allowed_hosts(value):
+    # "hooks.example.com,.partner.example" -> exact host, or any subdomain for a leading dot
+    return tuple(host.strip().lower() for host in value.split(",") if host.strip())
+
+def _host_allowed(host, allowed_hosts):
+    return any(
+        host == allowed or (allowed.startswith(".") and host.endswith(allowed))
+        for allowed in allowed_hosts
+    )
+
+def resolve_callback_url(url, allowed_hosts=(), allow_private=False):
+    """
+    Check a callback URL and resolve its host.
+
+    Returns:
+        (parts, address): the urlsplit() result and the IP address to connect to
+
+    Raises:
+        UnsafeCallbackURL: if the URL is malformed, its host is not allowed, or
+        any address it resolves to is not public
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        raise UnsafeCallbackURL("callback_url must be an http or https URL")
+    if not parts.hostname or parts.username or parts.password:
+        raise UnsafeCallbackURL("callback_url must name a host and carry no credentials")
+    host = parts.hostname.lower()
+    if allowed_hosts and not _host_allowed(host, allowed_hosts):
+        raise UnsafeCallbackURL(f"callback_url host {host} is not allowed")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (ValueError, OSError) as e:
+        raise UnsafeCallbackURL(f"callback_url host {host} cannot be resolved: {e}")
+
+    addresses = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+    if not allow_private:
+        # Every record must be public, or the host could be pointed at an internal one
+        for address in addresses:
+            if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+                address = address.ipv4_mapped
+            if not address.is_global or address.is_multicast:
+                raise UnsafeCallbackURL(f"callback_url host {host} resolves to non-public address {address}")
+    return parts, str(addresses[0])
@@ -16,6 +16,7 @@ class Settings(BaseSettings):
     MINIO_ACCESS_KEY: str
     MINIO_SECRET_KEY: str
     MINIO_BUCKET: str
+    MINIO_TIMEOUT_SECONDS: float = 10.0
     
     RABBITMQ_HOST: str
     RABBITMQ_PORT: str
@@ -23,11 +24,81 @@ class Settings(BaseSettings):
     RABBITMQ_PASSWORD: str
     RABBITMQ_QUEUE_TRANSACTIONS: str
     RABBITMQ_QUEUE_PROCESSED: str
+    RABBITMQ_PUBLISH_BUFFER_SIZE: int = 10000
+    RABBITMQ_PUBLISH_MAX_IN_FLIGHT: int = 1000
+    RABBITMQ_RECONNECT_DELAY_SECONDS: float = 2.0
+    RABBITMQ_CLOSE_TIMEOUT_SECONDS: float = 10.0
+    RABBITMQ_QUEUE_DEAD_LETTER: Optional[str] = None
+    RABBITMQ_SPOOL_ENABLED: bool = True
+    RABBITMQ_SPOOL_DIR: str = "publish_spool"
+    RABBITMQ_SPOOL_SEGMENT_MESSAGES: int = 1000
+    
+    WORKER_PROCESSES: int = 0
+    WORKER_PREFETCH: int = 256
+    WORKER_BATCH_SIZE: int = 128
+    WORKER_BATCH_MAX_DELAY_MS: float = 50.0
+    WORKER_MAX_RETRIES: int = 3
+    WORKER_RETRY_DELAY_SECONDS: float = 1.0
+    WEBHOOK_WORKERS: int = 8
+    WEBHOOK_TIMEOUT_SECONDS: float = 5.0
+    WEBHOOK_MAX_ATTEMPTS: int = 3
+    WEBHOOK_BACKOFF_SECONDS: float = 0.5
+    WEBHOOK_ALLOWED_HOSTS: str = ""
+    WEBHOOK_ALLOW_PRIVATE_ADDRESSES: bool = False
+    
+    BATCH_MAX_SIZE: int = 1000
+    TRANSACTIONS_PAGE_MAX_SIZE: int = 1000
+    TRANSACTIONS_STREAM_PAGE_SIZE: int = 5000
+    ANALYTICS_MAX_BUCKETS: int = 1000
+    ROLLUP_REFRESH_INTERVAL_SECONDS: float = 10.0
+    ROLLUP_BATCH_ROWS: int = 50000
+    ROLLUP_SETTLE_SECONDS: float = 30.0
+    
+    STARTUP_TIMEOUT_SECONDS: float = 10.0
+    HEALTH_PROBE_TIMEOUT_SECONDS: float = 0.5
+    HEALTH_REQUIRE_STORAGE: bool = False
+    HEALTH_REQUIRE_QUEUE: bool = False
+    METRICS_ENABLED: bool = True
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text"
+    LOG_SLOW_TRANSACTION_MS: float = 250.0
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_PATH_PREFIX: str = "/transactions"
+    PROFILING_INTERVAL_MS: float = 5.0
+    PROFILING_MAX_CPU_FRACTION: float = 0.05
+    PROFILING_OUTPUT_DIR: str = "profiles"
+    PROFILING_UPLOAD: bool = False
+    
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_GROUP_COMMIT_ENABLED: bool = False
+    DB_GROUP_COMMIT_INTERVAL_MS: float = 5.0
+    DB_GROUP_COMMIT_MAX_SIZE: int = 256
+    ARCHIVE_FLUSH_INTERVAL_SECONDS: float = 60.0
+    ARCHIVE_FLUSH_MAX_RECORDS: int = 50000
+    ARCHIVE_MAX_BUFFERED_RECORDS: int = 200000
+    ARCHIVE_ENQUEUE_TIMEOUT_SECONDS: float = 5.0
+    ARCHIVE_SPOOL_DIR: str = "archive_spool"
+    ARCHIVE_UPLOAD_RETRY_SECONDS: float = 30.0
+    INFERENCE_WORKERS: int = 4
+    MODEL_CACHE_DIR: str = "model_cache"
+    MODEL_LOCAL_DIR: str = "machine_learning/ml_models/fraud_model"
+    MODEL_CACHE_KEEP: int = 3
+    MODEL_RELOAD_INTERVAL_SECONDS: float = 30.0
+    ACTIVE_MODEL_CACHE_TTL_SECONDS: float = 60.0
+    INFERENCE_BATCH_ENABLED: bool = True
+    INFERENCE_BATCH_MAX_SIZE: int = 64
+    INFERENCE_BATCH_MAX_DELAY_MS: float = 2.0
     
     @property
     def DATABASE_URL(self) -> str:
         return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
     
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -0,0 +1,44 @@
+import json
+import logging
+
+# Attributes every LogRecord has; anything else on a record came from extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line, with the fields passed through extra= at the top level
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_extra_fields(record)
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class KeyValueFormatter(logging.Formatter):
+    # The usual text line, followed by the extra= fields as key=value pairs
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+def configure_logging(level="INFO", fmt="text"):
+    # Leaves an already configured root logger (e.g. by a test runner) alone
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(KeyValueFormatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(level.upper())
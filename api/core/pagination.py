@@ -0,0 +1,32 @@
+import base64
+import hashlib
+import json
+
+# Continuation tokens for keyset pagination. A token carries the last key a
+# client has seen plus a fingerprint of the filters it was issued for, so it
+# cannot be replayed against a different query. Clients treat it as opaque.
+
+class InvalidCursor(ValueError):
+    pass
+
+def _fingerprint(filters: dict) -> str:
+    canonical = json.dumps(filters, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+
+def encode_cursor(after_id: int, filters: dict) -> str:
+    payload = json.dumps({"after": after_id, "filters": _fingerprint(filters)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, filters: dict) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        after_id = payload["after"]
+        fingerprint = payload["filters"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(after_id, int):
+        raise InvalidCursor("Malformed cursor")
+    if fingerprint != _fingerprint(filters):
+        raise InvalidCursor("Cursor was issued for different filters")
+    return after_id
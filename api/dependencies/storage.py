@@ -1,27 +1,55 @@
 from minio import Minio
 from minio.error import S3Error
 import io
+import os
+import gzip
 import json
+import certifi
+import urllib3
+import logging
 from datetime import datetime
 from api.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+def _minio(timeout, retries):
+    # MinIO's default client waits up to 5 minutes per request, which would stall
+    # the archiver for that long when the endpoint is unreachable
+    http_client = urllib3.PoolManager(
+        timeout=urllib3.Timeout(connect=timeout, read=timeout),
+        maxsize=10,
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=retries
+    )
+    return Minio(
+        endpoint=settings.MINIO_ENDPOINT.replace("http://", "").replace("https://", ""),
+        access_key=settings.MINIO_ACCESS_KEY,
+        secret_key=settings.MINIO_SECRET_KEY,
+        secure=settings.MINIO_ENDPOINT.startswith("https"),
+        http_client=http_client
+    )
+
 class MinioClient:
     def __init__(self):
-        self.client = Minio(
-            endpoint=settings.MINIO_ENDPOINT.replace("http://", "").replace("https://", ""),
-            access_key=settings.MINIO_ACCESS_KEY,
-            secret_key=settings.MINIO_SECRET_KEY,
-            secure=settings.MINIO_ENDPOINT.startswith("https")
+        self.client = _minio(
+            settings.MINIO_TIMEOUT_SECONDS,
+            urllib3.Retry(total=2, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
         )
-        
-        self._ensure_bucket_exists()
+        # Separate pool for health probes: no retries, and never queued behind uploads
+        self.probe_client = _minio(settings.HEALTH_PROBE_TIMEOUT_SECONDS, False)
     
-    def _ensure_bucket_exists(self):
+    def ensure_bucket(self):
+        # Called at startup rather than on import, so importing never waits on MinIO
         try:
             if not self.client.bucket_exists(settings.MINIO_BUCKET):
                 self.client.make_bucket(settings.MINIO_BUCKET)
         except S3Error as e:
-            print(f"Error creating bucket: {e}")
+            logger.error(f"Error creating bucket: {e}", extra={"bucket": settings.MINIO_BUCKET})
+    
+    def ping(self):
+        if not self.probe_client.bucket_exists(settings.MINIO_BUCKET):
+            raise RuntimeError(f"Bucket {settings.MINIO_BUCKET} does not exist")
     
     def store_transaction(self, transaction_data):
         transaction_id = transaction_data.get("transaction_id")
@@ -43,6 +71,29 @@ class MinioClient:
         
         return key
     
+    def store_bytes(self, key, data_bytes, content_type):
+        self.client.put_object(
+            bucket_name=settings.MINIO_BUCKET,
+            object_name=key,
+            data=io.BytesIO(data_bytes),
+            length=len(data_bytes),
+            content_type=content_type
+        )
+        return key
+    
+    def store_archive(self, key, data_bytes):
+        return self.store_bytes(key, data_bytes, "application/gzip")
+    
+    def get_archive(self, key):
+        response = self.client.get_object(settings.MINIO_BUCKET, key)
+        try:
+            data = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+        lines = gzip.decompress(data).decode('utf-8').splitlines()
+        return [json.loads(line) for line in lines if line]
+    
     def get_transaction(self, key):
         try:
             response = self.client.get_object(settings.MINIO_BUCKET, key)
@@ -51,7 +102,7 @@ class MinioClient:
             response.release_conn()
             return data
         except S3Error as e:
-            print(f"Error retrieving object: {e}")
+            logger.error(f"Error retrieving object: {e}", extra={"key": key})
             return None
 
 minio_client = MinioClient()
\ No newline at end of file
@@ -1,12 +1,29 @@
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from api.routers import transactions
+from sqlalchemy import text
+from api.routers import transactions, analytics
 from api.models.transaction import MLModel
-from api.dependencies.database import engine, Base, SessionLocal
+from api.dependencies.database import engine, async_engine, Base, SessionLocal
 from api.core.config import settings
+from api.core.log_config import configure_logging
 from api.services.ml_model import model_service
+from api.services.archiver import transaction_archiver
+from api.services.message_queue import rabbitmq_client
+from api.services.container import ServiceContainer
+from api.dependencies.storage import minio_client
+from api.controllers.transaction import group_committer
+from api.services.metrics import metrics
+from api.services.profiler import SamplingProfiler, ProfilingMiddleware
 
-Base.metadata.create_all(bind=engine)
+configure_logging(settings.LOG_LEVEL, settings.LOG_FORMAT)
+logger = logging.getLogger(__name__)
+
+def init_database():
+    Base.metadata.create_all(bind=engine)
+    init_ml_model()
 
 def init_ml_model():
     db = SessionLocal()
@@ -29,10 +46,138 @@ def init_ml_model():
     
     db.close()
 
+def start_model():
+    # The watcher runs even if the first load fails, so a model published later is picked up
+    model_service.start_watcher()
+    model_service.initialize()
+    logger.info("ML model loaded and ready for predictions", extra={
+        "model_version": model_service.artifact.version, "model_id": model_service.artifact.model_id
+    })
+
+async def probe_model():
+    artifact = model_service.artifact
+    if artifact is None:
+        raise RuntimeError("No model loaded")
+    # One row through the inference pool, so a saturated pool shows up as latency
+    await model_service.predict_batch_async([{}])
+    return {"version": artifact.version, "model_id": artifact.model_id}
+
+async def probe_database():
+    pool = async_engine.pool
+    detail = {"pool_size": pool.size(), "pool_checked_out": pool.checkedout(), "pool_overflow": pool.overflow()}
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+    return detail
+
+def probe_storage():
+    minio_client.ping()
+    return {"archive_spooling": transaction_archiver.storage_down()}
+
+def probe_queue():
+    rabbitmq_client.publisher.ping(settings.HEALTH_PROBE_TIMEOUT_SECONDS)
+    stats = rabbitmq_client.publisher.stats()
+    return {"buffered": stats["buffered"], "spooled": stats["spooled"]}
+
+async def stop_inference():
+    model_service.stop_watcher()
+    if model_service.batcher is not None:
+        await model_service.batcher.close()
+    if group_committer is not None:
+        await group_committer.close()
+    model_service.executor.shutdown(wait=False)
+
+services = ServiceContainer(timeout=settings.STARTUP_TIMEOUT_SECONDS)
+services.register("database", start=init_database, stop=async_engine.dispose, probe=probe_database)
+# Side-effect sinks buffer or spool while their backend is away, so by default an
+# outage only degrades readiness; the HEALTH_REQUIRE_* settings make it fail instead
+services.register(
+    "storage", start=minio_client.ensure_bucket, required=settings.HEALTH_REQUIRE_STORAGE, probe=probe_storage
+)
+services.register("archiver", start=transaction_archiver.start, stop=transaction_archiver.close, required=False)
+services.register(
+    "queue", start=rabbitmq_client.connect, stop=rabbitmq_client.close,
+    required=settings.HEALTH_REQUIRE_QUEUE, probe=probe_queue
+)
+# Stopped first: pending group commits still hand their side effects to the archiver and queue
+services.register(
+    "model", start=start_model, stop=stop_inference,
+    check=lambda: model_service.artifact is not None, probe=probe_model
+)
+
+def register_metrics():
+    # Read at scrape time only, from counters the services keep anyway
+    # The pool is looked up on every scrape: dispose() replaces it
+    publisher = rabbitmq_client.publisher
+    metrics.gauge_callback(
+        "fraud_db_pool_size", "Connections kept open by the async pool", lambda: async_engine.pool.size()
+    )
+    metrics.gauge_callback(
+        "fraud_db_pool_checked_out", "Async pool connections in use", lambda: async_engine.pool.checkedout()
+    )
+    metrics.gauge_callback(
+        "fraud_db_pool_overflow", "Async pool connections above pool_size",
+        lambda: max(0, async_engine.pool.overflow())
+    )
+    metrics.gauge_callback(
+        "fraud_model_loaded", "Whether a model artifact is loaded", lambda: model_service.artifact is not None
+    )
+    metrics.gauge_callback(
+        "fraud_inference_queue_depth", "Rows waiting for the micro-batcher",
+        lambda: model_service.batcher.stats()["queue_depth"] if model_service.batcher else None
+    )
+    metrics.histogram_callback(
+        "fraud_inference_batch_size", "Rows per micro-batch",
+        lambda: model_service.batcher.batch_size_histogram if model_service.batcher else None
+    )
+    metrics.histogram_callback(
+        "fraud_inference_batch_wait_seconds", "Time rows wait in the micro-batcher",
+        lambda: model_service.batcher.wait_time_histogram if model_service.batcher else None
+    )
+    for field, help in (
+        ("connected", "Whether the publisher is connected"),
+        ("buffered", "Messages waiting to be published"),
+        ("in_flight", "Published messages awaiting a confirm"),
+        ("spooled", "Messages spooled to disk")
+    ):
+        metrics.gauge_callback(f"fraud_publisher_{field}", help, lambda field=field: publisher.stats()[field])
+    metrics.gauge_callback(
+        "fraud_publisher_confirmed_total", "Messages confirmed by the broker",
+        lambda: publisher.confirmed_total, kind="counter"
+    )
+    metrics.gauge_callback(
+        "fraud_publisher_dropped_total", "Messages dropped on a full buffer",
+        lambda: publisher.dropped_total, kind="counter"
+    )
+    metrics.histogram_callback(
+        "fraud_publisher_confirm_seconds", "Time from publish() to the broker's confirm",
+        lambda: publisher.confirm_latency_histogram
+    )
+    metrics.gauge_callback(
+        "fraud_archive_buffered_records", "Transactions waiting to be archived",
+        lambda: transaction_archiver.stats()["buffered_records"]
+    )
+    metrics.gauge_callback(
+        "fraud_archive_spooled_records_total", "Transactions spooled to disk instead of uploaded",
+        lambda: transaction_archiver.records_spooled, kind="counter"
+    )
+    metrics.gauge_callback(
+        "fraud_archive_upload_failures_total", "Failed archive uploads",
+        lambda: transaction_archiver.upload_failures, kind="counter"
+    )
+
+register_metrics()
+
+@asynccontextmanager
+async def lifespan(app):
+    await services.start()
+    yield
+    await services.stop()
+
 app = FastAPI(
     title="Fraud Detection API",
     description="API for detecting fraudulent financial transactions",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -43,15 +188,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(transactions.router)
-
-@app.on_event("startup")
-async def startup_event():
-    init_ml_model()
+# Off by default: without PROFILING_ENABLED the middleware is not installed at all
+request_profiler = None
+if settings.PROFILING_ENABLED:
+    request_profiler = SamplingProfiler(
+        interval_ms=settings.PROFILING_INTERVAL_MS,
+        max_cpu_fraction=settings.PROFILING_MAX_CPU_FRACTION,
+        output_dir=settings.PROFILING_OUTPUT_DIR,
+        storage=minio_client if settings.PROFILING_UPLOAD else None
+    )
+    app.add_middleware(
+        ProfilingMiddleware,
+        profiler=request_profiler,
+        api_key=settings.API_KEY,
+        sample_rate=settings.PROFILING_SAMPLE_RATE,
+        path_prefix=settings.PROFILING_PATH_PREFIX
+    )
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    pass
+app.include_router(transactions.router)
+app.include_router(analytics.router)
 
 @app.get("/")
 async def root():
@@ -62,16 +217,49 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {
-        "status": "healthy",
-        "version": "1.0.0"
-    }
+    # Cheap: startup state and model presence only; /health/ready probes the dependencies
+    healthy = services.ready()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "healthy" if healthy else "unhealthy", "version": "1.0.0"}
+    )
 
-@app.on_event("startup")
-async def startup_event():
-    init_ml_model()
-    
-    if model_service.model is None:
-        print("WARNING: ML model could not be loaded! Predictions will fail!")
-    else:
-        print("ML model loaded successfully and ready for predictions")
\ No newline at end of file
+@app.get("/health/live")
+async def liveness():
+    # The process is up and serving requests; dependencies are not consulted
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    # Degraded still serves: scoring works and side effects are spooled locally
+    state, report = await services.health(settings.HEALTH_PROBE_TIMEOUT_SECONDS)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE if state == "not_ready" else status.HTTP_200_OK,
+        content={"status": state, "services": report}
+    )
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    if not metrics.enabled:
+        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"detail": "Metrics are disabled"})
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/inference")
+async def inference_metrics():
+    if model_service.batcher is None:
+        return {"batching_enabled": False}
+    return {"batching_enabled": True, **model_service.batcher.stats()}
+
+@app.get("/metrics/archive")
+async def archive_metrics():
+    return transaction_archiver.stats()
+
+@app.get("/metrics/publisher")
+async def publisher_metrics():
+    return rabbitmq_client.publisher.stats()
+
+@app.get("/metrics/profiler")
+async def profiler_metrics():
+    if request_profiler is None:
+        return {"profiling_enabled": False}
+    return {"profiling_enabled": True, **request_profiler.stats()}
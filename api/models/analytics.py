@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, BigInteger, Float, String, DateTime
+from sqlalchemy.sql import func
+from api.dependencies.database import Base
+
+class TransactionRollup(Base):
+    __tablename__ = "transaction_rollups"
+
+    # One row per (granularity, bucket, source, model); model_id 0 means not scored
+    granularity = Column(String(10), primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    source = Column(String(50), primary_key=True)
+    model_id = Column(Integer, primary_key=True)
+    transaction_count = Column(BigInteger, nullable=False, default=0)
+    fraud_count = Column(BigInteger, nullable=False, default=0)
+    total_amount = Column(Float, nullable=False, default=0.0)
+    fraud_amount = Column(Float, nullable=False, default=0.0)
+    scored_count = Column(BigInteger, nullable=False, default=0)
+    fraud_probability_sum = Column(Float, nullable=False, default=0.0)
+
+class RollupState(Base):
+    __tablename__ = "rollup_state"
+
+    name = Column(String(50), primary_key=True)
+    # Highest transaction_id already folded into the rollups
+    watermark = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, Boolean, String, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, Float, Boolean, String, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from api.dependencies.database import Base
@@ -42,6 +42,14 @@ class Transaction(Base):
     source = Column(String(50), default="api")
     
     predictions = relationship("FraudPrediction", back_populates="transaction")
+    
+    # Keyset pages filter on one column and walk transaction_id in order; processed_at
+    # grows with transaction_id, so a BRIN index covers time ranges at a tiny size
+    __table_args__ = (
+        Index("idx_transactions_fraud_id", "is_fraud", "transaction_id"),
+        Index("idx_transactions_source_id", "source", "transaction_id"),
+        Index("idx_transactions_processed_at", "processed_at", postgresql_using="brin"),
+    )
 
 class FraudPrediction(Base):
     __tablename__ = "fraud_predictions"
@@ -58,6 +66,11 @@ class FraudPrediction(Base):
     
     transaction = relationship("Transaction", back_populates="predictions")
     model = relationship("MLModel")
+    
+    # One prediction per transaction; redelivered queue messages rely on it to stay idempotent
+    __table_args__ = (
+        Index("idx_predictions_transaction", "transaction_id", unique=True),
+    )
 
 class MLModel(Base):
     __tablename__ = "ml_models"
@@ -67,4 +80,5 @@ class MLModel(Base):
     description = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     performance_metrics = Column(JSON)
-    active = Column(Boolean, default=False)
\ No newline at end of file
+    active = Column(Boolean, default=False)
+    version = Column(String(64), nullable=True)
\ No newline at end of file
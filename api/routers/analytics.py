@@ -0,0 +1,58 @@
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from api.schemas.transaction import (
+    TransactionAnalytics, TransactionAnalyticsBucket, TransactionAnalyticsGroup
+)
+from api.controllers.analytics import get_summary, get_timeseries, get_breakdown
+from api.dependencies.database import get_db
+from api.core.security import get_api_key
+from api.core.config import settings
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["analytics"],
+    dependencies=[Depends(get_api_key)]
+)
+
+GRANULARITY_PATTERN = "^(minute|hour|day)$"
+
+@router.get("/summary", response_model=TransactionAnalytics)
+def read_summary(
+    granularity: str = Query("day", pattern=GRANULARITY_PATTERN, description="Rollup level; start is rounded down to it"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    source: Optional[str] = None,
+    model_id: Optional[int] = Query(None, description="0 selects transactions that were never scored"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key)
+):
+    return get_summary(db, granularity, start, end, source, model_id)
+
+@router.get("/timeseries", response_model=List[TransactionAnalyticsBucket])
+def read_timeseries(
+    granularity: str = Query("hour", pattern=GRANULARITY_PATTERN),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    source: Optional[str] = None,
+    model_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, description="Most recent buckets to return"),
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key)
+):
+    limit = min(limit or settings.ANALYTICS_MAX_BUCKETS, settings.ANALYTICS_MAX_BUCKETS)
+    return get_timeseries(db, granularity, start, end, source, model_id, limit)
+
+@router.get("/breakdown", response_model=List[TransactionAnalyticsGroup])
+def read_breakdown(
+    by: str = Query("source", pattern="^(source|model_id)$"),
+    granularity: str = Query("day", pattern=GRANULARITY_PATTERN),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    source: Optional[str] = None,
+    model_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key)
+):
+    return get_breakdown(db, by, granularity, start, end, source, model_id)
@@ -1,10 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+import asyncio
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
-from api.schemas.transaction import TransactionCreate, TransactionResponse, TransactionWithPrediction
-from api.controllers.transaction import create_transaction, get_transaction, get_transactions
-from api.dependencies.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from api.schemas.transaction import (
+    TransactionCreate, TransactionResponse, TransactionWithPrediction,
+    TransactionBatchCreate, TransactionBatchResponse, TransactionAccepted
+)
+from api.schemas.prediction import PredictionResponse, PredictionStatus
+from api.controllers.transaction import (
+    create_transaction, create_transactions_batch, enqueue_transaction,
+    get_transaction, get_transactions, get_transaction_prediction,
+    stream_transactions, TRANSACTION_FIELDS
+)
+from api.dependencies.database import get_db, get_async_db
 from api.core.security import get_api_key
+from api.core.config import settings
+from api.core.pagination import InvalidCursor, encode_cursor, decode_cursor
+from api.core.callback_urls import UnsafeCallbackURL, parse_allowed_hosts, resolve_callback_url
+
+WEBHOOK_ALLOWED_HOSTS = parse_allowed_hosts(settings.WEBHOOK_ALLOWED_HOSTS)
 
 router = APIRouter(
     prefix="/transactions",
@@ -12,15 +30,39 @@ router = APIRouter(
     dependencies=[Depends(get_api_key)]
 )
 
-@router.post("/", response_model=TransactionWithPrediction)
-def create_new_transaction(
+@router.post(
+    "/",
+    response_model=TransactionWithPrediction,
+    responses={202: {"model": TransactionAccepted}}
+)
+async def create_new_transaction(
     transaction: TransactionCreate,
-    db: Session = Depends(get_db),
+    mode: str = Query("sync", pattern="^(sync|async)$"),
+    callback_url: Optional[str] = Query(None, pattern="^https?://"),
+    db: AsyncSession = Depends(get_async_db),
     api_key: str = Depends(get_api_key)
 ):
-    db_transaction, prediction = create_transaction(db, transaction)
+    if callback_url is not None:
+        # Rejected up front; the worker checks the address again before each delivery
+        try:
+            await asyncio.to_thread(
+                resolve_callback_url, callback_url, WEBHOOK_ALLOWED_HOSTS, settings.WEBHOOK_ALLOW_PRIVATE_ADDRESSES
+            )
+        except UnsafeCallbackURL as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    if mode == "async":
+        # Accept and enqueue; the scoring workers produce the prediction
+        db_transaction = await enqueue_transaction(db, transaction, callback_url)
+        accepted = TransactionAccepted(
+            transaction_id=db_transaction["transaction_id"],
+            status="queued",
+            prediction_url=f"{router.prefix}/{db_transaction['transaction_id']}/prediction"
+        )
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=accepted.dict())
+    
+    db_transaction, prediction = await create_transaction(db, transaction)
     
-    result = TransactionResponse.from_orm(db_transaction)
+    result = TransactionResponse(**db_transaction)
     response = TransactionWithPrediction(
         **result.dict(),
         prediction=prediction
@@ -28,6 +70,35 @@ def create_new_transaction(
     
     return response
 
+@router.post("/batch", response_model=TransactionBatchResponse)
+async def create_new_transactions_batch(
+    batch: TransactionBatchCreate,
+    db: AsyncSession = Depends(get_async_db),
+    api_key: str = Depends(get_api_key)
+):
+    if not batch.transactions:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Batch must contain at least one transaction"
+        )
+    if len(batch.transactions) > settings.BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch size {len(batch.transactions)} exceeds the limit of {settings.BATCH_MAX_SIZE}"
+        )
+    
+    db_transactions, predictions = await create_transactions_batch(db, batch.transactions)
+    
+    results = [
+        TransactionWithPrediction(
+            **TransactionResponse(**db_transaction).dict(),
+            prediction=prediction
+        )
+        for db_transaction, prediction in zip(db_transactions, predictions)
+    ]
+    
+    return TransactionBatchResponse(results=results)
+
 @router.get("/{transaction_id}", response_model=TransactionResponse)
 def read_transaction(
     transaction_id: int,
@@ -39,13 +110,92 @@ def read_transaction(
         raise HTTPException(status_code=404, detail="Transaction not found")
     return db_transaction
 
-@router.get("/", response_model=List[TransactionResponse])
+@router.get("/{transaction_id}/prediction", response_model=PredictionStatus)
+def read_transaction_prediction(
+    transaction_id: int,
+    response: Response,
+    db: Session = Depends(get_db),
+    api_key: str = Depends(get_api_key)
+):
+    prediction = get_transaction_prediction(db, transaction_id)
+    if prediction is None:
+        if get_transaction(db, transaction_id) is None:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        # Still queued for scoring
+        response.status_code = status.HTTP_202_ACCEPTED
+        return PredictionStatus(transaction_id=transaction_id, status="pending")
+    
+    return PredictionStatus(
+        transaction_id=transaction_id,
+        status="scored",
+        prediction=PredictionResponse(
+            transaction_id=transaction_id,
+            fraud_probability=prediction.fraud_probability,
+            is_fraud=prediction.predicted_class,
+            confidence=2 * abs(prediction.fraud_probability - 0.5),
+            prediction_time=prediction.prediction_time
+        )
+    )
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _parse_fields(fields: Optional[str]):
+    if not fields:
+        return None
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in TRANSACTION_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    return selected
+
+@router.get(
+    "/",
+    response_model=List[TransactionResponse],
+    responses={200: {"content": {"application/x-ndjson": {}}}}
+)
 def read_transactions(
-    skip: int = 0,
-    limit: int = 100,
+    limit: Optional[int] = Query(None, ge=1, description="Page size; with format=ndjson, the total rows to export"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    skip: int = Query(0, ge=0, deprecated=True, description="Offset paging; use cursor instead"),
+    source: Optional[str] = None,
+    is_fraud: Optional[bool] = None,
+    processed_after: Optional[datetime] = None,
+    processed_before: Optional[datetime] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. transaction_id,amount,is_fraud"),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
     db: Session = Depends(get_db),
     api_key: str = Depends(get_api_key)
 ):
+    filters = {
+        "source": source,
+        "is_fraud": is_fraud,
+        "processed_after": processed_after,
+        "processed_before": processed_before
+    }
+    selected = _parse_fields(fields)
+    try:
+        after_id = decode_cursor(cursor, filters) if cursor else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-    transactions = get_transactions(db, skip=skip, limit=limit)
-    return transactions
\ No newline at end of file
+    if format == "ndjson":
+        # Rows are written as they are fetched, so an export never sits in memory
+        async def lines():
+            async for row in stream_transactions(filters, selected, after_id, limit):
+                yield json.dumps(row, default=_json_default) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    page_size = min(limit or 100, settings.TRANSACTIONS_PAGE_MAX_SIZE)
+    rows, next_after_id = get_transactions(db, filters, selected, after_id, page_size, skip=skip)
+
+    # Rows are plain column mappings, serialized directly rather than through the response model
+    response = Response(content=json.dumps(rows, default=_json_default), media_type="application/json")
+    if next_after_id is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(next_after_id, filters)
+    return response
@@ -30,4 +30,9 @@ class PredictionResponse(BaseModel):
     prediction_time: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class PredictionStatus(BaseModel):
+    transaction_id: int
+    status: str
+    prediction: Optional[PredictionResponse] = None
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 from api.schemas.prediction import PredictionResponse
 
@@ -53,10 +53,29 @@ class TransactionResponse(TransactionInDB):
 class TransactionWithPrediction(TransactionResponse):
     prediction: Optional[PredictionResponse] = None
 
+class TransactionAccepted(BaseModel):
+    transaction_id: int
+    status: str
+    prediction_url: str
+
+class TransactionBatchCreate(BaseModel):
+    transactions: List[TransactionCreate]
+
+class TransactionBatchResponse(BaseModel):
+    results: List[TransactionWithPrediction]
+
 class TransactionAnalytics(BaseModel):
     total_transactions: int
     fraud_count: int
     fraud_rate: float
     average_transaction_amount: float
     total_amount: float
-    fraud_amount: float
\ No newline at end of file
+    fraud_amount: float
+    average_fraud_probability: Optional[float] = None
+
+class TransactionAnalyticsBucket(TransactionAnalytics):
+    bucket_start: datetime
+
+class TransactionAnalyticsGroup(TransactionAnalytics):
+    source: Optional[str] = None
+    model_id: Optional[int] = None
\ No newline at end of file
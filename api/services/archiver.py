@@ -0,0 +1,226 @@
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+import logging
+from datetime import datetime
+from api.core.config import settings
+from api.dependencies.storage import minio_client
+from api.services.metrics import stage_seconds
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "raw/transactions"
+
+def encode_archive(records):
+    # One JSON document per line, gzipped; readable with zcat or any JSONL reader
+    lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+    return gzip.compress(lines.encode("utf-8"), compresslevel=6)
+
+def archive_key(partition):
+    # Same date=YYYY-MM-DD partitions as the per-transaction objects; many rows per object
+    return f"{ARCHIVE_PREFIX}/date={partition}/part-{time.strftime('%H%M%S')}-{uuid.uuid4().hex[:12]}.jsonl.gz"
+
+class TransactionArchiver:
+    """
+    Write-behind archival of raw transactions to object storage.
+
+    submit() only appends to an in-memory buffer. A background thread flushes the
+    buffer as one compressed JSONL object per date partition, every
+    flush_interval seconds or as soon as flush_max_records are buffered.
+
+    The buffer is bounded: when it holds max_buffered_records, submit() blocks
+    for up to enqueue_timeout seconds waiting for a flush. Records that still do
+    not fit, and files whose upload fails, are written to spool_dir and uploaded
+    on a later flush, so archival never drops a transaction.
+
+    After a failed upload, storage is treated as down for upload_retry_interval
+    seconds: flushes go straight to the spool and submit() no longer waits for
+    room, so an unreachable object store costs neither the flusher nor the
+    request path any time.
+    """
+    def __init__(self, storage, flush_interval, flush_max_records, max_buffered_records,
+                 spool_dir, enqueue_timeout, upload_retry_interval=30.0):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.flush_max_records = flush_max_records
+        self.max_buffered_records = max_buffered_records
+        self.spool_dir = spool_dir
+        self.enqueue_timeout = enqueue_timeout
+        self.upload_retry_interval = upload_retry_interval
+        self._storage_down_until = 0.0
+
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._flusher = None
+
+        self.records_submitted = 0
+        self.records_archived = 0
+        self.records_spooled = 0
+        self.objects_written = 0
+        self.bytes_written = 0
+        self.producer_waits = 0
+        self.upload_failures = 0
+
+    def start(self):
+        with self._cond:
+            self._start_locked()
+
+    def _start_locked(self):
+        if self._flusher is None:
+            self._stopping = False
+            self._flusher = threading.Thread(target=self._run, name="transaction-archiver", daemon=True)
+            self._flusher.start()
+
+    def submit(self, records):
+        if not records:
+            return
+        partition = datetime.now().strftime("%Y-%m-%d")
+        entries = [(partition, record) for record in records]
+
+        with self._cond:
+            self._start_locked()
+            self.records_submitted += len(entries)
+
+            # Backpressure: wait for the flusher to make room rather than grow without bound
+            deadline = time.monotonic() + (0 if self.storage_down() else self.enqueue_timeout)
+            while self._buffer and len(self._buffer) + len(entries) > self.max_buffered_records:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.producer_waits += 1
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+            else:
+                self._buffer.extend(entries)
+                if len(self._buffer) >= self.flush_max_records:
+                    self._cond.notify_all()
+                return
+
+        logger.warning(f"Archive buffer full, spooling {len(entries)} transactions to disk")
+        self._write_partitions(entries, upload=False)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._buffer) >= self.flush_max_records,
+                    timeout=self.flush_interval
+                )
+                batch, self._buffer = self._buffer, []
+                stopping = self._stopping
+                # Wake producers blocked on a full buffer
+                self._cond.notify_all()
+
+            if batch:
+                self._write_partitions(batch, upload=not self.storage_down())
+            if not self.storage_down():
+                self._upload_spooled()
+
+            if stopping:
+                return
+
+    def _write_partitions(self, entries, upload=True):
+        partitions = {}
+        for partition, record in entries:
+            partitions.setdefault(partition, []).append(record)
+
+        for partition, records in partitions.items():
+            key = archive_key(partition)
+            data = encode_archive(records)
+            if upload:
+                started = time.perf_counter()
+                try:
+                    self.storage.store_archive(key, data)
+                    stage_seconds.observe(("archive", "upload"), time.perf_counter() - started)
+                    self.records_archived += len(records)
+                    self.objects_written += 1
+                    self.bytes_written += len(data)
+                    continue
+                except Exception as e:
+                    self.upload_failures += 1
+                    logger.error(f"Error archiving {len(records)} transactions to {key}: {e}")
+                    self._mark_storage_down()
+                    upload = False
+            self._spool(key, data)
+            self.records_spooled += len(records)
+
+    def _spool(self, key, data):
+        # Spool files mirror the object key, written to a dot-file first so a
+        # half-written file is never uploaded
+        path = os.path.join(self.spool_dir, *key.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _upload_spooled(self):
+        if not os.path.isdir(self.spool_dir):
+            return
+        for root, _, files in os.walk(self.spool_dir):
+            for name in files:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                key = os.path.relpath(path, self.spool_dir).replace(os.sep, "/")
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    self.storage.store_archive(key, data)
+                except Exception as e:
+                    logger.error(f"Spooled archive {key} not uploaded yet: {e}")
+                    self._mark_storage_down()
+                    return
+                os.remove(path)
+                self.objects_written += 1
+                self.bytes_written += len(data)
+
+    def storage_down(self):
+        return time.monotonic() < self._storage_down_until
+
+    def _mark_storage_down(self):
+        if not self.storage_down():
+            logger.warning(f"Object storage unavailable, spooling archives for {self.upload_retry_interval}s")
+        self._storage_down_until = time.monotonic() + self.upload_retry_interval
+
+    def close(self, timeout=30):
+        # Flush everything still buffered before shutdown
+        with self._cond:
+            if self._flusher is None:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+            flusher = self._flusher
+        flusher.join(timeout=timeout)
+        with self._cond:
+            self._flusher = None
+
+    def stats(self):
+        with self._cond:
+            buffered = len(self._buffer)
+        return {
+            "storage_available": not self.storage_down(),
+            "buffered_records": buffered,
+            "max_buffered_records": self.max_buffered_records,
+            "records_submitted": self.records_submitted,
+            "records_archived": self.records_archived,
+            "records_spooled": self.records_spooled,
+            "objects_written": self.objects_written,
+            "bytes_written": self.bytes_written,
+            "producer_waits": self.producer_waits,
+            "upload_failures": self.upload_failures
+        }
+
+transaction_archiver = TransactionArchiver(
+    storage=minio_client,
+    flush_interval=settings.ARCHIVE_FLUSH_INTERVAL_SECONDS,
+    flush_max_records=settings.ARCHIVE_FLUSH_MAX_RECORDS,
+    max_buffered_records=settings.ARCHIVE_MAX_BUFFERED_RECORDS,
+    spool_dir=settings.ARCHIVE_SPOOL_DIR,
+    enqueue_timeout=settings.ARCHIVE_ENQUEUE_TIMEOUT_SECONDS,
+    upload_retry_interval=settings.ARCHIVE_UPLOAD_RETRY_SECONDS
+)
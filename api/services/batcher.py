@@ -0,0 +1,175 @@
+import asyncio
+import bisect
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Histogram:
+    # Cumulative bucket counts in the same shape Prometheus uses, so they can be scraped as-is
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        buckets = {}
+        running = 0
+        for bound, count in zip(self.bounds + ["+Inf"], self.counts):
+            running += count
+            buckets[str(bound)] = running
+        return {"buckets": buckets, "count": self.count, "sum": self.sum}
+
+async def collect_batch(queue, max_size, max_delay):
+    """
+    Wait for one item, then keep taking items until max_size is reached or
+    max_delay seconds have passed since the first one was enqueued.
+
+    Queue items are tuples whose last element is the perf_counter() enqueue time.
+    The queue must be unbounded.
+    """
+    first = await queue.get()
+    batch = [first]
+    deadline = first[-1] + max_delay
+
+    try:
+        while len(batch) < max_size:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+    except asyncio.CancelledError:
+        # Hand the items back, so whoever drains the queue after cancelling still sees them
+        for item in batch:
+            queue.put_nowait(item)
+        raise
+
+    return batch
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-row predictions into vectorized batches.
+
+    A batch is dispatched when it reaches max_batch_size rows or when the oldest
+    queued request has waited max_delay_ms, whichever comes first. Each caller
+    receives its own result through a future.
+    """
+    def __init__(self, predict_batch, executor, max_batch_size, max_delay_ms, max_concurrent_batches):
+        self.predict_batch = predict_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000.0
+        self.max_concurrent_batches = max_concurrent_batches
+
+        self._queue = None
+        self._worker = None
+        self._batch_slots = None
+        # Scoring tasks in flight; the loop only keeps weak references to tasks
+        self._scoring = set()
+
+        self.batch_size_histogram = Histogram(
+            [2 ** i for i in range(max_batch_size.bit_length()) if 2 ** i <= max_batch_size]
+        )
+        self.wait_time_histogram = Histogram([0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1])
+        self.batches_total = 0
+        self.rows_total = 0
+
+    def _ensure_started(self):
+        if self._worker is not None and not self._worker.done():
+            return
+        loop = asyncio.get_running_loop()
+        # A restarted worker carries over what is already queued on the same
+        # loop; items left from another (stopped) loop can never be served
+        if self._queue is None or self._worker is None or self._worker.get_loop() is not loop:
+            self._fail_queued(RuntimeError("Inference batcher was restarted"))
+            self._queue = asyncio.Queue()
+            self._batch_slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._worker = loop.create_task(self._run())
+
+    def _fail_queued(self, error):
+        while self._queue is not None and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done() and not future.get_loop().is_closed():
+                future.set_exception(error)
+
+    async def submit(self, features):
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((features, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await collect_batch(self._queue, self.max_batch_size, self.max_delay)
+
+            dispatched_at = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                self.wait_time_histogram.observe(dispatched_at - enqueued_at)
+            self.batch_size_histogram.observe(len(batch))
+            self.batches_total += 1
+            self.rows_total += len(batch)
+
+            # Keep collecting the next batch while this one is scored, bounded by the executor size
+            try:
+                await self._batch_slots.acquire()
+            except asyncio.CancelledError:
+                for item in batch:
+                    self._queue.put_nowait(item)
+                raise
+            task = loop.create_task(self._score(batch))
+            self._scoring.add(task)
+            task.add_done_callback(self._scoring.discard)
+
+    async def _score(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self.predict_batch, [features for features, _, _ in batch]
+            )
+        except Exception as e:
+            logger.error(f"Error scoring batch of {len(batch)}: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._batch_slots.release()
+
+    async def close(self):
+        # Finish the batches being scored; requests still queued are failed
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._fail_queued(RuntimeError("Inference batcher was stopped"))
+        if self._scoring:
+            await asyncio.gather(*self._scoring, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches_total": self.batches_total,
+            "rows_total": self.rows_total,
+            "max_batch_size": self.max_batch_size,
+            "max_delay_ms": self.max_delay * 1000.0,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "wait_seconds": self.wait_time_histogram.snapshot()
+        }
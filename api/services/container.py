@@ -0,0 +1,171 @@
+import asyncio
+import inspect
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ServiceContainer:
+    """
+    Starts and stops the API's long-lived services from the app lifespan.
+
+    Services start concurrently, each in a worker thread bounded by
+    STARTUP_TIMEOUT_SECONDS. A service that times out keeps starting in the
+    background and is recorded when it finishes, so one slow dependency delays
+    neither startup nor the others. Readiness is derived from the required
+    services, or from their own check functions when they have one: the model
+    can still arrive later through the hot-reload watcher.
+
+    Services may also have a probe, run by health() on every readiness check
+    to measure the dependency itself. At most one probe per service is in
+    flight; a probe slower than the timeout counts as down and is shared by
+    the checks that arrive while it is still running. A service whose start
+    failed is started again once its probe succeeds.
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.services = {}
+        self._lock = threading.Lock()
+        self._probes = {}
+        self._restarts = {}
+
+    def register(self, name, start=None, stop=None, required=True, check=None, probe=None):
+        self.services[name] = {
+            "start": start,
+            "stop": stop,
+            "required": required,
+            "check": check,
+            "probe": probe,
+            "status": "pending",
+            "seconds": None,
+            "error": None
+        }
+
+    def _run_start(self, name):
+        service = self.services[name]
+        started = time.perf_counter()
+        try:
+            service["start"]()
+        except Exception as e:
+            status, error = "failed", str(e)
+        else:
+            status, error = "ready", None
+        with self._lock:
+            service.update(status=status, error=error, seconds=time.perf_counter() - started)
+        if error:
+            logger.error(f"Service {name} failed to start: {error}")
+
+    async def start(self):
+        started = time.perf_counter()
+
+        async def start_one(name):
+            if self.services[name]["start"] is None:
+                self.services[name]["status"] = "ready"
+                return
+            try:
+                await asyncio.wait_for(asyncio.to_thread(self._run_start, name), self.timeout)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    if self.services[name]["status"] == "pending":
+                        self.services[name]["status"] = "starting"
+                logger.warning(f"Service {name} not ready after {self.timeout}s, continuing in the background")
+
+        await asyncio.gather(*(start_one(name) for name in self.services))
+        self.startup_seconds = time.perf_counter() - started
+        logger.info(f"Services started in {self.startup_seconds:.2f}s: {self.status()}")
+
+    async def stop(self):
+        # Reverse registration order, so services stop before what they depend on
+        for name in reversed(list(self.services)):
+            stop = self.services[name]["stop"]
+            if stop is None:
+                continue
+            try:
+                if inspect.iscoroutinefunction(stop):
+                    await stop()
+                else:
+                    await asyncio.to_thread(stop)
+            except Exception as e:
+                logger.error(f"Error stopping service {name}: {e}")
+
+    def is_ready(self, name):
+        service = self.services[name]
+        if service["check"] is not None:
+            return bool(service["check"]())
+        return service["status"] == "ready"
+
+    def ready(self):
+        return all(self.is_ready(name) for name, service in self.services.items() if service["required"])
+
+    async def _timed_probe(self, probe):
+        started = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(probe):
+                detail = await probe()
+            else:
+                detail = await asyncio.to_thread(probe)
+            error = None
+        except Exception as e:
+            detail, error = None, str(e) or type(e).__name__
+        return time.perf_counter() - started, detail, error
+
+    async def _probe(self, name, timeout):
+        task = self._probes.get(name)
+        if task is None or task.done():
+            task = self._probes[name] = asyncio.ensure_future(self._timed_probe(self.services[name]["probe"]))
+        try:
+            seconds, detail, error = await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            return {"up": False, "latency_ms": None, "error": f"No response within {timeout}s"}
+        result = {"up": error is None, "latency_ms": round(seconds * 1000, 3), "error": error}
+        if detail:
+            result.update(detail)
+        return result
+
+    async def health(self, timeout):
+        """
+        Probe every dependency concurrently.
+
+        Returns:
+            ("ready" | "degraded" | "not_ready", per-service status with probe results)
+        """
+        names = [name for name, service in self.services.items() if service["probe"] is not None]
+        probes = dict(zip(names, await asyncio.gather(*(self._probe(name, timeout) for name in names))))
+        for name, probe in probes.items():
+            if probe["up"]:
+                self._restart_if_failed(name)
+        report = self.status()
+        state = "ready"
+        for name, service in report.items():
+            if name in probes:
+                service["probe"] = probes[name]
+                service["ready"] = service["ready"] and probes[name]["up"]
+            if not service["ready"]:
+                if service["required"]:
+                    state = "not_ready"
+                elif state == "ready":
+                    state = "degraded"
+        return state, report
+
+    def _restart_if_failed(self, name):
+        with self._lock:
+            service = self.services[name]
+            if service["status"] != "failed" or service["start"] is None:
+                return
+            service["status"] = "starting"
+        logger.info(f"Service {name} is reachable again, restarting it")
+        self._restarts[name] = asyncio.ensure_future(asyncio.to_thread(self._run_start, name))
+
+    def status(self):
+        with self._lock:
+            return {
+                name: {
+                    "status": service["status"],
+                    "ready": self.is_ready(name),
+                    "required": service["required"],
+                    "startup_seconds": service["seconds"],
+                    "error": service["error"]
+                }
+                for name, service in self.services.items()
+            }
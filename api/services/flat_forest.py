@@ -0,0 +1,251 @@
+import numpy as np
+
+FLAT_FOREST_ARRAYS = ("feature", "threshold", "left", "value", "roots")
+
+# How per-tree leaf values combine into a fraud probability
+OUTPUT_MEAN = "mean"            # random forest: average of class-1 probabilities
+OUTPUT_LOGIT_SUM = "logit_sum"  # boosted trees: sigmoid(base_score + sum of leaf values)
+
+class FlatForest:
+    """
+    A tree ensemble flattened into contiguous NumPy arrays.
+
+    All trees share one node table. Nodes are laid out so that the two children
+    of node i are adjacent: a row goes to left[i] when x[feature[i]] <= threshold[i]
+    and to left[i] + 1 otherwise. Leaves point to themselves with an infinite
+    threshold, so every row can be advanced through every tree in lock-step with
+    plain array indexing, without joblib or per-tree Python objects. value[i]
+    holds the class-1 probability of node i, and the forest output is the mean
+    over trees. Boosted ensembles (output="logit_sum") instead hold additive
+    log-odds in value and are scored as sigmoid(base_score + sum over trees).
+
+    A fused forest has a StandardScaler folded into its thresholds and scores
+    raw, unscaled feature vectors directly.
+    """
+    def __init__(self, feature, threshold, left, value, roots, max_depth, fused=False,
+                 output=OUTPUT_MEAN, base_score=0.0):
+        if output not in (OUTPUT_MEAN, OUTPUT_LOGIT_SUM):
+            raise ValueError(f"Unknown forest output: {output}")
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.intp)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        self.fused = bool(fused)
+        self.output = output
+        self.base_score = float(base_score)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        # Works for any fitted binary forest of sklearn decision trees (estimators_[i].tree_)
+        def class_one_fraction(tree, order):
+            counts = tree.value[order, 0, :]
+            totals = counts.sum(axis=1)
+            totals[totals == 0.0] = 1.0
+            return counts[:, 1] / totals
+
+        return cls._flatten([estimator.tree_ for estimator in forest.estimators_], class_one_fraction)
+
+    @classmethod
+    def from_sklearn_boosting(cls, model, base_score=0.0):
+        """
+        Flatten a fitted GradientBoostingRegressor that predicts log-odds.
+
+        The learning rate is folded into the leaf values. base_score must be the
+        constant the model starts from (use init="zero" and pass the offset).
+        """
+        def scaled_value(tree, order):
+            return tree.value[order, 0, 0] * model.learning_rate
+
+        return cls._flatten(
+            [estimator.tree_ for estimator in model.estimators_[:, 0]], scaled_value,
+            output=OUTPUT_LOGIT_SUM, base_score=base_score
+        )
+
+    @classmethod
+    def _flatten(cls, trees, node_values, **kwargs):
+        features, thresholds, lefts, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for tree in trees:
+            # Breadth-first renumbering puts every pair of siblings next to each other
+            order = [0]
+            for node in order:
+                if tree.children_left[node] != -1:
+                    order.append(tree.children_left[node])
+                    order.append(tree.children_right[node])
+            order = np.array(order)
+            new_ids = np.empty(tree.node_count, dtype=np.intp)
+            new_ids[order] = np.arange(tree.node_count)
+
+            is_leaf = tree.children_left[order] == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature[order]))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold[order]))
+            lefts.append(np.where(is_leaf, np.arange(tree.node_count), new_ids[tree.children_left[order]]) + offset)
+            values.append(node_values(tree, order))
+            roots.append(offset)
+
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            value=np.concatenate(values),
+            roots=np.array(roots),
+            max_depth=max_depth,
+            **kwargs
+        )
+
+    def compact(self, trees=None, max_depth=None):
+        """
+        Return a forest of the given trees (indices, default all) with every
+        tree cut at max_depth. Internal nodes at the cut become leaves that keep
+        their own value, which for sklearn trees is the prediction of the
+        samples that reached them. Unreachable nodes are dropped.
+        """
+        trees = range(self.n_trees) if trees is None else trees
+        features, thresholds, lefts, values, roots = [], [], [], [], []
+        offset = 0
+        depth_reached = 0
+
+        for tree in trees:
+            order, depths = [int(self.roots[tree])], [0]
+            for node, depth in zip(order, depths):
+                if self.left[node] != node and (max_depth is None or depth < max_depth):
+                    order += [int(self.left[node]), int(self.left[node]) + 1]
+                    depths += [depth + 1, depth + 1]
+            order = np.array(order)
+            new_ids = np.zeros(self.n_nodes, dtype=np.intp)
+            new_ids[order] = np.arange(len(order))
+
+            is_leaf = self.left[order] == order
+            if max_depth is not None:
+                is_leaf |= np.array(depths) >= max_depth
+
+            features.append(np.where(is_leaf, 0, self.feature[order]))
+            thresholds.append(np.where(is_leaf, np.inf, self.threshold[order]))
+            lefts.append(np.where(is_leaf, np.arange(len(order)), new_ids[self.left[order]]) + offset)
+            values.append(self.value[order])
+            roots.append(offset)
+
+            offset += len(order)
+            depth_reached = max(depth_reached, max(depths))
+
+        return FlatForest(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            value=np.concatenate(values),
+            roots=np.array(roots),
+            max_depth=depth_reached,
+            fused=self.fused,
+            output=self.output,
+            base_score=self.base_score
+        )
+
+    def fuse_scaler(self, mean, scale):
+        """
+        Fold a StandardScaler into the split thresholds.
+
+        (x - mean) / scale <= t is equivalent to x <= t * scale + mean for scale > 0,
+        so the returned forest gives the same splits on raw features.
+        """
+        if self.fused:
+            raise ValueError("Forest already has a scaler fused into it")
+        mean = np.asarray(mean, dtype=np.float64)
+        scale = np.asarray(scale, dtype=np.float64)
+        if np.any(scale <= 0):
+            raise ValueError("Scaler scale must be strictly positive to fuse")
+
+        # Leaves keep their infinite threshold
+        threshold = self.threshold * scale[self.feature] + mean[self.feature]
+        return FlatForest(
+            feature=self.feature,
+            threshold=threshold,
+            left=self.left,
+            value=self.value,
+            roots=self.roots,
+            max_depth=self.max_depth,
+            fused=True,
+            output=self.output,
+            base_score=self.base_score
+        )
+
+    def predict_tree_values(self, X):
+        # Leaf value reached in every tree, shape (n_rows, n_trees).
+        # sklearn evaluates trees on float32 input; match it so split decisions agree exactly.
+        # Fused thresholds live in raw feature space, where float32 would lose precision.
+        X = np.asarray(X, dtype=np.float64 if self.fused else np.float32)
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_rows) * n_features)[:, None]
+        nodes = np.repeat(self.roots[None, :], n_rows, axis=0)
+
+        for _ in range(self.max_depth):
+            go_right = flat_X[row_offsets + self.feature[nodes]] > self.threshold[nodes]
+            nodes = self.left[nodes] + go_right
+
+        return self.value[nodes]
+
+    def predict_fraud_proba(self, X):
+        return self.combine(self.predict_tree_values(X))
+
+    def combine(self, tree_values):
+        if self.output == OUTPUT_LOGIT_SUM:
+            return 1.0 / (1.0 + np.exp(-(self.base_score + tree_values.sum(axis=1))))
+        return tree_values.mean(axis=1)
+
+    def predict_proba(self, X):
+        fraud_proba = self.predict_fraud_proba(X)
+        return np.column_stack([1.0 - fraud_proba, fraud_proba])
+
+def verify_flat_forest(forest, flat_forest, X, atol=1e-9):
+    """
+    Check that a flattened forest reproduces forest.predict_proba on X.
+
+    Returns the maximum absolute difference in fraud probability and raises
+    ValueError if it exceeds atol.
+    """
+    expected = forest.predict_proba(X)[:, 1]
+    actual = flat_forest.predict_fraud_proba(X)
+    max_diff = float(np.max(np.abs(expected - actual))) if len(expected) else 0.0
+    if max_diff > atol:
+        raise ValueError(f"Flat forest diverges from sklearn: max |diff| = {max_diff:.3e} > {atol:.1e}")
+    return max_diff
+
+def verify_fused_forest(forest, scaler, fused_forest, X_raw, atol=1e-9, max_mismatch_rate=1e-3):
+    """
+    Check a fused forest on raw features against scaler.transform + forest.predict_proba.
+
+    Rows whose scaled value lands within float32 rounding of a split threshold
+    can take a different branch, so a small fraction of mismatches is tolerated.
+    Returns a dict of statistics and raises ValueError if the mismatch rate
+    exceeds max_mismatch_rate.
+    """
+    X_raw = np.asarray(X_raw, dtype=np.float64)
+    expected = forest.predict_proba(scaler.transform(X_raw))[:, 1]
+    actual = fused_forest.predict_fraud_proba(X_raw)
+    diff = np.abs(expected - actual)
+    stats = {
+        "rows": int(len(diff)),
+        "mismatched_rows": int(np.sum(diff > atol)),
+        "mismatch_rate": float(np.mean(diff > atol)) if len(diff) else 0.0,
+        "max_abs_diff": float(diff.max()) if len(diff) else 0.0,
+        "label_flips": int(np.sum((expected > 0.5) != (actual > 0.5)))
+    }
+    if stats["mismatch_rate"] > max_mismatch_rate:
+        raise ValueError(f"Fused forest diverges from scaler + model: {stats}")
+    return stats
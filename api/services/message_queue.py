@@ -1,69 +1,545 @@
 import pika
+import os
 import json
+import uuid
+import fcntl
+import time
+import threading
+import logging
+from collections import deque
 from api.core.config import settings
+from api.services.batcher import Histogram
 
-class RabbitMQClient:
-    def __init__(self):
-        self.connection = None
-        self.channel = None
-        self.connect()
-    
-    def connect(self):
-        try:
-            credentials = pika.PlainCredentials(
-                settings.RABBITMQ_USER, 
-                settings.RABBITMQ_PASSWORD
-            )
-            
-            parameters = pika.ConnectionParameters(
-                host=settings.RABBITMQ_HOST,
-                port=int(settings.RABBITMQ_PORT),
-                credentials=credentials,
-                heartbeat=30,
-                blocked_connection_timeout=300
-            )
-            
-            self.connection = pika.BlockingConnection(parameters)
-            self.channel = self.connection.channel()
-            
-            self.channel.queue_declare(queue=settings.RABBITMQ_QUEUE_TRANSACTIONS)
-            self.channel.queue_declare(queue=settings.RABBITMQ_QUEUE_PROCESSED)
-            
-            print("Connected to RabbitMQ")
-        except Exception as e:
-            print(f"Error connecting to RabbitMQ: {e}")
-    
-    def publish_transaction(self, transaction_data):
-        try:
-            if self.connection is None or self.connection.is_closed:
-                self.connect()
-                
-            if self.connection is None or self.channel is None:
-                print("RabbitMQ connection unavailable, skipping message publish")
+logger = logging.getLogger(__name__)
+
+def default_connection_factory(on_open, on_open_error, on_close):
+    credentials = pika.PlainCredentials(
+        settings.RABBITMQ_USER,
+        settings.RABBITMQ_PASSWORD
+    )
+
+    parameters = pika.ConnectionParameters(
+        host=settings.RABBITMQ_HOST,
+        port=int(settings.RABBITMQ_PORT),
+        credentials=credentials,
+        heartbeat=30,
+        blocked_connection_timeout=300
+    )
+
+    return pika.SelectConnection(
+        parameters,
+        on_open_callback=on_open,
+        on_open_error_callback=on_open_error,
+        on_close_callback=on_close
+    )
+
+class MessageSpool:
+    """
+    Disk overflow for the publisher, as numbered JSON Lines segments.
+
+    Each process spools to its own directory under the spool directory,
+    <pid>-<uuid>, and holds an flock on its owner.lock for as long as it
+    runs. append() writes to the newest segment and starts a new one every
+    segment_messages messages. pop_segment() reads back the oldest segment and
+    deletes it; from then on its messages are only held in memory, like any
+    other buffered message.
+
+    The directory is created by open(), or on first use. Segments left by processes that
+    are gone (their lock can be taken) are then moved into it with os.rename
+    and replayed. Directories of live processes are never touched.
+    """
+    LOCK_NAME = "owner.lock"
+
+    def __init__(self, directory, segment_messages=1000):
+        self.root = directory
+        self.segment_messages = segment_messages
+        self.directory = None
+        self._reset()
+        # A forked child must not write to its parent's directory
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_messages = 0
+        self._segments = deque()
+        self._messages = 0
+        self._owner = None
+
+    def _open(self):
+        # Lock held; the directory is only created in the process that uses the spool
+        if self._owner is not None:
+            return
+        name = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self.directory = os.path.join(self.root, name)
+        # Locked before it becomes visible under its final name, so it is never adopted
+        staging = os.path.join(self.root, f".{name}")
+        os.makedirs(staging)
+        self._owner = open(os.path.join(staging, self.LOCK_NAME), "w")
+        fcntl.flock(self._owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(staging, self.directory)
+        self._adopt_orphans()
+
+    def _adopt_orphans(self):
+        for name in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, name)
+            if name.startswith(".") or path == self.directory or not os.path.isdir(path):
+                continue
+            try:
+                owner = open(os.path.join(path, self.LOCK_NAME), "r+")
+            except FileNotFoundError:
+                # Being removed by another process that adopted it
+                continue
+            with owner:
+                try:
+                    fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                try:
+                    segments = sorted(entry for entry in os.listdir(path) if entry.endswith(".jsonl"))
+                except FileNotFoundError:
+                    continue
+                for segment in segments:
+                    self._adopt(os.path.join(path, segment), segment)
+                if segments:
+                    logger.warning(f"Adopted {len(segments)} spooled segments from {path}")
+                try:
+                    os.remove(os.path.join(path, self.LOCK_NAME))
+                    os.rmdir(path)
+                except OSError as e:
+                    logger.warning(f"Could not remove spool directory {path}: {e}")
+        # Replay in the order the messages were spooled
+        self._segments = deque(sorted(self._segments, key=os.path.basename))
+
+    def _adopt(self, source, name):
+        stamp = int(name[:-len(".jsonl")])
+        target = os.path.join(self.directory, name)
+        # Only this process writes here, so checking first cannot race
+        while os.path.exists(target):
+            stamp += 1
+            target = os.path.join(self.directory, f"{stamp:020d}.jsonl")
+        os.rename(source, target)
+        with open(target, encoding="utf-8") as f:
+            self._messages += sum(1 for _ in f)
+        self._segments.append(target)
+
+    def open(self):
+        with self._lock:
+            self._open()
+
+    def __len__(self):
+        return self._messages
+
+    def append(self, routing_key, body):
+        line = json.dumps({"routing_key": routing_key, "body": body}) + "\n"
+        with self._lock:
+            self._open()
+            if self._file is None:
+                path = os.path.join(self.directory, f"{time.time_ns():020d}.jsonl")
+                self._file = open(path, "a", encoding="utf-8")
+                self._file_messages = 0
+                self._segments.append(path)
+            self._file.write(line)
+            self._file.flush()
+            self._file_messages += 1
+            self._messages += 1
+            if self._file_messages >= self.segment_messages:
+                self._close_file()
+
+    def pop_segment(self):
+        with self._lock:
+            self._open()
+            if not self._segments:
+                return []
+            path = self._segments.popleft()
+            if self._file is not None and self._file.name == path:
+                self._close_file()
+            messages = []
+            lines = 0
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        message = json.loads(line)
+                    except ValueError:
+                        # Torn last line from a crash mid-write
+                        continue
+                    messages.append((message["routing_key"], message["body"]))
+            os.remove(path)
+            self._messages = self._messages - lines if self._segments else 0
+            return messages
+
+    def _close_file(self):
+        self._file.close()
+        self._file = None
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._close_file()
+            if self._owner is None:
+                return
+            if not self._segments:
+                os.remove(os.path.join(self.directory, self.LOCK_NAME))
+                os.rmdir(self.directory)
+            # Releasing the lock leaves any remaining segments to the next process
+            self._owner.close()
+            self._owner = None
+
+class RabbitMQPublisher:
+    """
+    Confirmed publishing from any thread through one dedicated I/O thread.
+
+    Only the I/O thread touches the pika connection. publish() appends to a
+    bounded buffer and wakes the I/O thread, which publishes everything
+    buffered on a channel in confirm mode. Messages stay tracked by delivery
+    tag until the broker acks them; the broker acks many tags at once
+    (multiple=True), so one confirm frame usually covers a whole batch.
+    Nacked messages and messages unconfirmed when the connection drops go back
+    to the front of the buffer and are republished after reconnecting.
+
+    With a spool, messages that do not fit in the buffer (e.g. while the broker
+    is down) go to disk instead of being dropped, and so does everything
+    published after them until the I/O thread has read the spool back.
+    Messages still buffered or unconfirmed when close() gives up waiting are
+    spooled too, for the next process to publish.
+
+    connection_factory(on_open, on_open_error, on_close) must return an object
+    with pika's SelectConnection interface, so a stand-in broker can be used.
+    """
+    def __init__(self, queues, connection_factory=default_connection_factory,
+                 max_buffered=10000, max_in_flight=1000, reconnect_delay=2.0, spool=None):
+        self.queues = list(queues)
+        self.connection_factory = connection_factory
+        self.max_buffered = max_buffered
+        self.max_in_flight = max_in_flight
+        self.reconnect_delay = reconnect_delay
+        self.spool = spool
+
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = deque()
+        self._unconfirmed = {}
+        self._next_tag = 1
+
+        self._connection = None
+        self._channel = None
+        self._ready = False
+        self._blocked = False
+        self._stopping = False
+        self._thread = None
+
+        self.published_total = 0
+        self.confirmed_total = 0
+        self.nacked_total = 0
+        self.republished_total = 0
+        self.dropped_total = 0
+        self.spooled_total = 0
+        self.reconnects_total = 0
+        self.confirm_latency_histogram = Histogram([0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0])
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            if self.spool is not None:
+                # Picks up messages spooled by processes that have exited
+                self.spool.open()
+            self._thread = threading.Thread(target=self._run, name="rabbitmq-publisher", daemon=True)
+            self._thread.start()
+
+    def publish(self, routing_key, body):
+        """
+        Queue a persistent message for confirmed delivery.
+
+        Returns:
+            False if the retry buffer is full and the message was dropped
+        """
+        self.start()
+        with self._lock:
+            full = len(self._pending) + len(self._unconfirmed) >= self.max_buffered
+            spill = self.spool is not None and (full or len(self.spool) > 0)
+            if full and not spill:
+                self.dropped_total += 1
                 return False
-            
-            self.channel.basic_publish(
+            if not spill:
+                self._pending.append((routing_key, body, time.perf_counter()))
+            connection = self._connection if self._ready else None
+
+        if spill:
+            self.spool.append(routing_key, body)
+            with self._lock:
+                self.spooled_total += 1
+
+        if connection is not None:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._drain)
+            except Exception:
+                # Connection is going away; the message is drained after reconnecting
+                pass
+        return True
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._stopping:
+                    return
+            try:
+                self._connection = self.connection_factory(
+                    self._on_connection_open, self._on_connection_open_error, self._on_connection_closed
+                )
+                self._connection.ioloop.start()
+            except Exception as e:
+                logger.error(f"RabbitMQ publisher I/O loop failed: {e}")
+
+            with self._lock:
+                self._ready = False
+                self._connection = None
+                self._channel = None
+                self._requeue_unconfirmed()
+                if self._stopping:
+                    self._idle.notify_all()
+                    return
+            self.reconnects_total += 1
+            time.sleep(self.reconnect_delay)
+
+    def _on_connection_open(self, connection):
+        self._blocked = False
+        connection.add_on_connection_blocked_callback(self._on_connection_blocked)
+        connection.add_on_connection_unblocked_callback(self._on_connection_unblocked)
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_blocked(self, connection, frame):
+        # The broker stopped accepting publishes, e.g. on a memory or disk alarm
+        logger.warning("RabbitMQ connection blocked by the broker")
+        self._blocked = True
+
+    def _on_connection_unblocked(self, connection, frame):
+        logger.info("RabbitMQ connection unblocked")
+        self._blocked = False
+
+    def _on_connection_open_error(self, connection, error):
+        logger.error(f"Error connecting to RabbitMQ: {error}")
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        if not self._stopping:
+            logger.warning(f"RabbitMQ connection closed: {reason}")
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        # Delivery tags restart at 1 on every channel
+        self._next_tag = 1
+        channel.confirm_delivery(ack_nack_callback=self._on_delivery_confirmation)
+        self._declare_queues(list(self.queues))
+
+    def _declare_queues(self, queues):
+        if not queues:
+            with self._lock:
+                self._ready = True
+            logger.info("Connected to RabbitMQ")
+            self._drain()
+            return
+        self._channel.queue_declare(
+            queue=queues[0],
+            durable=True,
+            callback=lambda _frame: self._declare_queues(queues[1:])
+        )
+
+    def _on_channel_closed(self, channel, reason):
+        logger.warning(f"RabbitMQ channel closed: {reason}")
+        self._channel = None
+        if self._connection is not None and not self._connection.is_closed:
+            self._connection.close()
+
+    def _drain(self):
+        # Runs on the I/O thread only
+        channel = self._channel
+        if not self._ready or channel is None or not channel.is_open:
+            return
+        self._refill()
+        while True:
+            with self._lock:
+                if not self._pending or len(self._unconfirmed) >= self.max_in_flight:
+                    return
+                routing_key, body, enqueued_at = self._pending.popleft()
+                tag = self._next_tag
+                self._next_tag += 1
+                self._unconfirmed[tag] = (routing_key, body, enqueued_at)
+            channel.basic_publish(
                 exchange='',
-                routing_key=settings.RABBITMQ_QUEUE_TRANSACTIONS,
-                body=json.dumps(transaction_data),
+                routing_key=routing_key,
+                body=body,
                 properties=pika.BasicProperties(
-                    delivery_mode=2, 
+                    delivery_mode=2,
                 )
             )
-            return True
-        except Exception as e:
-            print(f"Error publishing to RabbitMQ: {e}")
+            self.published_total += 1
+
+    def _on_delivery_confirmation(self, frame):
+        method = frame.method
+        is_ack = isinstance(method, pika.spec.Basic.Ack)
+        now = time.perf_counter()
+
+        with self._lock:
+            if method.multiple:
+                tags = [tag for tag in self._unconfirmed if tag <= method.delivery_tag]
+            else:
+                tags = [method.delivery_tag] if method.delivery_tag in self._unconfirmed else []
+            messages = [self._unconfirmed.pop(tag) for tag in sorted(tags)]
+
+            if is_ack:
+                self.confirmed_total += len(messages)
+                for _, _, enqueued_at in messages:
+                    self.confirm_latency_histogram.observe(now - enqueued_at)
+            else:
+                self.nacked_total += len(messages)
+                self.republished_total += len(messages)
+                self._pending.extendleft(reversed(messages))
+
+            if self._drained():
+                self._idle.notify_all()
+
+        self._drain()
+
+    def _refill(self):
+        # I/O thread only: read spooled messages back once a whole segment fits in memory
+        while self.spool is not None and len(self.spool) > 0:
+            with self._lock:
+                room = self.max_buffered - len(self._pending) - len(self._unconfirmed)
+            if room < min(self.spool.segment_messages, self.max_buffered):
+                return
+            messages = self.spool.pop_segment()
+            if not messages:
+                return
+            enqueued_at = time.perf_counter()
+            with self._lock:
+                self._pending.extend((routing_key, body, enqueued_at) for routing_key, body in messages)
+
+    def _drained(self):
+        # Called with the lock held
+        spooled = self.spool is not None and len(self.spool) > 0
+        return not self._pending and not self._unconfirmed and not spooled
+
+    def _requeue_unconfirmed(self):
+        # Called with the lock held once the connection is gone. Delivery is
+        # at-least-once: a message acked just before the drop may be sent twice.
+        messages = [self._unconfirmed[tag] for tag in sorted(self._unconfirmed)]
+        self._unconfirmed.clear()
+        self.republished_total += len(messages)
+        self._pending.extendleft(reversed(messages))
+
+    def flush(self, timeout=None):
+        """
+        Wait until every buffered and spooled message has been confirmed by the broker.
+
+        Returns:
+            True if nothing is left unconfirmed
+        """
+        with self._lock:
+            return self._idle.wait_for(self._drained, timeout=timeout)
+
+    def ping(self, timeout):
+        """
+        Round trip through the I/O thread. Raises unless the publisher is
+        connected, the broker accepts publishes and the I/O loop is responsive.
+        """
+        with self._lock:
+            connection = self._connection if self._ready else None
+        if connection is None:
+            raise RuntimeError("Not connected to RabbitMQ")
+        if self._blocked:
+            raise RuntimeError("RabbitMQ is blocking publishes")
+        done = threading.Event()
+        connection.ioloop.add_callback_threadsafe(done.set)
+        if not done.wait(timeout):
+            raise TimeoutError(f"RabbitMQ I/O loop did not respond within {timeout}s")
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        with self._lock:
+            self._stopping = True
+            connection = self._connection
+            thread = self._thread
+        if connection is not None:
             try:
-                if self.connection and self.connection.is_open:
-                    self.connection.close()
-            except:
+                connection.ioloop.add_callback_threadsafe(connection.close)
+            except Exception:
                 pass
-            self.connection = None
-            self.channel = None
-            return False
-    
+        if thread is not None:
+            thread.join(timeout=timeout)
+        with self._lock:
+            self._thread = None
+            # Left over when the broker is down or too slow to confirm within the timeout
+            remaining = [self._unconfirmed[tag] for tag in sorted(self._unconfirmed)] + list(self._pending)
+            self._unconfirmed.clear()
+            self._pending.clear()
+            if remaining and self.spool is not None:
+                for routing_key, body, _ in remaining:
+                    self.spool.append(routing_key, body)
+                self.spooled_total += len(remaining)
+                logger.warning(f"Spooled {len(remaining)} unpublished messages on shutdown")
+            elif remaining:
+                self.dropped_total += len(remaining)
+                logger.error(f"Dropped {len(remaining)} unpublished messages on shutdown")
+        if self.spool is not None:
+            self.spool.close()
+
+    def stats(self):
+        with self._lock:
+            buffered = len(self._pending)
+            in_flight = len(self._unconfirmed)
+            connected = self._ready
+        return {
+            "connected": connected,
+            "blocked": self._blocked,
+            "buffered": buffered,
+            "spooled": len(self.spool) if self.spool is not None else 0,
+            "in_flight": in_flight,
+            "max_buffered": self.max_buffered,
+            "published_total": self.published_total,
+            "confirmed_total": self.confirmed_total,
+            "nacked_total": self.nacked_total,
+            "republished_total": self.republished_total,
+            "dropped_total": self.dropped_total,
+            "spooled_total": self.spooled_total,
+            "reconnects_total": self.reconnects_total,
+            "confirm_latency_seconds": self.confirm_latency_histogram.snapshot()
+        }
+
+class RabbitMQClient:
+    def __init__(self, connection_factory=default_connection_factory):
+        self.publisher = RabbitMQPublisher(
+            queues=[settings.RABBITMQ_QUEUE_TRANSACTIONS, settings.RABBITMQ_QUEUE_PROCESSED],
+            connection_factory=connection_factory,
+            max_buffered=settings.RABBITMQ_PUBLISH_BUFFER_SIZE,
+            max_in_flight=settings.RABBITMQ_PUBLISH_MAX_IN_FLIGHT,
+            reconnect_delay=settings.RABBITMQ_RECONNECT_DELAY_SECONDS,
+            spool=MessageSpool(
+                settings.RABBITMQ_SPOOL_DIR, settings.RABBITMQ_SPOOL_SEGMENT_MESSAGES
+            ) if settings.RABBITMQ_SPOOL_ENABLED else None
+        )
+
+    def connect(self):
+        self.publisher.start()
+
+    def publish_transaction(self, transaction_data):
+        # Non-blocking: the message is confirmed by the broker in the background
+        published = self.publisher.publish(
+            settings.RABBITMQ_QUEUE_TRANSACTIONS,
+            json.dumps(transaction_data)
+        )
+        if not published:
+            logger.warning("RabbitMQ publish buffer full, dropping message", extra={
+                "queue": settings.RABBITMQ_QUEUE_TRANSACTIONS,
+                "dropped_total": self.publisher.dropped_total
+            })
+        return published
+
     def close(self):
-        if self.connection and self.connection.is_open:
-            self.connection.close()
+        self.publisher.close(timeout=settings.RABBITMQ_CLOSE_TIMEOUT_SECONDS)
 
-rabbitmq_client = RabbitMQClient()
\ No newline at end of file
+rabbitmq_client = RabbitMQClient()
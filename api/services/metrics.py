@@ -0,0 +1,194 @@
+import math
+import threading
+import time
+from api.core.config import settings
+from api.services.batcher import Histogram
+
+# Process-local metrics, served in the Prometheus text format at /metrics.
+#
+# Only stage timings and verdict counts are updated on the request path, each
+# with one short lock. Everything the services already count themselves (pool
+# usage, buffer depths, their own histograms) is read through callbacks when
+# /metrics is scraped, so it costs nothing per request. With METRICS_ENABLED
+# off, observe() and inc() return immediately.
+
+STAGE_BOUNDS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+class LabeledHistogram:
+    def __init__(self, registry, name, help, labels, bounds):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.bounds = bounds
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, values, amount):
+        # values: tuple of label values, in the order of labels
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(values)
+            if histogram is None:
+                histogram = self._histograms[values] = Histogram(self.bounds)
+            histogram.observe(amount)
+
+    def render(self):
+        with self._lock:
+            snapshots = {values: histogram.snapshot() for values, histogram in self._histograms.items()}
+        lines = []
+        for values, snapshot in sorted(snapshots.items()):
+            lines.extend(_histogram_lines(self.name, snapshot, self.labels, values))
+        return lines
+
+class LabeledCounter:
+    def __init__(self, registry, name, help, labels):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *values, amount=1):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+            for key, value in sorted(values.items(), key=lambda item: tuple(map(str, item[0])))
+        ]
+
+def _histogram_lines(name, snapshot, label_names=(), label_values=()):
+    lines = []
+    for bound, count in snapshot["buckets"].items():
+        labels = _labels(label_names, label_values, f'le="{bound}"')
+        lines.append(f"{name}_bucket{labels} {count}")
+    lines.append(f"{name}_sum{_labels(label_names, label_values)} {_number(float(snapshot['sum']))}")
+    lines.append(f"{name}_count{_labels(label_names, label_values)} {snapshot['count']}")
+    return lines
+
+class MetricsRegistry:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = []
+
+    def histogram(self, name, help, labels, bounds=STAGE_BOUNDS):
+        metric = LabeledHistogram(self, name, help, labels, bounds)
+        self._metrics.append(("histogram", metric.name, metric.help, metric.render))
+        return metric
+
+    def counter(self, name, help, labels):
+        metric = LabeledCounter(self, name, help, labels)
+        self._metrics.append(("counter", metric.name, metric.help, metric.render))
+        return metric
+
+    def gauge_callback(self, name, help, read, kind="gauge"):
+        """
+        A value read only at scrape time. read() returns a number, or None to skip.
+        """
+        def render():
+            value = read()
+            return [] if value is None else [f"{name} {_number(value)}"]
+        self._metrics.append((kind, name, help, render))
+
+    def histogram_callback(self, name, help, read):
+        # read() returns one of the services' own Histogram objects, or None
+        def render():
+            histogram = read()
+            return [] if histogram is None else _histogram_lines(name, histogram.snapshot())
+        self._metrics.append(("histogram", name, help, render))
+
+    def render(self):
+        lines = []
+        for kind, name, help, render in self._metrics:
+            try:
+                samples = render()
+            except Exception as e:
+                samples = []
+                lines.append(f"# {name} unavailable: {e}")
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry(enabled=settings.METRICS_ENABLED)
+
+stage_seconds = metrics.histogram(
+    "fraud_pipeline_stage_seconds",
+    "Time spent in each stage of the scoring pipeline, per call",
+    labels=("operation", "stage")
+)
+request_seconds = metrics.histogram(
+    "fraud_request_seconds",
+    "Total time of each scoring pipeline call",
+    labels=("operation",)
+)
+verdicts_total = metrics.counter(
+    "fraud_verdicts_total",
+    "Scored transactions by serving model and verdict",
+    labels=("model_id", "verdict")
+)
+
+def count_verdicts(predictions):
+    if not metrics.enabled:
+        return
+    # Tallied first, so a batch takes the counter lock once per label set
+    counts = {}
+    for prediction in predictions:
+        key = (prediction["model_id"], "fraud" if prediction["is_fraud"] else "legit")
+        counts[key] = counts.get(key, 0) + 1
+    for key, count in counts.items():
+        verdicts_total.inc(*key, amount=count)
+
+class StageTimer:
+    """
+    Times the consecutive stages of one request: lap(stage) records the time
+    since the previous lap in the stage histogram and keeps it for logging,
+    finish() records the total.
+    """
+    __slots__ = ("operation", "started", "_last", "timings")
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started = self._last = time.perf_counter()
+        self.timings = {}
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        seconds = now - self._last
+        self._last = now
+        self.timings[stage] = seconds
+        stage_seconds.observe((self.operation, stage), seconds)
+        return seconds
+
+    def finish(self):
+        request_seconds.observe((self.operation,), self.total())
+
+    def total(self):
+        return self._last - self.started
+
+    def fields(self):
+        # Flat key/value pairs for structured logs
+        fields = {f"{stage}_ms": round(seconds * 1000, 3) for stage, seconds in self.timings.items()}
+        fields["total_ms"] = round(self.total() * 1000, 3)
+        return fields
@@ -1,20 +1,51 @@
 # app/services/ml_model.py
-import io
-import pickle
 import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import numpy as np
 from minio import Minio
 from api.core.config import settings
+from api.services.batcher import MicroBatcher
+from api.services.metrics import stage_seconds
+from api.dependencies.database import SessionLocal
+from api.models.transaction import MLModel
+from api.services.model_registry import active_model_cache, to_active_model
+from api.services.model_artifact import (
+    MANIFEST_FILE, get_current_version, download_model_artifact, load_model_artifact, prune_model_cache
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+FEATURE_COLUMNS = ["time", "v1", "v2", "v3", "v4", "v5", "v6", "v7", "v8", "v9", "v10",
+                   "v11", "v12", "v13", "v14", "v15", "v16", "v17", "v18", "v19", "v20",
+                   "v21", "v22", "v23", "v24", "v25", "v26", "v27", "v28", "amount"]
+
 class ModelService:
     def __init__(self):
-        self.model = None
-        self.scaler = None
+        self.artifact = None
         self.minio_client = None
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        # Bounded pool for CPU-bound inference so it never runs on the event loop
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.INFERENCE_WORKERS,
+            thread_name_prefix="inference"
+        )
+        self.batcher = None
+        if settings.INFERENCE_BATCH_ENABLED:
+            self.batcher = MicroBatcher(
+                predict_batch=self.predict_batch,
+                executor=self.executor,
+                max_batch_size=settings.INFERENCE_BATCH_MAX_SIZE,
+                max_delay_ms=settings.INFERENCE_BATCH_MAX_DELAY_MS,
+                max_concurrent_batches=settings.INFERENCE_WORKERS
+            )
+        # The client does no network I/O until used; the model is loaded by initialize()
         self._initialize_minio()
-        self.load_model()
     
     def _initialize_minio(self):
         try:
@@ -29,78 +60,191 @@ class ModelService:
             logger.error(f"Error initializing MinIO client: {e}")
             self.minio_client = None
     
+    def initialize(self):
+        """
+        Load the model to serve: the active registry version first, falling back
+        to the MinIO current pointer and then the local artifact.
+        """
+        try:
+            self.refresh_model()
+        except Exception as e:
+            logger.error(f"Could not sync with the model registry: {e}")
+        if self.artifact is None:
+            self.load_model()
+        if self.artifact is None:
+            raise RuntimeError("No model artifact could be loaded; predictions will fail")
+    
     def load_model(self):
         if self.minio_client:
             try:
-                logger.info("Attempting to load model from MinIO")
-                model_obj = self.minio_client.get_object(
-                    settings.MINIO_BUCKET, 
-                    "models/fraud_model.pkl"
-                )
-                model_data = model_obj.read()
-                self.model = pickle.loads(model_data)
-                model_obj.close()
-                
-                # Load scaler from MinIO
-                scaler_obj = self.minio_client.get_object(
-                    settings.MINIO_BUCKET, 
-                    "models/scaler.pkl"
+                logger.info("Attempting to load model artifact from MinIO")
+                version = get_current_version(self.minio_client, settings.MINIO_BUCKET)
+                path = download_model_artifact(
+                    self.minio_client, settings.MINIO_BUCKET, settings.MODEL_CACHE_DIR, version
                 )
-                scaler_data = scaler_obj.read()
-                self.scaler = pickle.loads(scaler_data)
-                scaler_obj.close()
-                
-                logger.info("Model and scaler loaded successfully from MinIO")
+                self._set_artifact(load_model_artifact(path))
+                logger.info(f"Model artifact {version} loaded from MinIO")
                 return
             except Exception as e:
-                logger.error(f"Error loading model from MinIO: {e}")
+                logger.error(f"Error loading model artifact from MinIO: {e}")
         
         try:
-            logger.info("Attempting to load model from local storage")
-            model_path = os.path.join("app", "ml_models", "fraud_model.pkl")
-            scaler_path = os.path.join("app", "ml_models", "scaler.pkl")
-            
-            if os.path.exists(model_path) and os.path.exists(scaler_path):
-                with open(model_path, "rb") as f:
-                    self.model = pickle.load(f)
-                with open(scaler_path, "rb") as f:
-                    self.scaler = pickle.load(f)
-                logger.info("Model and scaler loaded successfully from local storage")
+            logger.info("Attempting to load model artifact from local storage")
+            if os.path.exists(os.path.join(settings.MODEL_LOCAL_DIR, MANIFEST_FILE)):
+                self._set_artifact(load_model_artifact(settings.MODEL_LOCAL_DIR))
+                logger.info(f"Model artifact {self.artifact.version} loaded from local storage")
             else:
-                logger.error("Model or scaler file not found in local storage")
+                logger.error(f"Model artifact not found in {settings.MODEL_LOCAL_DIR}")
         except Exception as e:
-            logger.error(f"Error loading model from local storage: {e}")
+            logger.error(f"Error loading model artifact from local storage: {e}")
     
-    def predict(self, features):
+    def _set_artifact(self, artifact):
+        if artifact.feature_columns != FEATURE_COLUMNS:
+            raise ValueError(f"Model artifact feature order {artifact.feature_columns} does not match the API")
+        artifact.warm_up()
+        # A single reference swap: in-flight predictions keep the artifact they already read
+        self.artifact = artifact
+    
+    def _get_active_version(self):
+        # The active ml_models row is the source of truth; the MinIO pointer covers rows without a version
+        model_id, version = None, None
+        try:
+            db = SessionLocal()
+            try:
+                active_model = db.query(MLModel).filter(MLModel.active == True).first()
+            finally:
+                db.close()
+            if active_model:
+                model_id, version = active_model.model_id, active_model.version
+            # Every poll doubles as a refresh of the request-path cache
+            active_model_cache.set(to_active_model(active_model))
+        except Exception as e:
+            logger.error(f"Error reading the active model from the registry: {e}")
+        
+        if version is None and self.minio_client:
+            version = get_current_version(self.minio_client, settings.MINIO_BUCKET)
+        return model_id, version
+    
+    def refresh_model(self):
         """
-        Make a fraud prediction on the provided features.
+        Load and swap in the active model version if it differs from the one being served.
+        
+        Returns:
+            True if a new artifact was swapped in
+        """
+        model_id, version = self._get_active_version()
+        current = self.artifact
+        if version is None:
+            return False
+        if current is not None and current.version == version:
+            if current.model_id == model_id:
+                return False
+            # Same arrays registered under a new ml_models row
+            self.artifact = current.with_model_id(model_id)
+            active_model_cache.invalidate()
+            return True
+        
+        path = download_model_artifact(
+            self.minio_client, settings.MINIO_BUCKET, settings.MODEL_CACHE_DIR, version
+        )
+        self._set_artifact(load_model_artifact(path).with_model_id(model_id))
+        active_model_cache.invalidate()
+        logger.info(
+            f"Swapped model {current.version if current else None} -> {version} (model_id={model_id})"
+        )
+        prune_model_cache(settings.MODEL_CACHE_DIR, settings.MODEL_CACHE_KEEP, protect=(version,))
+        return True
+    
+    def _watch(self):
+        while not self._stop_watching.wait(settings.MODEL_RELOAD_INTERVAL_SECONDS):
+            try:
+                self.refresh_model()
+            except Exception as e:
+                current = self.artifact.version if self.artifact else None
+                logger.error(f"Model reload failed, still serving {current}: {e}")
+    
+    def start_watcher(self):
+        if settings.MODEL_RELOAD_INTERVAL_SECONDS <= 0 or self._watcher is not None:
+            return
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+    
+    def stop_watcher(self):
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+    
+    def build_feature_matrix(self, features_list):
+        # One contiguous (n_rows, n_features) float64 array, in FEATURE_COLUMNS order
+        values = chain.from_iterable(
+            (features.get(col, 0.0) for col in FEATURE_COLUMNS) for features in features_list
+        )
+        matrix = np.fromiter(values, dtype=np.float64, count=len(features_list) * len(FEATURE_COLUMNS))
+        return matrix.reshape(len(features_list), len(FEATURE_COLUMNS))
+    
+    def predict_batch(self, features_list):
+        """
+        Make fraud predictions for many transactions with a single vectorized call.
         
         Args:
-            features: Dictionary containing transaction features
+            features_list: List of dictionaries containing transaction features
             
         Returns:
-            Dictionary with prediction results
+            List of dictionaries with prediction results, in input order
         """
-        if self.model is None or self.scaler is None:
+        artifact = self.artifact
+        if artifact is None:
             raise ValueError("Model or scaler not loaded")
         
-        feature_array = []
-        for col in ["time", "v1", "v2", "v3", "v4", "v5", "v6", "v7", "v8", "v9", "v10",
-                   "v11", "v12", "v13", "v14", "v15", "v16", "v17", "v18", "v19", "v20",
-                   "v21", "v22", "v23", "v24", "v25", "v26", "v27", "v28", "amount"]:
-            feature_array.append(features.get(col, 0.0))
-        
-        scaled_features = self.scaler.transform([feature_array])
+        if not features_list:
+            return []
         
-        fraud_prob = self.model.predict_proba(scaled_features)[0, 1]
-        is_fraud = fraud_prob > 0.5
+        started = time.perf_counter()
+        feature_matrix = self.build_feature_matrix(features_list)
+        assembled = time.perf_counter()
+        scaled_matrix = artifact.scale(feature_matrix)
+        scaled = time.perf_counter()
+        fraud_probs = artifact.forest.predict_fraud_proba(scaled_matrix)
+        stage_seconds.observe(("inference", "feature_assembly"), assembled - started)
+        stage_seconds.observe(("inference", "scaling"), scaled - assembled)
+        stage_seconds.observe(("inference", "predict"), time.perf_counter() - scaled)
+        threshold = artifact.threshold
+        confidences = 2 * np.abs(fraud_probs - 0.5)
         
-        confidence = 2 * abs(fraud_prob - 0.5)
+        return [
+            {
+                "fraud_probability": float(fraud_prob),
+                "is_fraud": bool(fraud_prob > threshold),
+                "confidence": float(confidence),
+                "prediction_threshold": threshold,
+                "model_version": artifact.version,
+                "model_id": artifact.model_id
+            }
+            for fraud_prob, confidence in zip(fraud_probs, confidences)
+        ]
+    
+    def predict(self, features):
+        """
+        Make a fraud prediction on the provided features.
         
-        return {
-            "fraud_probability": float(fraud_prob),
-            "is_fraud": bool(is_fraud),
-            "confidence": float(confidence)
-        }
+        Args:
+            features: Dictionary containing transaction features
+            
+        Returns:
+            Dictionary with prediction results
+        """
+        return self.predict_batch([features])[0]
+    
+    async def predict_batch_async(self, features_list):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.predict_batch, features_list)
+    
+    async def predict_async(self, features):
+        if self.batcher is not None:
+            return await self.batcher.submit(features)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.predict, features)
 
 model_service = ModelService()
\ No newline at end of file
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+import numpy as np
+from api.services.flat_forest import FlatForest, FLAT_FOREST_ARRAYS, OUTPUT_MEAN
+
+# On-disk model format: one raw .npy file per forest array plus a small JSON
+# manifest. Arrays are opened with np.load(mmap_mode="r"), so every worker on a
+# host maps the same page-cache pages instead of holding its own copy, and no
+# pickle is ever loaded on the serving path.
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+CURRENT_POINTER = "current.json"
+
+# Stored with the exact dtypes FlatForest uses, so loading never copies
+ARRAY_DTYPES = {
+    "feature": np.intp,
+    "threshold": np.float64,
+    "left": np.intp,
+    "value": np.float64,
+    "roots": np.intp
+}
+
+class ModelArtifact:
+    def __init__(self, forest, manifest, path, model_id=None):
+        self.forest = forest
+        self.manifest = manifest
+        self.path = path
+        # ml_models row this artifact is served as; None when loaded without the registry
+        self.model_id = model_id
+
+        scaler = manifest.get("scaler")
+        self.scaler_mean = np.array(scaler["mean"], dtype=np.float64) if scaler else None
+        self.scaler_scale = np.array(scaler["scale"], dtype=np.float64) if scaler else None
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    @property
+    def feature_columns(self):
+        return self.manifest["feature_columns"]
+
+    @property
+    def threshold(self):
+        return self.manifest["threshold"]
+
+    def with_model_id(self, model_id):
+        return ModelArtifact(self.forest, self.manifest, self.path, model_id=model_id)
+
+    def warm_up(self):
+        # Fault every mapped page in and run one prediction, so the first real
+        # request after a swap does not pay for page faults
+        for name in FLAT_FOREST_ARRAYS:
+            np.sum(getattr(self.forest, name))
+        self.predict_fraud_proba(np.zeros((1, len(self.feature_columns))))
+
+    def scale(self, X):
+        # Same arithmetic as StandardScaler.transform; skipped for fused forests
+        if self.scaler_mean is None:
+            return X
+        return (X - self.scaler_mean) / self.scaler_scale
+
+    def predict_fraud_proba(self, X):
+        return self.forest.predict_fraud_proba(self.scale(X))
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def save_model_artifact(directory, forest, feature_columns, scaler_mean=None, scaler_scale=None,
+                        threshold=0.5, metadata=None):
+    """
+    Write a forest as a versioned artifact directory and return its manifest.
+
+    The version is a content hash of the arrays and the serving parameters, so
+    identical models always get the same version.
+    """
+    if forest.fused and scaler_mean is not None:
+        raise ValueError("A fused forest already contains the scaler")
+    if not forest.fused and scaler_mean is None:
+        raise ValueError("An unfused forest needs scaler parameters")
+
+    os.makedirs(directory, exist_ok=True)
+
+    arrays = {}
+    for name in FLAT_FOREST_ARRAYS:
+        path = os.path.join(directory, f"{name}.npy")
+        np.save(path, np.ascontiguousarray(getattr(forest, name), dtype=ARRAY_DTYPES[name]))
+        arrays[name] = {"file": f"{name}.npy", "sha256": _sha256(path)}
+
+    scaler = None
+    if scaler_mean is not None:
+        scaler = {
+            "mean": [float(v) for v in scaler_mean],
+            "scale": [float(v) for v in scaler_scale]
+        }
+
+    serving = {
+        "feature_columns": list(feature_columns),
+        "scaler": scaler,
+        "fused": forest.fused,
+        "threshold": float(threshold),
+        "max_depth": forest.max_depth,
+        "output": forest.output,
+        "base_score": forest.base_score
+    }
+    version_hash = hashlib.sha256(json.dumps(
+        {"arrays": {name: info["sha256"] for name, info in arrays.items()}, **serving},
+        sort_keys=True
+    ).encode("utf-8")).hexdigest()
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "version": version_hash[:16],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "n_trees": forest.n_trees,
+        "n_nodes": forest.n_nodes,
+        **serving,
+        "arrays": arrays,
+        "metadata": metadata or {}
+    }
+    with open(os.path.join(directory, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=4)
+
+    return manifest
+
+def load_model_artifact(directory, mmap=True, verify=False):
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format version: {manifest.get('format_version')}")
+
+    arrays = {}
+    for name in FLAT_FOREST_ARRAYS:
+        path = os.path.join(directory, manifest["arrays"][name]["file"])
+        if verify and _sha256(path) != manifest["arrays"][name]["sha256"]:
+            raise ValueError(f"Checksum mismatch for {path}")
+        arrays[name] = np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False)
+
+    # Manifests written before boosted surrogates existed are plain averaging forests
+    forest = FlatForest(
+        max_depth=manifest["max_depth"],
+        fused=manifest["fused"],
+        output=manifest.get("output", OUTPUT_MEAN),
+        base_score=manifest.get("base_score", 0.0),
+        **arrays
+    )
+    return ModelArtifact(forest, manifest, directory)
+
+def upload_model_artifact(minio_client, bucket, directory, prefix="models/fraud_model", make_current=True):
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    version = manifest["version"]
+
+    # Arrays first and manifest last, so a visible manifest implies a complete upload
+    for info in manifest["arrays"].values():
+        minio_client.fput_object(
+            bucket, f"{prefix}/{version}/{info['file']}",
+            os.path.join(directory, info["file"]),
+            content_type="application/octet-stream"
+        )
+    minio_client.fput_object(
+        bucket, f"{prefix}/{version}/{MANIFEST_FILE}",
+        os.path.join(directory, MANIFEST_FILE),
+        content_type="application/json"
+    )
+
+    if make_current:
+        pointer = os.path.join(directory, CURRENT_POINTER)
+        with open(pointer, "w") as f:
+            json.dump({"version": version}, f)
+        minio_client.fput_object(bucket, f"{prefix}/{CURRENT_POINTER}", pointer, content_type="application/json")
+        os.remove(pointer)
+
+    return version
+
+def get_current_version(minio_client, bucket, prefix="models/fraud_model"):
+    response = minio_client.get_object(bucket, f"{prefix}/{CURRENT_POINTER}")
+    try:
+        return json.loads(response.read().decode("utf-8"))["version"]
+    finally:
+        response.close()
+        response.release_conn()
+
+def prune_model_cache(cache_dir, keep, protect=()):
+    # Drop the oldest cached versions; mapped files stay valid for workers still using them
+    if not os.path.isdir(cache_dir):
+        return
+    versions = [
+        entry for entry in os.scandir(cache_dir)
+        if entry.is_dir() and not entry.name.startswith(".") and entry.name not in protect
+    ]
+    versions.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[keep:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+def download_model_artifact(minio_client, bucket, cache_dir, version, prefix="models/fraud_model"):
+    """
+    Fetch one artifact version into cache_dir/<version> and return that path.
+
+    Versions are immutable, so a cached copy is reused as-is. Files are
+    downloaded into a private temp directory, checksummed and renamed into place,
+    so concurrent workers on the same host never observe a partial artifact.
+    """
+    target = os.path.join(cache_dir, version)
+    if os.path.exists(os.path.join(target, MANIFEST_FILE)):
+        return target
+
+    os.makedirs(cache_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=cache_dir, prefix=f".{version}-")
+    try:
+        manifest_path = os.path.join(staging, MANIFEST_FILE)
+        minio_client.fget_object(bucket, f"{prefix}/{version}/{MANIFEST_FILE}", manifest_path)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        for info in manifest["arrays"].values():
+            path = os.path.join(staging, info["file"])
+            minio_client.fget_object(bucket, f"{prefix}/{version}/{info['file']}", path)
+            if _sha256(path) != info["sha256"]:
+                raise ValueError(f"Checksum mismatch for {info['file']} in model version {version}")
+
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Another worker finished the same version first
+            if not os.path.exists(os.path.join(target, MANIFEST_FILE)):
+                raise
+    finally:
+        if os.path.exists(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+
+    return target
@@ -0,0 +1,41 @@
+import time
+from collections import namedtuple
+from api.core.config import settings
+
+ActiveModel = namedtuple("ActiveModel", ["model_id", "model_name", "version"])
+
+class ActiveModelCache:
+    """
+    In-process cache of the active ml_models row.
+
+    Entries expire after ttl_seconds. The model watcher also refreshes the
+    entry on every poll and invalidates it whenever it swaps models, so the
+    cache never outlives a reload.
+    """
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        # (ActiveModel, expires_at) swapped as one tuple so readers never see a torn entry
+        self._entry = None
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self):
+        entry = self._entry
+        if entry is not None and time.monotonic() < entry[1]:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+    
+    def set(self, active_model):
+        self._entry = (active_model, time.monotonic() + self.ttl_seconds)
+    
+    def invalidate(self):
+        self._entry = None
+
+def to_active_model(model_row):
+    if model_row is None:
+        return None
+    return ActiveModel(model_row.model_id, model_row.model_name, model_row.version)
+
+active_model_cache = ActiveModelCache(settings.ACTIVE_MODEL_CACHE_TTL_SECONDS)
\ No newline at end of file
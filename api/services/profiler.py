@@ -0,0 +1,269 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+import logging
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Leaf frames of threads that are only waiting; such samples are dropped
+IDLE_FRAMES = {
+    ("select", "selectors.py"),
+    ("wait", "threading.py"),
+    ("get", "queue.py"),
+    ("_worker", "thread.py")
+}
+MAX_PENDING_PROFILES = 16
+
+class ProfileSession:
+    def __init__(self, label, thread_id):
+        self.id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.label = label
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.ended = None
+        # (thread name, stack from root to leaf, weight in seconds)
+        self.samples = []
+
+class SamplingProfiler:
+    """
+    Statistical profiler for selected requests, built on sys._current_frames().
+
+    A sampler thread runs only while a session is open. Every interval it
+    records the stacks of each session's request thread (the event loop) and of
+    the threads whose name starts with one of thread_prefixes (the inference
+    pool), so a profile shows both the request coroutine and the model call.
+    Under concurrency a session also sees other requests that ran on those
+    threads at the time, which is the real workload the request competed with.
+
+    The sampler measures its own CPU time and sleeps long enough that sampling
+    and writing profiles never use more than max_cpu_fraction of one core; the
+    effective interval grows instead. Finished sessions are written by the same
+    thread as speedscope JSON and collapsed stacks, to output_dir and, with a
+    storage client, to object storage under profiles/.
+    """
+    def __init__(self, interval_ms, max_cpu_fraction, output_dir, storage=None, thread_prefixes=("inference",)):
+        self.interval = interval_ms / 1000.0
+        self.max_cpu_fraction = max_cpu_fraction
+        self.output_dir = output_dir
+        self.storage = storage
+        self.thread_prefixes = tuple(thread_prefixes)
+
+        self._lock = threading.Lock()
+        self._sessions = []
+        self._finished = []
+        self._thread = None
+
+        self.sessions_total = 0
+        self.sessions_refused = 0
+        self.samples_total = 0
+        self.cpu_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def start(self, label, thread_id=None):
+        """
+        Open a session for the calling thread.
+
+        Returns:
+            The session, or None if too many profiles are still waiting to be written
+        """
+        session = ProfileSession(label, thread_id or threading.get_ident())
+        with self._lock:
+            if len(self._finished) >= MAX_PENDING_PROFILES:
+                self.sessions_refused += 1
+                return None
+            self._sessions.append(session)
+            self.sessions_total += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session):
+        session.ended = time.perf_counter()
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+                self._finished.append(session)
+
+    def _run(self):
+        last = time.perf_counter()
+        while True:
+            cpu_started = time.thread_time()
+            wall_started = time.perf_counter()
+            with self._lock:
+                sessions = list(self._sessions)
+                finished, self._finished = self._finished, []
+                if not sessions and not finished:
+                    self._thread = None
+                    return
+
+            if sessions:
+                now = time.perf_counter()
+                self._sample(sessions, now - last)
+                last = now
+            for session in finished:
+                self._write(session)
+
+            cost = time.thread_time() - cpu_started
+            self.cpu_seconds += cost
+            # Sleep so that cost / (cost + sleep) stays within the CPU budget
+            time.sleep(max(self.interval, cost / self.max_cpu_fraction - cost))
+            self.wall_seconds += time.perf_counter() - wall_started
+
+    def _sample(self, sessions, weight):
+        frames = sys._current_frames()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        pool_stacks = [
+            (name, _stack(frames[ident]))
+            for ident, name in names.items()
+            if name.startswith(self.thread_prefixes) and ident in frames
+        ]
+        pool_stacks = [(name, stack) for name, stack in pool_stacks if not _idle(stack)]
+        for session in sessions:
+            frame = frames.get(session.thread_id)
+            if frame is not None:
+                stack = _stack(frame)
+                if not _idle(stack):
+                    session.samples.append(("request", stack, weight))
+            session.samples.extend((name, stack, weight) for name, stack in pool_stacks)
+        self.samples_total += 1
+
+    def _write(self, session):
+        files = {
+            f"{session.id}.speedscope.json": to_speedscope(session).encode("utf-8"),
+            f"{session.id}.collapsed.txt": to_collapsed(session).encode("utf-8")
+        }
+        for name, data in files.items():
+            try:
+                os.makedirs(self.output_dir, exist_ok=True)
+                with open(os.path.join(self.output_dir, name), "wb") as f:
+                    f.write(data)
+                if self.storage is not None:
+                    key = f"profiles/date={datetime.now().strftime('%Y-%m-%d')}/{name}"
+                    self.storage.store_bytes(key, data, "application/json" if name.endswith(".json") else "text/plain")
+            except Exception as e:
+                logger.error(f"Error writing profile {name}: {e}")
+        logger.info(f"Profile {session.id} written", extra={
+            "profile_id": session.id, "label": session.label, "samples": len(session.samples),
+            "duration_ms": round((session.ended - session.started) * 1000, 3)
+        })
+
+    def stats(self):
+        with self._lock:
+            active = len(self._sessions)
+            pending = len(self._finished)
+        return {
+            "active_sessions": active,
+            "pending_writes": pending,
+            "sessions_total": self.sessions_total,
+            "sessions_refused": self.sessions_refused,
+            "samples_total": self.samples_total,
+            "cpu_seconds": self.cpu_seconds,
+            "cpu_fraction": self.cpu_seconds / self.wall_seconds if self.wall_seconds else 0.0,
+            "max_cpu_fraction": self.max_cpu_fraction
+        }
+
+def _stack(frame):
+    # (qualified name, function name, file path) per frame, root first as both output formats expect
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((getattr(code, "co_qualname", code.co_name), code.co_name, code.co_filename))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+def _idle(stack):
+    return not stack or (stack[-1][1], os.path.basename(stack[-1][2])) in IDLE_FRAMES
+
+def to_collapsed(session):
+    # One "thread;root;...;leaf count" line per distinct stack, as read by flamegraph.pl and speedscope
+    counts = Counter(
+        ";".join([thread] + [f"{name} ({os.path.basename(path)})" for name, _, path in stack])
+        for thread, stack, _ in session.samples
+    )
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+def to_speedscope(session):
+    frames = []
+    frame_index = {}
+    profiles = {}
+    for thread, stack, weight in session.samples:
+        indices = []
+        for name, _, path in stack:
+            key = (name, path)
+            if key not in frame_index:
+                frame_index[key] = len(frames)
+                frames.append({"name": name, "file": path})
+            indices.append(frame_index[key])
+        profile = profiles.setdefault(thread, {"samples": [], "weights": []})
+        profile["samples"].append(indices)
+        profile["weights"].append(weight)
+
+    duration = (session.ended or time.perf_counter()) - session.started
+    return json.dumps({
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": f"{session.label} ({session.id})",
+        "exporter": "fraud-detection-api",
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": thread,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": max(duration, sum(profile["weights"])),
+                "samples": profile["samples"],
+                "weights": profile["weights"]
+            }
+            for thread, profile in sorted(profiles.items())
+        ]
+    })
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when it carries "X-Profile: 1" together with a valid
+    API key, or at random for sample_rate of the requests under path_prefix.
+    The profile id is returned in the X-Profile-Id response header.
+    """
+    def __init__(self, app, profiler, api_key, sample_rate=0.0, path_prefix="/"):
+        self.app = app
+        self.profiler = profiler
+        self.api_key = api_key.encode()
+        self.sample_rate = sample_rate
+        self.path_prefix = path_prefix
+
+    def _wanted(self, scope):
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile") == b"1" and headers.get(b"x-api-key") == self.api_key:
+            return True
+        return (
+            self.sample_rate > 0
+            and scope["path"].startswith(self.path_prefix)
+            and random.random() < self.sample_rate
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+        session = self.profiler.start(f"{scope['method']} {scope['path']}")
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", session.id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            self.profiler.stop(session)
@@ -0,0 +1,222 @@
+from sqlalchemy import text
+
+GRANULARITIES = ("minute", "hour", "day")
+ROLLUP_STATE_NAME = "transactions"
+
+# Pre-aggregated transaction counts and amounts per time bucket, source and
+# scoring model, so analytics never scan the OLTP tables. Transactions are
+# folded in once, in transaction_id order, behind a watermark kept in
+# rollup_state. Each step aggregates one id range into all granularities and
+# advances the watermark in the same database transaction, so every row is
+# counted exactly once even if several processes run refreshes.
+#
+# A transaction counts as fraud when its prediction flagged it, or, for rows
+# that were never scored (the historical dataset), when it is labelled fraud.
+# Rows younger than the settle window are left for a later step, so that
+# asynchronously scored transactions are usually rolled up with their
+# prediction. When the queue is further behind than that, the row is folded in
+# as unscored (model 0), and the worker moves it to its model when it stores
+# the prediction (apply_late_predictions).
+
+LOCK_STATE = text("""
+    SELECT watermark FROM rollup_state WHERE name = :name FOR UPDATE SKIP LOCKED
+""")
+
+ENSURE_STATE = text("""
+    INSERT INTO rollup_state (name, watermark) VALUES (:name, 0) ON CONFLICT (name) DO NOTHING
+""")
+
+# Last id of the next step: at most batch_rows rows, stopping before the first unsettled one
+NEXT_UPPER_BOUND = text("""
+    WITH candidates AS (
+        SELECT transaction_id, processed_at
+        FROM transactions
+        WHERE transaction_id > :after
+        ORDER BY transaction_id
+        LIMIT :batch_rows
+    )
+    SELECT COALESCE(
+        (SELECT MIN(transaction_id) - 1 FROM candidates
+         WHERE processed_at >= now() - make_interval(secs => :settle_seconds)),
+        (SELECT MAX(transaction_id) FROM candidates)
+    ) AS upper_bound
+""")
+
+ROLLUP_CONFLICT_UPDATE = """
+    ON CONFLICT (granularity, bucket_start, source, model_id) DO UPDATE SET
+        transaction_count = transaction_rollups.transaction_count + EXCLUDED.transaction_count,
+        fraud_count = transaction_rollups.fraud_count + EXCLUDED.fraud_count,
+        total_amount = transaction_rollups.total_amount + EXCLUDED.total_amount,
+        fraud_amount = transaction_rollups.fraud_amount + EXCLUDED.fraud_amount,
+        scored_count = transaction_rollups.scored_count + EXCLUDED.scored_count,
+        fraud_probability_sum = transaction_rollups.fraud_probability_sum + EXCLUDED.fraud_probability_sum
+"""
+
+UPSERT_ROLLUPS = text(f"""
+    WITH batch AS (
+        SELECT
+            COALESCE(t.processed_at, to_timestamp(0)) AS processed_at,
+            COALESCE(t.source, 'unknown') AS source,
+            COALESCE(p.model_id, 0) AS model_id,
+            COALESCE(p.predicted_class, t.is_fraud, FALSE) AS is_fraud,
+            COALESCE(t.amount, 0) AS amount,
+            p.fraud_probability
+        FROM transactions t
+        LEFT JOIN LATERAL (
+            SELECT model_id, predicted_class, fraud_probability
+            FROM fraud_predictions
+            WHERE fraud_predictions.transaction_id = t.transaction_id
+            ORDER BY prediction_id DESC
+            LIMIT 1
+        ) p ON TRUE
+        WHERE t.transaction_id > :after AND t.transaction_id <= :upper_bound
+    )
+    INSERT INTO transaction_rollups (
+        granularity, bucket_start, source, model_id,
+        transaction_count, fraud_count, total_amount, fraud_amount,
+        scored_count, fraud_probability_sum
+    )
+    SELECT
+        g.granularity,
+        date_trunc(g.granularity, batch.processed_at),
+        batch.source,
+        batch.model_id,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE batch.is_fraud),
+        SUM(batch.amount),
+        COALESCE(SUM(batch.amount) FILTER (WHERE batch.is_fraud), 0),
+        COUNT(batch.fraud_probability),
+        COALESCE(SUM(batch.fraud_probability), 0)
+    FROM batch
+    CROSS JOIN (VALUES ('minute'), ('hour'), ('day')) AS g (granularity)
+    GROUP BY 1, 2, 3, 4
+    {ROLLUP_CONFLICT_UPDATE}
+""")
+
+# Waits for a running refresh step; refreshes skip the state row while it is held
+LOCK_STATE_SHARED = text("""
+    SELECT watermark FROM rollup_state WHERE name = :name FOR SHARE
+""")
+
+# Moves transactions that were folded in unscored (model 0, fraud by label)
+# to the model that has since scored them. Rows are upserted in key order, so
+# concurrent workers lock rollup rows in the same order.
+MOVE_LATE_PREDICTIONS = text(f"""
+    WITH scored AS (
+        SELECT
+            COALESCE(t.processed_at, to_timestamp(0)) AS processed_at,
+            COALESCE(t.source, 'unknown') AS source,
+            COALESCE(t.is_fraud, FALSE) AS labelled_fraud,
+            COALESCE(t.amount, 0) AS amount,
+            p.model_id,
+            p.predicted_class,
+            p.fraud_probability
+        FROM transactions t
+        JOIN fraud_predictions p ON p.transaction_id = t.transaction_id
+        WHERE t.transaction_id = ANY(:transaction_ids)
+    ), deltas AS (
+        SELECT
+            processed_at, source, 0 AS model_id,
+            -1 AS transaction_count,
+            CASE WHEN labelled_fraud THEN -1 ELSE 0 END AS fraud_count,
+            -amount AS total_amount,
+            CASE WHEN labelled_fraud THEN -amount ELSE 0 END AS fraud_amount,
+            0 AS scored_count,
+            CAST(0 AS DOUBLE PRECISION) AS fraud_probability_sum
+        FROM scored
+        UNION ALL
+        SELECT
+            processed_at, source, model_id,
+            1,
+            CASE WHEN predicted_class THEN 1 ELSE 0 END,
+            amount,
+            CASE WHEN predicted_class THEN amount ELSE 0 END,
+            CASE WHEN fraud_probability IS NULL THEN 0 ELSE 1 END,
+            COALESCE(fraud_probability, 0)
+        FROM scored
+    )
+    INSERT INTO transaction_rollups (
+        granularity, bucket_start, source, model_id,
+        transaction_count, fraud_count, total_amount, fraud_amount,
+        scored_count, fraud_probability_sum
+    )
+    SELECT
+        g.granularity,
+        date_trunc(g.granularity, deltas.processed_at),
+        deltas.source,
+        deltas.model_id,
+        SUM(deltas.transaction_count),
+        SUM(deltas.fraud_count),
+        SUM(deltas.total_amount),
+        SUM(deltas.fraud_amount),
+        SUM(deltas.scored_count),
+        SUM(deltas.fraud_probability_sum)
+    FROM deltas
+    CROSS JOIN (VALUES ('minute'), ('hour'), ('day')) AS g (granularity)
+    GROUP BY 1, 2, 3, 4
+    ORDER BY 1, 2, 3, 4
+    {ROLLUP_CONFLICT_UPDATE}
+""")
+
+ADVANCE_WATERMARK = text("""
+    UPDATE rollup_state SET watermark = :upper_bound, updated_at = now() WHERE name = :name
+""")
+
+def refresh_rollups(db, batch_rows, settle_seconds):
+    """
+    Fold the next batch_rows transactions above the watermark into the rollups.
+
+    Returns the new watermark, or None when there was nothing to do or another
+    process holds the rollup lock.
+    """
+    db.execute(ENSURE_STATE, {"name": ROLLUP_STATE_NAME})
+    after = db.execute(LOCK_STATE, {"name": ROLLUP_STATE_NAME}).scalar()
+    if after is None:
+        db.rollback()
+        return None
+
+    upper_bound = db.execute(NEXT_UPPER_BOUND, {
+        "after": after, "batch_rows": batch_rows, "settle_seconds": settle_seconds
+    }).scalar()
+    if upper_bound is None or upper_bound <= after:
+        db.rollback()
+        return None
+
+    db.execute(UPSERT_ROLLUPS, {"after": after, "upper_bound": upper_bound})
+    db.execute(ADVANCE_WATERMARK, {"upper_bound": upper_bound, "name": ROLLUP_STATE_NAME})
+    db.commit()
+    return upper_bound
+
+def apply_late_predictions(db, transaction_ids):
+    """
+    Correct the rollups for predictions stored after their transactions were
+    rolled up as unscored. Must run in the database transaction that inserted
+    the predictions, with the ids of the rows it actually inserted.
+
+    The shared lock on the state row is taken after the insert and held until
+    commit. A refresh step that committed before then is seen through its
+    watermark, and its rows are corrected here. A later one sees the
+    committed predictions. Either way, each transaction is counted once.
+
+    Returns the number of transactions moved.
+    """
+    if not transaction_ids:
+        return 0
+    watermark = db.execute(LOCK_STATE_SHARED, {"name": ROLLUP_STATE_NAME}).scalar()
+    late = [transaction_id for transaction_id in transaction_ids if watermark and transaction_id <= watermark]
+    if late:
+        db.execute(MOVE_LATE_PREDICTIONS, {"transaction_ids": late})
+    return len(late)
+
+def reset_rollups(db):
+    # Locks the state row first, so a concurrent refresh cannot interleave with the reset
+    db.execute(ENSURE_STATE, {"name": ROLLUP_STATE_NAME})
+    db.execute(text("SELECT watermark FROM rollup_state WHERE name = :name FOR UPDATE"), {"name": ROLLUP_STATE_NAME})
+    db.execute(text("DELETE FROM transaction_rollups"))
+    db.execute(ADVANCE_WATERMARK, {"upper_bound": 0, "name": ROLLUP_STATE_NAME})
+    db.commit()
+
+def get_watermark(db):
+    return db.execute(
+        text("SELECT watermark FROM rollup_state WHERE name = :name"), {"name": ROLLUP_STATE_NAME}
+    ).scalar() or 0
@@ -0,0 +1,80 @@
+"""
+Count database statements issued per POST /transactions/ request.
+
+Runs the API in-process (no uvicorn) against the database, MinIO and RabbitMQ
+configured in .env, e.g. the docker-compose stack, and reports the number of
+SQL statements per request broken down by statement type:
+
+    python benchmarks/bench_db_queries.py --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+from collections import Counter
+
+import httpx
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.main import app
+from api.core.config import settings
+from api.dependencies.database import async_engine
+from api.services.ml_model import FEATURE_COLUMNS
+
+def random_transaction():
+    transaction = {col: random.gauss(0.0, 1.0) for col in FEATURE_COLUMNS}
+    transaction["time"] = random.uniform(0, 172792)
+    transaction["amount"] = round(random.expovariate(1 / 88.0), 2)
+    return transaction
+
+async def run(n_requests):
+    statements = Counter()
+    
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        words = statement.split(None, 3)
+        kind = words[0].upper()
+        if kind in ("INSERT", "UPDATE", "DELETE"):
+            kind = f"{kind} {words[2] if kind != 'UPDATE' else words[1]}"
+        elif kind == "SELECT" and " FROM " in statement:
+            kind = f"SELECT {statement.split(' FROM ', 1)[1].split()[0]}"
+        statements[kind] += 1
+    
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 headers={"X-API-Key": settings.API_KEY}) as client:
+        # Warm-up request so connection setup and cache fills are not counted
+        await client.post("/transactions/", json=random_transaction())
+        
+        event.listen(async_engine.sync_engine, "before_cursor_execute", count_statement)
+        try:
+            for _ in range(n_requests):
+                response = await client.post("/transactions/", json=random_transaction())
+                response.raise_for_status()
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", count_statement)
+    
+    total = sum(statements.values())
+    return {
+        "requests": n_requests,
+        "statements_total": total,
+        "statements_per_request": total / n_requests,
+        "by_statement": {kind: count / n_requests for kind, count in statements.most_common()}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Count DB statements per scored transaction")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    
+    results = asyncio.run(run(args.requests))
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
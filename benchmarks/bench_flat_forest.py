@@ -0,0 +1,88 @@
+"""
+Parity check and latency benchmark: FlatForest vs RandomForestClassifier.predict_proba.
+
+Uses a pickled forest when --model is given, otherwise trains one with the
+production hyperparameters (100 trees, depth 15) on synthetic data:
+
+    python benchmarks/bench_flat_forest.py --model models/random_forest_model.pkl
+"""
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.services.flat_forest import FlatForest, verify_flat_forest
+
+def synthetic_forest(n_rows, n_features, seed):
+    from sklearn.ensemble import RandomForestClassifier
+    
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n_rows, n_features))
+    y = (X[:, 1] + 0.5 * X[:, 3] ** 2 + 0.5 * rng.standard_normal(n_rows)) > 2.0
+    model = RandomForestClassifier(
+        n_estimators=100, max_depth=15, min_samples_split=10, min_samples_leaf=4,
+        max_features='sqrt', class_weight='balanced', random_state=seed
+    )
+    return model.fit(X, y)
+
+def time_call(fn, X, repeats):
+    fn(X)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(X)
+        timings.append(time.perf_counter() - start)
+    timings_ms = np.array(timings) * 1000
+    return {
+        "p50_ms": float(np.percentile(timings_ms, 50)),
+        "p99_ms": float(np.percentile(timings_ms, 99)),
+        "per_row_us": float(np.percentile(timings_ms, 50) * 1000 / len(X))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the flat forest evaluator")
+    parser.add_argument("--model", help="Pickled RandomForestClassifier")
+    parser.add_argument("--batch-sizes", default="1,16,64,256,1024")
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    
+    if args.model:
+        with open(args.model, "rb") as f:
+            model = pickle.load(f)
+    else:
+        model = synthetic_forest(50000, 30, args.seed)
+    flat_forest = FlatForest.from_sklearn(model)
+    
+    rng = np.random.default_rng(args.seed + 1)
+    X_eval = rng.standard_normal((10000, model.n_features_in_))
+    max_diff = verify_flat_forest(model, flat_forest, X_eval)
+    
+    results = {
+        "n_trees": flat_forest.n_trees,
+        "n_nodes": flat_forest.n_nodes,
+        "max_depth": flat_forest.max_depth,
+        "parity_max_abs_diff": max_diff,
+        "batches": {}
+    }
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        X = X_eval[:batch_size]
+        repeats = max(5, args.repeats // max(1, batch_size // 64))
+        results["batches"][batch_size] = {
+            "sklearn": time_call(lambda rows: model.predict_proba(rows)[:, 1], X, repeats),
+            "flat_forest": time_call(flat_forest.predict_fraud_proba, X, repeats)
+        }
+    
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Microbenchmarks for the per-request CPU work in the scoring path: request
+parsing, feature assembly and model inference, single and batched.
+
+Runs on a bare machine. The model is --model-dir, else MODEL_LOCAL_DIR, else a
+forest with the production hyperparameters trained on synthetic data; inputs
+are sampled as in load_test.py, so a given --seed always measures the same
+rows:
+
+    python benchmarks/bench_micro.py --output micro.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from common import ROOT, save_results, transaction_payloads
+from fakes import benchmark_artifact, prepare_environment
+
+prepare_environment()
+sys.path.insert(0, ROOT)
+from api.schemas.transaction import TransactionCreate
+from api.services.ml_model import model_service
+
+def time_op(fn, inputs, repeats, rows=1):
+    # One input per call, cycled; a warm-up pass first so lazy setup is not timed
+    for item in inputs[:min(len(inputs), 10)]:
+        fn(item)
+    timings = []
+    for i in range(repeats):
+        item = inputs[i % len(inputs)]
+        start = time.perf_counter_ns()
+        fn(item)
+        timings.append(time.perf_counter_ns() - start)
+    timings_us = np.array(timings) / 1000
+    p50 = float(np.percentile(timings_us, 50))
+    return {
+        "rows": rows,
+        "p50_us": p50,
+        "p99_us": float(np.percentile(timings_us, 99)),
+        "mean_us": float(timings_us.mean()),
+        "per_row_us": p50 / rows,
+        "rows_per_s": rows * 1e6 / float(timings_us.mean())
+    }
+
+def chunks(payloads, size, count):
+    return [payloads[(i * size) % len(payloads):][:size] for i in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the scoring path")
+    parser.add_argument("--model-dir", help="Model artifact directory")
+    parser.add_argument("--data", default=os.path.join(ROOT, "data", "creditcard.csv"),
+                        help="Creditcard CSV to sample transactions from; synthetic rows if missing")
+    parser.add_argument("--batch-sizes", default="16,64,256,1024")
+    parser.add_argument("--repeats", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    artifact = benchmark_artifact(args.model_dir, args.seed)
+    model_service._set_artifact(artifact.with_model_id(1))
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+    payloads = transaction_payloads(max(4096, max(batch_sizes)), args.seed, args.data)
+    raw_payloads = [json.dumps(payload).encode() for payload in payloads]
+    transactions = [TransactionCreate(**payload) for payload in payloads]
+
+    benchmarks = {
+        "parse_json": time_op(TransactionCreate.model_validate_json, raw_payloads, args.repeats),
+        "parse_dict": time_op(lambda payload: TransactionCreate(**payload), payloads, args.repeats),
+        "dump": time_op(lambda transaction: transaction.dict(), transactions, args.repeats),
+        "feature_assembly_1": time_op(lambda payload: model_service.build_feature_matrix([payload]),
+                                      payloads, args.repeats),
+        "predict_1": time_op(model_service.predict, payloads, args.repeats)
+    }
+    for size in batch_sizes:
+        # Fewer repeats for large batches, so every size takes similar time
+        repeats = max(50, args.repeats // size)
+        batches = chunks(payloads, size, 64)
+        benchmarks[f"feature_assembly_{size}"] = time_op(model_service.build_feature_matrix, batches, repeats, size)
+        benchmarks[f"predict_batch_{size}"] = time_op(model_service.predict_batch, batches, repeats, size)
+
+    save_results({
+        "model": {
+            "version": artifact.version,
+            "n_trees": artifact.manifest["n_trees"],
+            "synthetic": artifact.manifest["metadata"].get("synthetic", False)
+        },
+        "repeats": args.repeats,
+        "seed": args.seed,
+        "benchmarks": benchmarks
+    }, args.output)
+
+if __name__ == "__main__":
+    main()
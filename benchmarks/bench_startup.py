@@ -0,0 +1,92 @@
+"""
+Cold-start benchmark for the API process.
+
+Each run imports api.main in a fresh interpreter, then drives the app lifespan
+the way uvicorn does, and reports the import time, the time until the lifespan
+yields (i.e. until the first request could be served), per-service startup
+times and the shutdown time. Dependencies come from .env; unreachable ones show
+up as services still starting or failed, bounded by STARTUP_TIMEOUT_SECONDS:
+
+    python benchmarks/bench_startup.py --runs 5 --output startup.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def child():
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    from api.main import app, services
+    imported = time.perf_counter()
+
+    async def lifespan():
+        async with app.router.lifespan_context(app):
+            serving = time.perf_counter()
+            status = services.status()
+            ready = services.ready()
+        return serving, status, ready, time.perf_counter()
+
+    serving, status, ready, stopped = asyncio.run(lifespan())
+    print(json.dumps({
+        "import_seconds": imported - started,
+        "startup_seconds": serving - imported,
+        "time_to_serve_seconds": serving - started,
+        "shutdown_seconds": stopped - serving,
+        "ready": ready,
+        "services": status
+    }))
+
+def run_once():
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup run failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def summarize(values):
+    values = np.array(values)
+    return {"p50": float(np.percentile(values, 50)), "max": float(values.max())}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API import and startup time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    runs = [run_once() for _ in range(args.runs)]
+    results = {
+        "runs": args.runs,
+        **{
+            key: summarize([run[key] for run in runs])
+            for key in ("import_seconds", "startup_seconds", "time_to_serve_seconds", "shutdown_seconds")
+        },
+        "ready": [run["ready"] for run in runs],
+        "services": {
+            name: summarize([run["services"][name]["startup_seconds"] or 0.0 for run in runs])
+            for name in runs[0]["services"]
+        },
+        "last_run": runs[-1]
+    }
+
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
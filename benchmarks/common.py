@@ -0,0 +1,72 @@
+"""
+Shared helpers for the benchmark scripts: run metadata, transaction payloads
+and writing results.
+"""
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FEATURE_COLUMNS = ["time"] + [f"v{i}" for i in range(1, 29)] + ["amount"]
+
+def environment():
+    # Recorded with every result, so a comparison can tell a code change from a machine change
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+def transaction_payloads(n, seed, data_path=None):
+    """
+    n transaction payloads, reproducible for a given seed.
+
+    Rows are drawn from the creditcard dataset when data_path exists, otherwise
+    from a synthetic approximation of it: standard normal PCA features, the
+    dataset's two-day time range and an exponential amount with its mean.
+    """
+    rng = np.random.default_rng(seed)
+    if data_path and os.path.exists(data_path):
+        import pandas as pd
+
+        frame = pd.read_csv(data_path)
+        frame.columns = [column.lower() for column in frame.columns]
+        rows = frame[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+        values = rows[rng.integers(0, len(rows), size=n)]
+    else:
+        values = rng.standard_normal((n, len(FEATURE_COLUMNS)))
+        values[:, 0] = rng.uniform(0, 172792, size=n)
+        values[:, -1] = np.round(rng.exponential(88.0, size=n), 2)
+    return [dict(zip(FEATURE_COLUMNS, map(float, row))) for row in values]
+
+def latency_summary(seconds):
+    values_ms = np.asarray(seconds, dtype=np.float64) * 1000
+    if not len(values_ms):
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    return {
+        "p50": float(np.percentile(values_ms, 50)),
+        "p95": float(np.percentile(values_ms, 95)),
+        "p99": float(np.percentile(values_ms, 99)),
+        "max": float(values_ms.max())
+    }
+
+def save_results(results, output=None):
+    results = {"environment": environment(), **results}
+    print(json.dumps(results, indent=4))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=4)
+    return results
@@ -0,0 +1,101 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+Works on the JSON written by any script here with --output. Numeric values are
+matched by their path in the file. Latencies and durations (p50, p99, *_ms,
+*_us, *_seconds, ...) and error counts should go down; throughputs (*_rps,
+*_per_s) should go up. Everything else, and the environment block, is context
+and is not compared. Exits with status 1 if any metric got worse by more than
+--threshold, so it can gate CI:
+
+    python benchmarks/compare.py baseline/micro.json micro.json --threshold 0.10
+"""
+import argparse
+import json
+import re
+import sys
+
+LOWER_IS_BETTER = re.compile(r"(^(p\d+|max|mean|errors)$|_ms$|_us$|_seconds$)")
+HIGHER_IS_BETTER = re.compile(r"(_rps$|_per_s$|^throughput)")
+# Inputs and measured context rather than results
+IGNORED = re.compile(r"(^target_rps$|^offered_rps$|^db_latency_ms$|^storage_latency_ms$|^duration_s$)")
+
+def flatten(results, prefix=()):
+    for key, value in results.items():
+        path = prefix + (str(key),)
+        if isinstance(value, dict):
+            if path != ("environment",):
+                yield from flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, float(value)
+
+def direction(path):
+    # The innermost key that says what is measured: "p99" under "latency_ms" is a latency
+    for key in reversed(path):
+        if IGNORED.search(key):
+            return None
+        if HIGHER_IS_BETTER.search(key):
+            return 1
+        if LOWER_IS_BETTER.search(key):
+            return -1
+    return None
+
+def compare(baseline, candidate, threshold):
+    baseline_values = dict(flatten(baseline))
+    rows = []
+    for path, value in flatten(candidate):
+        sign = direction(path)
+        if sign is None or path not in baseline_values:
+            continue
+        base = baseline_values[path]
+        if base == 0:
+            change = 0.0 if value == 0 else float("inf") * (1 if value > 0 else -1)
+        else:
+            change = (value - base) / abs(base)
+        # Positive means worse, whichever way the metric points
+        worse = -change * sign
+        rows.append({
+            "metric": ".".join(path),
+            "baseline": base,
+            "candidate": value,
+            "change": change,
+            "status": "REGRESSION" if worse > threshold else "improved" if worse < -threshold else "ok"
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change that counts as a regression")
+    parser.add_argument("--all", action="store_true", help="Also list metrics within the threshold")
+    parser.add_argument("--output", help="Write the comparison as JSON to this file")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    rows = compare(baseline, candidate, args.threshold)
+    regressions = [row for row in rows if row["status"] == "REGRESSION"]
+
+    for name, results in ((args.baseline, baseline), (args.candidate, candidate)):
+        environment = results.get("environment", {})
+        print(f"{name}: commit {environment.get('git_commit')}, python {environment.get('python')}, "
+              f"{environment.get('cpu_count')} CPUs, {environment.get('platform')}")
+    width = max([len(row["metric"]) for row in rows] + [6])
+    print(f"{'metric':<{width}}  {'baseline':>12}  {'candidate':>12}  {'change':>8}  status")
+    for row in rows:
+        if args.all or row["status"] != "ok":
+            print(f"{row['metric']:<{width}}  {row['baseline']:>12.4g}  {row['candidate']:>12.4g}  "
+                  f"{row['change']:>+8.1%}  {row['status']}")
+    print(f"{len(rows)} metrics compared, {len(regressions)} regressions over {args.threshold:.0%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"threshold": args.threshold, "metrics": rows}, f, indent=4)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+In-process stand-ins for PostgreSQL, MinIO and RabbitMQ, so the benchmarks run
+on a bare machine.
+
+Only the I/O is replaced. Requests still go through routing, validation,
+the micro-batcher, the real model, the archiver's buffering and the
+publisher's I/O thread; the fakes answer where the network would, after an
+optional fixed latency. Numbers from this mode measure the service's own
+overhead, not the dependencies.
+
+prepare_environment() must run before anything under api is imported, since
+Settings is read at import time.
+"""
+import asyncio
+import itertools
+import os
+import queue
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pika
+
+PLACEHOLDER_SETTINGS = {
+    "API_KEY": "benchmark",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "fraud_detection",
+    "POSTGRES_USER": "benchmark",
+    "POSTGRES_PASSWORD": "benchmark",
+    "MINIO_ENDPOINT": "http://localhost:9000",
+    "MINIO_ACCESS_KEY": "benchmark",
+    "MINIO_SECRET_KEY": "benchmark",
+    "MINIO_BUCKET": "fraud-detection",
+    "RABBITMQ_HOST": "localhost",
+    "RABBITMQ_PORT": "5672",
+    "RABBITMQ_USER": "benchmark",
+    "RABBITMQ_PASSWORD": "benchmark",
+    "RABBITMQ_QUEUE_TRANSACTIONS": "transactions",
+    "RABBITMQ_QUEUE_PROCESSED": "processed_transactions"
+}
+
+def prepare_environment():
+    # Placeholders for the required settings; values already set (or in .env) still apply to tunables
+    for name, value in PLACEHOLDER_SETTINGS.items():
+        os.environ.setdefault(name, value)
+    return os.environ["API_KEY"]
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def one(self):
+        return self._rows[0]
+
+    def all(self):
+        return self._rows
+
+    def scalars(self):
+        return SimpleNamespace(first=lambda: None, all=lambda: [])
+
+class FakeAsyncSession:
+    """
+    AsyncSession for the write path. Every statement returns freshly numbered
+    rows, one per parameter set, shaped like the RETURNING clauses.
+    """
+    def __init__(self, database):
+        self.database = database
+
+    async def execute(self, statement, params=None):
+        await self.database.round_trip()
+        n = len(params) if isinstance(params, list) else 1
+        return FakeResult([self.database.next_row() for _ in range(n)])
+
+    async def commit(self):
+        await self.database.round_trip()
+
+    async def rollback(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+class FakeDatabase:
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000.0
+        self.statements = 0
+        self._ids = itertools.count(1)
+
+    async def round_trip(self):
+        self.statements += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def next_row(self):
+        row_id = next(self._ids)
+        return SimpleNamespace(transaction_id=row_id, processed_at=datetime.now(), prediction_id=row_id)
+
+    def session(self):
+        return FakeAsyncSession(self)
+
+    async def get_session(self):
+        # Replaces the get_async_db dependency
+        yield self.session()
+
+class FakeStorage:
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000.0
+        self.objects = 0
+        self.bytes = 0
+
+    def store_bytes(self, key, data, content_type="application/octet-stream"):
+        if self.latency:
+            time.sleep(self.latency)
+        self.objects += 1
+        self.bytes += len(data)
+        return key
+
+    def store_archive(self, key, data):
+        return self.store_bytes(key, data)
+
+    def ensure_bucket(self):
+        pass
+
+    def ping(self):
+        return True
+
+class FakeIOLoop:
+    def __init__(self):
+        self._callbacks = queue.SimpleQueue()
+        self._running = False
+
+    def add_callback_threadsafe(self, callback):
+        self._callbacks.put(callback)
+
+    def start(self):
+        self._running = True
+        while self._running:
+            self._callbacks.get()()
+
+    def stop(self):
+        self._running = False
+        self._callbacks.put(lambda: None)
+
+class FakeChannel:
+    is_open = True
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._confirm = None
+        self._delivery_tag = 0
+        self._confirmed_tag = 0
+
+    def add_on_close_callback(self, callback):
+        pass
+
+    def confirm_delivery(self, ack_nack_callback):
+        self._confirm = ack_nack_callback
+
+    def queue_declare(self, queue, durable, callback):
+        self.connection.ioloop.add_callback_threadsafe(lambda: callback(None))
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self._delivery_tag += 1
+        self.connection.published += 1
+        # One multiple=True ack per burst, the way a broker confirms under load
+        if self._delivery_tag == self._confirmed_tag + 1:
+            self.connection.ioloop.add_callback_threadsafe(self._ack)
+
+    def _ack(self):
+        self._confirmed_tag = self._delivery_tag
+        self._confirm(SimpleNamespace(method=pika.spec.Basic.Ack(delivery_tag=self._confirmed_tag, multiple=True)))
+
+class FakeBrokerConnection:
+    """
+    Connection factory for RabbitMQPublisher: a SelectConnection lookalike
+    whose broker acknowledges every publish.
+    """
+    def __init__(self, on_open, on_open_error, on_close):
+        self.ioloop = FakeIOLoop()
+        self.is_closed = False
+        self.published = 0
+        self._on_close = on_close
+        self.ioloop.add_callback_threadsafe(lambda: on_open(self))
+
+    def add_on_connection_blocked_callback(self, callback):
+        pass
+
+    def add_on_connection_unblocked_callback(self, callback):
+        pass
+
+    def channel(self, on_open_callback):
+        channel = FakeChannel(self)
+        self.ioloop.add_callback_threadsafe(lambda: on_open_callback(channel))
+
+    def close(self):
+        if not self.is_closed:
+            self.is_closed = True
+            self._on_close(self, "closed")
+
+def benchmark_artifact(model_dir=None, seed=42):
+    """
+    The artifact to benchmark: model_dir, else the local production artifact,
+    else a forest with the production hyperparameters trained on synthetic data.
+    """
+    from api.core.config import settings
+    from api.services.flat_forest import FlatForest
+    from api.services.ml_model import FEATURE_COLUMNS
+    from api.services.model_artifact import MANIFEST_FILE, load_model_artifact, save_model_artifact
+
+    for directory in (model_dir, settings.MODEL_LOCAL_DIR):
+        if directory and os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+            return load_model_artifact(directory)
+
+    from bench_flat_forest import synthetic_forest
+
+    model = synthetic_forest(20000, len(FEATURE_COLUMNS), seed)
+    directory = tempfile.mkdtemp(prefix="benchmark_model_")
+    save_model_artifact(
+        directory, FlatForest.from_sklearn(model), FEATURE_COLUMNS,
+        scaler_mean=[0.0] * len(FEATURE_COLUMNS), scaler_scale=[1.0] * len(FEATURE_COLUMNS),
+        metadata={"synthetic": True}
+    )
+    return load_model_artifact(directory)
+
+class InProcessServices:
+    """
+    Points the app's dependencies at the fakes and starts the background
+    services the request path uses, without running the app lifespan.
+    """
+    def __init__(self, app, artifact, db_latency_ms=0.0, storage_latency_ms=0.0):
+        from api.controllers import transaction as transaction_controller
+        from api.dependencies.database import get_async_db
+        from api.services.archiver import transaction_archiver
+        from api.services.message_queue import rabbitmq_client
+        from api.services.ml_model import model_service
+
+        self.database = FakeDatabase(db_latency_ms)
+        self.storage = FakeStorage(storage_latency_ms)
+        self.archiver = transaction_archiver
+        self.publisher = rabbitmq_client.publisher
+        self.group_committer = transaction_controller.group_committer
+
+        app.dependency_overrides[get_async_db] = self.database.get_session
+        if self.group_committer is not None:
+            self.group_committer.session_factory = self.database.session
+        self.archiver.storage = self.storage
+        self.publisher.connection_factory = FakeBrokerConnection
+        # Attributed as if the registry had activated it, so no lookup is needed
+        model_service._set_artifact(artifact.with_model_id(1))
+
+    async def __aenter__(self):
+        self.archiver.start()
+        self.publisher.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.group_committer is not None:
+            await self.group_committer.close()
+        self.publisher.close()
+        self.archiver.close()
+
+    def stats(self):
+        return {
+            "db_statements": self.database.statements,
+            "archived_objects": self.storage.objects,
+            "archived_bytes": self.storage.bytes,
+            **{
+                f"publisher_{key}": value for key, value in self.publisher.stats().items()
+                if key in ("published_total", "confirmed_total", "dropped_total", "spooled_total")
+            }
+        }
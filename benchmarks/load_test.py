@@ -0,0 +1,201 @@
+"""
+Load test for the transaction scoring endpoint.
+
+Closed loop (default): a fixed number of concurrent clients, each sending its
+next request as soon as the previous one returns. Reports the throughput the
+service sustains at that concurrency.
+
+Open loop (--rps): requests are sent on a fixed schedule, evenly spaced or with
+Poisson arrivals, whether or not earlier ones have returned. Latency is
+measured from each request's scheduled send time, so a stall shows up in the
+percentiles instead of silently slowing the generator down.
+
+Payloads are rows sampled from the creditcard dataset (--data), or synthetic
+rows of the same shape when the file is missing; a given --seed always
+replays the same sequence. With --in-process the app runs in this process
+against the fakes in fakes.py, so no PostgreSQL, MinIO or RabbitMQ is needed:
+
+    python benchmarks/load_test.py --url http://localhost:8000 --api-key KEY \
+        --concurrency 64 --duration 30 --output results_async.json
+    python benchmarks/load_test.py --in-process --rps 500 --duration 30 --output load.json
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import httpx
+import numpy as np
+
+from common import ROOT, latency_summary, save_results, transaction_payloads
+
+async def client_loop(client, path, payloads, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.post(path, json=next(payloads))
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+async def closed_loop(client, args, payloads):
+    latencies = []
+    errors = []
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*[
+        client_loop(client, args.path, payloads, deadline, latencies, errors)
+        for _ in range(args.concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": args.concurrency,
+        "duration_s": elapsed,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": len(latencies) / elapsed,
+        "latency_ms": latency_summary(latencies)
+    }
+
+def arrival_offsets(args, rng):
+    n = int(args.rps * args.duration)
+    if args.arrival == "poisson":
+        return np.cumsum(rng.exponential(1.0 / args.rps, size=n))
+    return np.arange(n) / args.rps
+
+async def open_loop(client, args, payloads, rng):
+    latencies = []
+    service_times = []
+    errors = []
+    in_flight = asyncio.Semaphore(args.max_in_flight)
+
+    async def send(scheduled, payload):
+        # Waiting for a free slot counts towards latency, as it would for a real caller
+        async with in_flight:
+            sent = time.perf_counter()
+            try:
+                response = await client.post(args.path, json=payload)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+                    return
+            except httpx.HTTPError as e:
+                errors.append(type(e).__name__)
+                return
+            finished = time.perf_counter()
+        latencies.append(finished - scheduled)
+        service_times.append(finished - sent)
+
+    offsets = arrival_offsets(args, rng)
+    tasks = []
+    started = time.perf_counter()
+    for offset in offsets:
+        scheduled = started + offset
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(scheduled, next(payloads))))
+    sent = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    return {
+        "target_rps": args.rps,
+        "arrival": args.arrival,
+        "max_in_flight": args.max_in_flight,
+        "duration_s": elapsed,
+        "requests": len(latencies),
+        "errors": len(errors),
+        # Below target_rps when the generator itself could not keep up
+        "offered_rps": len(offsets) / (sent - started) if sent > started else 0.0,
+        "throughput_rps": len(latencies) / elapsed,
+        "latency_ms": latency_summary(latencies),
+        "service_time_ms": latency_summary(service_times)
+    }
+
+def cycle(payloads):
+    while True:
+        yield from payloads
+
+async def drive(client, args):
+    rng = np.random.default_rng(args.seed)
+    payloads = cycle(transaction_payloads(args.payloads, args.seed, args.data))
+    if args.rps:
+        return await open_loop(client, args, payloads, rng)
+    return await closed_loop(client, args, payloads)
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.url,
+        headers={"X-API-Key": args.api_key},
+        limits=limits,
+        timeout=args.timeout
+    ) as client:
+        results = await drive(client, args)
+    return {"mode": "http", "url": args.url + args.path, **results}
+
+async def run_in_process(args):
+    # The app, its background threads and the generator share this process and
+    # its GIL, so absolute numbers are lower than against a separate server
+    from fakes import InProcessServices, benchmark_artifact, prepare_environment
+
+    api_key = prepare_environment()
+    sys.path.insert(0, ROOT)
+    from api.main import app
+
+    artifact = benchmark_artifact(args.model_dir, args.seed)
+    async with InProcessServices(app, artifact, args.db_latency_ms, args.storage_latency_ms) as services:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://benchmark",
+            headers={"X-API-Key": api_key},
+            timeout=args.timeout
+        ) as client:
+            results = await drive(client, args)
+    # Read after shutdown, once the archiver and publisher have flushed
+    stats = services.stats()
+    return {
+        "mode": "in_process",
+        "model_version": artifact.version,
+        "db_latency_ms": args.db_latency_ms,
+        "storage_latency_ms": args.storage_latency_ms,
+        **results,
+        "fakes": stats
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test POST /transactions/")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/transactions/")
+    parser.add_argument("--api-key", help="Required unless --in-process")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rps", type=float, help="Open-loop arrival rate; closed loop when omitted")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="poisson")
+    parser.add_argument("--max-in-flight", type=int, default=1024, help="Open-loop cap on outstanding requests")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--data", default=os.path.join(ROOT, "data", "creditcard.csv"),
+                        help="Creditcard CSV to sample transactions from; synthetic rows if missing")
+    parser.add_argument("--payloads", type=int, default=10000, help="Distinct transactions to cycle through")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--in-process", action="store_true", help="Serve the app in this process against fakes")
+    parser.add_argument("--model-dir", help="Model artifact for --in-process; defaults to MODEL_LOCAL_DIR")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="Simulated round trip per statement")
+    parser.add_argument("--storage-latency-ms", type=float, default=0.0, help="Simulated archive upload time")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    if not args.in_process and not args.api_key:
+        parser.error("--api-key is required unless --in-process")
+    # httpx logs every request at INFO, which would cost as much as the requests in process
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = asyncio.run(run_in_process(args) if args.in_process else run(args))
+    save_results(results, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 -- init_database.sql - Initialize Fraud Detection Database
 
 -- Drop tables if they exist (for clean setup)
+DROP TABLE IF EXISTS transaction_rollups;
+DROP TABLE IF EXISTS rollup_state;
 DROP TABLE IF EXISTS fraud_predictions;
 DROP TABLE IF EXISTS transactions;
 DROP TABLE IF EXISTS ml_models;
@@ -22,7 +24,11 @@ CREATE TABLE transactions (
 );
 
 -- Create index on commonly queried fields
-CREATE INDEX idx_transactions_fraud ON transactions(is_fraud);
+-- Keyset pagination filters on one column and walks transaction_id in order
+CREATE INDEX idx_transactions_fraud_id ON transactions(is_fraud, transaction_id);
+CREATE INDEX idx_transactions_source_id ON transactions(source, transaction_id);
+-- processed_at grows with transaction_id, so a BRIN index serves time ranges at a tiny size
+CREATE INDEX idx_transactions_processed_at ON transactions USING BRIN (processed_at);
 CREATE INDEX idx_transactions_time ON transactions(time);
 CREATE INDEX idx_transactions_amount ON transactions(amount);
 
@@ -33,7 +39,8 @@ CREATE TABLE ml_models (
     description TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     performance_metrics JSONB,
-    active BOOLEAN DEFAULT FALSE
+    active BOOLEAN DEFAULT FALSE,
+    version VARCHAR(64)  -- Model artifact version served for this row
 );
 
 -- Create table for predictions
@@ -49,10 +56,31 @@ CREATE TABLE fraud_predictions (
     explanation JSONB
 );
 
--- Create index on foreign keys
-CREATE INDEX idx_predictions_transaction ON fraud_predictions(transaction_id);
+-- Create index on foreign keys; one prediction per transaction, so a redelivered message cannot add a second
+CREATE UNIQUE INDEX idx_predictions_transaction ON fraud_predictions(transaction_id);
 CREATE INDEX idx_predictions_model ON fraud_predictions(model_id);
 
+-- Pre-aggregated analytics, maintained incrementally behind a transaction_id watermark
+CREATE TABLE transaction_rollups (
+    granularity VARCHAR(10) NOT NULL,   -- minute, hour or day
+    bucket_start TIMESTAMPTZ NOT NULL,
+    source VARCHAR(50) NOT NULL,
+    model_id INTEGER NOT NULL,          -- 0 for transactions that were never scored
+    transaction_count BIGINT NOT NULL DEFAULT 0,
+    fraud_count BIGINT NOT NULL DEFAULT 0,
+    total_amount FLOAT NOT NULL DEFAULT 0,
+    fraud_amount FLOAT NOT NULL DEFAULT 0,
+    scored_count BIGINT NOT NULL DEFAULT 0,
+    fraud_probability_sum FLOAT NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, bucket_start, source, model_id)
+);
+
+CREATE TABLE rollup_state (
+    name VARCHAR(50) PRIMARY KEY,
+    watermark BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create view for fraud detection performance
 CREATE OR REPLACE VIEW fraud_detection_performance AS
 SELECT 
@@ -2,6 +2,9 @@ import asyncio
 import asyncpg
 import pandas as pd
 import os
+import json
+import argparse
+from itertools import repeat
 from pathlib import Path
 import time
 from dotenv import load_dotenv
@@ -10,18 +13,125 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('data_loader')
 
-async def load_data_to_postgres():
+TABLE = "transactions"
+CSV_COLUMNS = ["Time"] + [f"V{i}" for i in range(1, 29)] + ["Amount", "Class"]
+TABLE_COLUMNS = ["time"] + [f"v{i}" for i in range(1, 29)] + ["amount", "is_fraud", "source"]
+
+def chunk_records(chunk):
+    # Column-wise conversion: one tolist() per column instead of Python work per field
+    columns = [chunk[col].tolist() for col in CSV_COLUMNS[:-1]]
+    columns.append(chunk["Class"].astype(bool).tolist())
+    columns.append(repeat("dataset", len(chunk)))
+    return list(zip(*columns))
+
+class Checkpoint:
+    """
+    Progress of one load, persisted after every committed chunk.
+
+    Each chunk is copied in its own transaction, so the set of completed chunks
+    is exact and a resumed load skips them without duplicating rows. Dropped
+    index definitions are saved too, so an interrupted load can still rebuild them.
+    """
+    def __init__(self, path, data_file, chunksize):
+        self.path = Path(path)
+        self.source = {
+            "file": str(data_file.resolve()),
+            "size": data_file.stat().st_size,
+            "chunksize": chunksize
+        }
+        self.completed = set()
+        self.rows = 0
+        self.dropped_indexes = []
+
+    def load(self):
+        if not self.path.exists():
+            return False
+        with open(self.path) as f:
+            state = json.load(f)
+        if state["source"] != self.source:
+            raise ValueError(
+                f"Checkpoint {self.path} belongs to a different file or chunk size; "
+                f"remove it or pass --restart"
+            )
+        self.completed = set(state["completed"])
+        self.rows = state["rows"]
+        self.dropped_indexes = state["dropped_indexes"]
+        return True
+
+    def save(self):
+        state = {
+            "source": self.source,
+            "completed": sorted(self.completed),
+            "rows": self.rows,
+            "dropped_indexes": self.dropped_indexes
+        }
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if self.path.exists():
+            self.path.unlink()
+
+async def drop_secondary_indexes(pool):
+    # Everything except indexes that back constraints (the primary key)
+    async with pool.acquire() as conn:
+        rows = await conn.fetch('''
+            SELECT i.indexname, i.indexdef
+            FROM pg_indexes i
+            WHERE i.tablename = $1
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)
+        ''', TABLE)
+        for row in rows:
+            await conn.execute(f'DROP INDEX IF EXISTS "{row["indexname"]}"')
+    return [{"name": row["indexname"], "definition": row["indexdef"]} for row in rows]
+
+async def rebuild_indexes(pool, indexes):
+    async def create(index):
+        started = time.perf_counter()
+        async with pool.acquire() as conn:
+            await conn.execute(index["definition"])
+        logger.info(f"Rebuilt index {index['name']} in {time.perf_counter() - started:.2f} seconds")
+
+    # Independent indexes build in parallel, one pool connection each
+    await asyncio.gather(*(create(index) for index in indexes))
+    async with pool.acquire() as conn:
+        await conn.execute(f"ANALYZE {TABLE}")
+
+class Progress:
+    def __init__(self, already_loaded, report_interval=5.0):
+        self.started = time.perf_counter()
+        self.already_loaded = already_loaded
+        self.rows = 0
+        self.report_interval = report_interval
+        self.last_report = self.started
+
+    def add(self, rows):
+        self.rows += rows
+        now = time.perf_counter()
+        if now - self.last_report >= self.report_interval:
+            self.last_report = now
+            logger.info(
+                f"Loaded {self.already_loaded + self.rows} rows "
+                f"({self.rows / (now - self.started):,.0f} rows/sec)"
+            )
+
+    def rate(self):
+        return self.rows / max(time.perf_counter() - self.started, 1e-9)
+
+async def load_data_to_postgres(data_file, chunksize=100000, concurrency=4, drop_indexes=False,
+                                checkpoint_path="data/.load_checkpoint.json", restart=False):
     load_dotenv()
-    data_file = Path("data/creditcard.csv")
-    
+
     if not data_file.exists():
         logger.error(f"Error: Dataset file not found at {data_file}")
         return
-    
+
     file_size_mb = data_file.stat().st_size / (1024 * 1024)
     logger.info(f"Loading data from {data_file}...")
     logger.info(f"File size: {file_size_mb:.2f} MB")
-    
+
     db_config = {
         'host': os.getenv('POSTGRES_HOST', 'localhost'),
         'port': os.getenv('POSTGRES_PORT', '5432'),
@@ -29,68 +139,105 @@ async def load_data_to_postgres():
         'user': os.getenv('POSTGRES_USER'),
         'password': os.getenv('POSTGRES_PASSWORD')
     }
-    
+
+    checkpoint = Checkpoint(checkpoint_path, data_file, chunksize)
+    if restart:
+        checkpoint.remove()
+    elif checkpoint.load():
+        logger.info(f"Resuming: {len(checkpoint.completed)} chunks ({checkpoint.rows} rows) already loaded")
+
     logger.info("Creating database connection pool")
-    
-    batch_size = 5000
-    
-    start_time = time.time()
-    total_rows = 0
-    
-    pool = await asyncpg.create_pool(**db_config, min_size=3, max_size=10)
-    
+    # One connection per chunk in flight
+    pool = await asyncpg.create_pool(**db_config, min_size=1, max_size=concurrency)
+    progress = Progress(checkpoint.rows)
+    tasks = set()
+
     try:
-        reader = pd.read_csv(data_file, batch_size=batch_size)
-        
-        for chunk_num, chunk in enumerate(reader):
-            logger.info(f"Processing chunk {chunk_num+1} with {len(chunk)} rows")
-            
-            if 'Class' in chunk.columns:
-                chunk = chunk.rename(columns={'Class': 'is_fraud'})
-            
-            batch_data = []
-            for _, row in chunk.iterrows():
-                batch_data.append((
-                    float(row['Time']),
-                    float(row['V1']), float(row['V2']), float(row['V3']), 
-                    float(row['V4']), float(row['V5']), float(row['V6']), 
-                    float(row['V7']), float(row['V8']), float(row['V9']), 
-                    float(row['V10']), float(row['V11']), float(row['V12']), 
-                    float(row['V13']), float(row['V14']), float(row['V15']), 
-                    float(row['V16']), float(row['V17']), float(row['V18']), 
-                    float(row['V19']), float(row['V20']), float(row['V21']), 
-                    float(row['V22']), float(row['V23']), float(row['V24']), 
-                    float(row['V25']), float(row['V26']), float(row['V27']), 
-                    float(row['V28']), float(row['Amount']), 
-                    bool(row['is_fraud']), 'dataset'
-                ))
-            
-            async with pool.acquire() as conn:
-                async with conn.transaction():
-                    await conn.executemany('''
-                        INSERT INTO transactions (
-                            time, 
-                            v1, v2, v3, v4, v5, v6, v7, v8, v9, v10,
-                            v11, v12, v13, v14, v15, v16, v17, v18, v19, v20,
-                            v21, v22, v23, v24, v25, v26, v27, v28,
-                            amount, is_fraud, source
-                        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, 
-                                $13, $14, $15, $16, $17, $18, $19, $20, $21, $22, 
-                                $23, $24, $25, $26, $27, $28, $29, $30, $31, $32)
-                    ''', batch_data)
-            
-            total_rows += len(chunk)
-            logger.info(f"Inserted {total_rows} rows so far")
-            
-        elapsed_time = time.time() - start_time
+        if drop_indexes and not checkpoint.dropped_indexes:
+            checkpoint.dropped_indexes = await drop_secondary_indexes(pool)
+            checkpoint.save()
+            logger.info(f"Dropped indexes: {[index['name'] for index in checkpoint.dropped_indexes]}")
+
+        in_flight = asyncio.Semaphore(concurrency)
+
+        async def copy_chunk(chunk_num, chunk):
+            try:
+                records = chunk_records(chunk)
+                async with pool.acquire() as conn:
+                    async with conn.transaction():
+                        await conn.copy_records_to_table(TABLE, records=records, columns=TABLE_COLUMNS)
+                checkpoint.completed.add(chunk_num)
+                checkpoint.rows += len(records)
+                checkpoint.save()
+                progress.add(len(records))
+            finally:
+                in_flight.release()
+
+        reader = pd.read_csv(
+            data_file,
+            usecols=CSV_COLUMNS,
+            dtype={col: "float64" for col in CSV_COLUMNS[:-1]},
+            chunksize=chunksize
+        )
+        chunk_num = 0
+        while True:
+            # Parse the next chunk in a thread while earlier chunks are being copied
+            chunk = await asyncio.to_thread(next, reader, None)
+            if chunk is None:
+                break
+            if chunk_num not in checkpoint.completed:
+                await in_flight.acquire()
+                task = asyncio.create_task(copy_chunk(chunk_num, chunk))
+                tasks.add(task)
+                # Surface a failed copy immediately instead of after the whole file
+                for done in [t for t in tasks if t.done()]:
+                    tasks.discard(done)
+                    done.result()
+            chunk_num += 1
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
+        if checkpoint.dropped_indexes:
+            logger.info("Rebuilding indexes")
+            await rebuild_indexes(pool, checkpoint.dropped_indexes)
+            checkpoint.dropped_indexes = []
+            checkpoint.save()
+
+        elapsed_time = time.perf_counter() - progress.started
         logger.info(f"Data loading completed in {elapsed_time:.2f} seconds")
-        logger.info(f"Total rows inserted: {total_rows}")
-        
+        logger.info(f"Rows inserted by this run: {progress.rows} ({progress.rate():,.0f} rows/sec)")
+        logger.info(f"Total rows loaded: {checkpoint.rows}")
+        checkpoint.remove()
+
     except Exception as e:
         logger.error(f"Error loading data: {e}")
+        for task in tasks:
+            task.cancel()
+        logger.error(f"Progress is saved in {checkpoint.path}; rerun to resume")
     finally:
         await pool.close()
         logger.info("Database connection pool closed")
 
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load the credit card dataset with binary COPY")
+    parser.add_argument("--file", default="data/creditcard.csv", help="CSV file to load")
+    parser.add_argument("--chunksize", type=int, default=100000, help="Rows per COPY transaction")
+    parser.add_argument("--concurrency", type=int, default=4, help="Chunks copied in parallel")
+    parser.add_argument("--drop-indexes", action="store_true",
+                        help="Drop secondary indexes during the load and rebuild them afterwards")
+    parser.add_argument("--checkpoint", default="data/.load_checkpoint.json", help="Progress checkpoint file")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    asyncio.run(load_data_to_postgres(
+        Path(args.file),
+        chunksize=args.chunksize,
+        concurrency=args.concurrency,
+        drop_indexes=args.drop_indexes,
+        checkpoint_path=args.checkpoint,
+        restart=args.restart
+    ))
+
 if __name__ == "__main__":
-    asyncio.run(load_data_to_postgres())
\ No newline at end of file
+    main()
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import argparse
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.core.config import settings
+from api.dependencies.database import SessionLocal, Base, engine
+from api.models.analytics import TransactionRollup, RollupState
+from api.services.rollups import refresh_rollups, reset_rollups, get_watermark
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('rollups')
+
+def catch_up(db, batch_rows, settle_seconds):
+    started = time.perf_counter()
+    start_watermark = get_watermark(db)
+    steps = 0
+    while True:
+        watermark = refresh_rollups(db, batch_rows, settle_seconds)
+        if watermark is None:
+            break
+        steps += 1
+        if steps % 10 == 0:
+            logger.info(f"Rolled up to transaction_id {watermark} ({steps} steps)")
+    if steps == 0:
+        return
+    final = get_watermark(db)
+    logger.info(
+        f"Rollups at transaction_id {final}: {final - start_watermark} ids folded in "
+        f"{steps} steps, {time.perf_counter() - started:.2f} seconds"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the analytics rollup tables")
+    parser.add_argument("command", choices=["backfill", "refresh", "run"],
+                        help="backfill: rebuild from scratch; refresh: catch up once; run: keep catching up")
+    parser.add_argument("--batch-rows", type=int, default=settings.ROLLUP_BATCH_ROWS,
+                        help="Transactions folded in per database transaction")
+    parser.add_argument("--settle-seconds", type=float, default=settings.ROLLUP_SETTLE_SECONDS,
+                        help="Leave transactions younger than this for a later step")
+    parser.add_argument("--interval", type=float, default=settings.ROLLUP_REFRESH_INTERVAL_SECONDS,
+                        help="run: seconds between catch-ups")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine, tables=[TransactionRollup.__table__, RollupState.__table__])
+    db = SessionLocal()
+    try:
+        if args.command == "backfill":
+            logger.info("Clearing rollups for a full rebuild")
+            reset_rollups(db)
+            catch_up(db, args.batch_rows, args.settle_seconds)
+        elif args.command == "refresh":
+            catch_up(db, args.batch_rows, args.settle_seconds)
+        else:
+            while True:
+                catch_up(db, args.batch_rows, args.settle_seconds)
+                time.sleep(args.interval)
+    except KeyboardInterrupt:
+        logger.info("Stopped")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,8 @@ DROP VIEW IF EXISTS fraud_detection_performance CASCADE;
 DROP FUNCTION IF EXISTS insert_transaction CASCADE;
 
 -- Drop all tables
+DROP TABLE IF EXISTS transaction_rollups CASCADE;
+DROP TABLE IF EXISTS rollup_state CASCADE;
 DROP TABLE IF EXISTS fraud_predictions CASCADE;
 DROP TABLE IF EXISTS ml_models CASCADE;
 DROP TABLE IF EXISTS transactions CASCADE;
@@ -1,12 +1,36 @@
 import os
-import boto3
+import sys
+import argparse
 from minio import Minio
 from dotenv import load_dotenv
-import io
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.services.model_artifact import upload_model_artifact
 
 load_dotenv()
 
-def upload_model_to_minio():
+def activate_model_version(version):
+    # Only once the artifact is downloadable, so workers never poll a version they cannot load
+    from sqlalchemy import text
+    from api.dependencies.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        model_id = db.execute(
+            text("SELECT model_id FROM ml_models WHERE version = :version ORDER BY model_id DESC LIMIT 1"),
+            {"version": version}
+        ).scalar()
+        if model_id is None:
+            print(f"No ml_models row has version {version}; the active model is unchanged")
+            return None
+        db.execute(text("UPDATE ml_models SET active = (model_id = :model_id)"), {"model_id": model_id})
+        db.commit()
+    finally:
+        db.close()
+    print(f"Model {model_id} (version {version}) is now active")
+    return model_id
+
+def upload_model_to_minio(artifact_dir="machine_learning/ml_models/fraud_model", activate=True):
     print("Uploading model to MinIO.")
     
     minio_client = Minio(
@@ -20,36 +44,17 @@ def upload_model_to_minio():
     if not minio_client.bucket_exists(bucket_name):
         minio_client.make_bucket(bucket_name)
     
-    model_path = "machine_learning/random_forest_model.pkl"
-    scaler_path = "machine_learning/scaler.pkl"
-    
-    with open(model_path, 'rb') as model_file:
-        model_data = model_file.read()
-        model_size = len(model_data)
-        model_stream = io.BytesIO(model_data)
-        
-        minio_client.put_object(
-            bucket_name=bucket_name,
-            object_name="models/fraud_model.pkl",
-            data=model_stream,
-            length=model_size,
-            content_type='application/octet-stream'
-        )
-    
-    with open(scaler_path, 'rb') as scaler_file:
-        scaler_data = scaler_file.read()
-        scaler_size = len(scaler_data)
-        scaler_stream = io.BytesIO(scaler_data)
-        
-        minio_client.put_object(
-            bucket_name=bucket_name,
-            object_name="models/scaler.pkl",
-            data=scaler_stream,
-            length=scaler_size,
-            content_type='application/octet-stream'
-        )
+    # Arrays and manifest go under models/fraud_model/<version>/, then models/fraud_model/current.json is repointed
+    version = upload_model_artifact(minio_client, bucket_name, artifact_dir)
     
-    print(f"Model and scaler uploaded to MinIO bucket: {bucket_name}")
+    print(f"Model artifact {version} uploaded to MinIO bucket: {bucket_name}")
+    if activate:
+        activate_model_version(version)
 
 if __name__ == "__main__":
-    upload_model_to_minio()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Upload a model artifact to MinIO and make it current")
+    parser.add_argument("--dir", default="machine_learning/ml_models/fraud_model", help="Artifact directory")
+    parser.add_argument("--no-activate", action="store_true",
+                        help="Upload only; leave the active ml_models row unchanged")
+    args = parser.parse_args()
+    upload_model_to_minio(args.dir, activate=not args.no_activate)
\ No newline at end of file
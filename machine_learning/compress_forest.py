@@ -0,0 +1,289 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.metrics import average_precision_score, roc_auc_score
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.services.flat_forest import FlatForest, OUTPUT_MEAN
+from api.services.model_artifact import ModelArtifact, load_model_artifact, save_model_artifact
+from machine_learning.streaming import PhaseTimer, iter_transaction_chunks, stream_training_data
+from machine_learning.snapshot import SnapshotStore, create_db_engine
+
+# Post-training compression of the exported forest. Candidates are built from
+# the artifact itself (greedy tree subsets, depth cuts, a distilled boosted
+# surrogate), scored on the held-out sample and timed through the same
+# ModelArtifact.predict_fraud_proba path the API serves with.
+
+def greedy_tree_order(tree_values, y, weights, max_trees):
+    """
+    Forward selection: repeatedly add the tree that most improves the average
+    precision of the running mean. Returns tree indices in selection order and
+    the score after each addition.
+    """
+    n_rows, n_trees = tree_values.shape
+    selected, scores = [], []
+    remaining = list(range(n_trees))
+    running_sum = np.zeros(n_rows)
+    for k in range(1, min(max_trees, n_trees) + 1):
+        best_tree, best_score = None, -1.0
+        for tree in remaining:
+            score = average_precision_score(y, (running_sum + tree_values[:, tree]) / k, sample_weight=weights)
+            if score > best_score:
+                best_tree, best_score = tree, score
+        selected.append(best_tree)
+        scores.append(best_score)
+        remaining.remove(best_tree)
+        running_sum += tree_values[:, best_tree]
+    return selected, scores
+
+def distill(teacher, X_train, scaler, n_estimators, max_depth, max_rows, random_state=42):
+    """
+    Fit a GradientBoostingRegressor to the teacher's log-odds and flatten it.
+
+    Targets are the teacher's probabilities rather than labels, so the surrogate
+    learns the forest's ranking. The surrogate takes the same input as the
+    teacher: scaled features, or raw ones with the scaler fused in.
+    """
+    rng = np.random.default_rng(random_state)
+    if len(X_train) > max_rows:
+        X_train = X_train[rng.choice(len(X_train), max_rows, replace=False)]
+
+    teacher_proba = np.clip(teacher.predict_fraud_proba(X_train), 1e-4, 1 - 1e-4)
+    target = np.log(teacher_proba / (1 - teacher_proba))
+    base_score = float(target.mean())
+
+    if teacher.scaler_mean is not None:
+        X_input = (X_train - teacher.scaler_mean) / teacher.scaler_scale
+    else:
+        X_input = scaler.transform(X_train)
+
+    model = GradientBoostingRegressor(
+        n_estimators=n_estimators,
+        max_depth=max_depth,
+        learning_rate=0.1,
+        subsample=0.8,
+        init="zero",
+        random_state=random_state
+    )
+    model.fit(X_input.astype(np.float32), target - base_score)
+    surrogate = FlatForest.from_sklearn_boosting(model, base_score=base_score)
+    if teacher.forest.fused:
+        surrogate = surrogate.fuse_scaler(scaler.mean_, scaler.scale_)
+    return surrogate
+
+def measure_latency(artifact, X, single_rows=1000, batch_size=64, batches=200):
+    # Timed through ModelArtifact so scaling costs are included, as in the API
+    X = np.asarray(X, dtype=np.float64)
+    artifact.predict_fraud_proba(X[:batch_size])
+
+    single = np.empty(single_rows)
+    for i in range(single_rows):
+        row = X[i % len(X)][None, :]
+        started = time.perf_counter()
+        artifact.predict_fraud_proba(row)
+        single[i] = time.perf_counter() - started
+
+    batch = np.empty(batches)
+    for i in range(batches):
+        start = (i * batch_size) % max(len(X) - batch_size, 1)
+        rows = X[start:start + batch_size]
+        started = time.perf_counter()
+        artifact.predict_fraud_proba(rows)
+        batch[i] = (time.perf_counter() - started) / len(rows)
+
+    return {
+        "single_p50_us": float(np.percentile(single, 50) * 1e6),
+        "single_p99_us": float(np.percentile(single, 99) * 1e6),
+        "batch_per_row_p50_us": float(np.percentile(batch, 50) * 1e6),
+        "batch_per_row_p99_us": float(np.percentile(batch, 99) * 1e6)
+    }
+
+def mark_pareto(candidates):
+    # A candidate is on the front if no other one is both at least as accurate and at least as fast
+    for candidate in candidates:
+        candidate["pareto"] = not any(
+            other is not candidate
+            and other["average_precision"] >= candidate["average_precision"]
+            and other["latency"]["single_p50_us"] <= candidate["latency"]["single_p50_us"]
+            and (other["average_precision"] > candidate["average_precision"]
+                 or other["latency"]["single_p50_us"] < candidate["latency"]["single_p50_us"])
+            for other in candidates
+        )
+
+def print_report(candidates):
+    print(f"\n{'candidate':<22} {'trees':>5} {'depth':>5} {'nodes':>8} {'AP':>7} {'AUC':>7} "
+          f"{'1-row p50':>10} {'p99':>8} {'b64 p50':>8} {'p99':>7}")
+    for c in sorted(candidates, key=lambda c: c["latency"]["single_p50_us"]):
+        latency = c["latency"]
+        print(
+            f"{c['name']:<22} {c['n_trees']:>5} {c['max_depth']:>5} {c['n_nodes']:>8} "
+            f"{c['average_precision']:>7.4f} {c['roc_auc']:>7.4f} "
+            f"{latency['single_p50_us']:>10.1f} {latency['single_p99_us']:>8.1f} "
+            f"{latency['batch_per_row_p50_us']:>8.2f} {latency['batch_per_row_p99_us']:>7.2f}"
+            f"{'  *' if c['pareto'] else ''}"
+        )
+    print("Latencies in microseconds per row; * marks the accuracy/latency Pareto front")
+
+def register_model(engine, name, manifest, candidate):
+    from sqlalchemy import text
+    # Same flow as train_forest.py: registered inactive, activated by helpers/upload_to_s3.py after the upload
+    with engine.connect() as conn:
+        conn.execute(text("""
+        INSERT INTO ml_models (model_name, description, performance_metrics, active, version)
+        VALUES (:model_name, :description, :metrics, FALSE, :version)
+        """), {
+            "model_name": f"Compressed {name}",
+            "description": f"{candidate['spec']} compressed from model {manifest['metadata']['compressed_from']}",
+            "metrics": json.dumps({"avg_precision": candidate["average_precision"], "roc_auc": candidate["roc_auc"]}),
+            "version": manifest["version"]
+        })
+        conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Build smaller, faster candidates from the trained forest artifact")
+    parser.add_argument("--model-dir", default="machine_learning/ml_models/fraud_model", help="Artifact to compress")
+    parser.add_argument("--tree-counts", default="5,10,20,30,50", help="Tree subset sizes to try")
+    parser.add_argument("--depths", default="6,8,10,12", help="Depth caps to try")
+    parser.add_argument("--distill", action="store_true", help="Also distill boosted surrogates")
+    parser.add_argument("--distill-trees", default="50,100", help="Boosting rounds per surrogate")
+    parser.add_argument("--distill-depth", type=int, default=4)
+    parser.add_argument("--distill-rows", type=int, default=200000, help="Training rows for the surrogate")
+    parser.add_argument("--memory-budget-mb", type=int, default=int(os.getenv("TRAIN_MEMORY_BUDGET_MB", "2048")))
+    parser.add_argument("--chunk-rows", type=int, default=50000)
+    parser.add_argument("--snapshot-dir", default="data/snapshot")
+    parser.add_argument("--no-snapshot", action="store_true")
+    parser.add_argument("--output", default="machine_learning/evaluation/compression_report.json")
+    parser.add_argument("--export", help="Name of the candidate to write as a serving artifact")
+    parser.add_argument("--export-dir", default="machine_learning/ml_models/fraud_model_compressed")
+    parser.add_argument("--register", action="store_true",
+                        help="Insert the exported candidate as an ml_models row, activated on upload")
+    args = parser.parse_args()
+    timer = PhaseTimer()
+
+    teacher = load_model_artifact(args.model_dir, mmap=False)
+    if teacher.forest.output != OUTPUT_MEAN:
+        raise SystemExit(f"{args.model_dir} is not a random forest artifact")
+    print(f"Compressing model {teacher.version}: {teacher.forest.n_trees} trees, "
+          f"depth {teacher.forest.max_depth}, {teacher.forest.n_nodes} nodes")
+
+    engine = create_db_engine()
+    with timer.phase("load"):
+        if args.no_snapshot:
+            chunks = iter_transaction_chunks(engine, teacher.feature_columns, args.chunk_rows)
+        else:
+            snapshot = SnapshotStore(args.snapshot_dir, teacher.feature_columns)
+            snapshot.refresh(engine, chunk_rows=args.chunk_rows)
+            chunks = snapshot.iter_chunks()
+        scaler = StandardScaler()
+        # The same id-hashed split as training, so the test side was never seen by the forest
+        data = stream_training_data(
+            chunks, len(teacher.feature_columns), scaler, memory_budget_mb=args.memory_budget_mb
+        )
+
+    # Half of the held-out sample picks trees, the other half scores the candidates
+    X_test = data["X_test"].astype(np.float64)
+    y_test, weights = data["y_test"], data["test_weights"]
+    selection = np.random.default_rng(42).random(len(X_test)) < 0.5
+    X_select, y_select, w_select = X_test[selection], y_test[selection], weights[selection]
+    X_report, y_report, w_report = X_test[~selection], y_test[~selection], weights[~selection]
+
+    forests = {}
+    with timer.phase("select"):
+        tree_counts = [n for n in map(int, args.tree_counts.split(",")) if n < teacher.forest.n_trees]
+        X_select_input = X_select
+        if teacher.scaler_mean is not None:
+            X_select_input = (X_select - teacher.scaler_mean) / teacher.scaler_scale
+        tree_values = teacher.forest.predict_tree_values(X_select_input)
+        order, scores = greedy_tree_order(tree_values, y_select, w_select, max(tree_counts, default=0))
+        for n in tree_counts:
+            print(f"Greedy selection: {n} trees reach AP {scores[n - 1]:.4f} on the selection half")
+
+        depths = [d for d in map(int, args.depths.split(",")) if d < teacher.forest.max_depth]
+        for n in tree_counts + [teacher.forest.n_trees]:
+            trees = order[:n] if n < teacher.forest.n_trees else None
+            for depth in depths + [None]:
+                name = f"trees{n}-depth{depth}" if depth else f"trees{n}-full"
+                spec = f"{n} greedily selected trees" if trees else f"all {n} trees"
+                if depth:
+                    spec += f", cut at depth {depth}"
+                forests[name] = (teacher.forest.compact(trees, depth), spec)
+
+    if args.distill:
+        with timer.phase("distill"):
+            for n_estimators in map(int, args.distill_trees.split(",")):
+                name = f"gbr{n_estimators}-depth{args.distill_depth}"
+                forests[name] = (
+                    distill(teacher, data["X_train"].astype(np.float64), scaler, n_estimators,
+                            args.distill_depth, args.distill_rows),
+                    f"boosted surrogate, {n_estimators} trees of depth {args.distill_depth}"
+                )
+                print(f"Distilled {name}")
+
+    candidates = []
+    with timer.phase("evaluate"):
+        for name, (forest, spec) in forests.items():
+            artifact = ModelArtifact(forest, teacher.manifest, None)
+            y_prob = artifact.predict_fraud_proba(X_report)
+            candidates.append({
+                "name": name,
+                "spec": spec,
+                "n_trees": forest.n_trees,
+                "max_depth": forest.max_depth,
+                "n_nodes": forest.n_nodes,
+                "average_precision": float(average_precision_score(y_report, y_prob, sample_weight=w_report)),
+                "roc_auc": float(roc_auc_score(y_report, y_prob, sample_weight=w_report)),
+                "latency": measure_latency(artifact, X_report)
+            })
+    mark_pareto(candidates)
+    print_report(candidates)
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({
+            "source_version": teacher.version,
+            "report_rows": int(len(X_report)),
+            "greedy_order": [int(tree) for tree in order],
+            "greedy_scores": scores,
+            "candidates": candidates,
+            "phases": timer.phases
+        }, f, indent=4)
+    print(f"Report saved to {args.output}")
+
+    if args.export:
+        if args.export not in forests:
+            raise SystemExit(f"Unknown candidate {args.export}; choose one of: {', '.join(forests)}")
+        forest, spec = forests[args.export]
+        candidate = next(c for c in candidates if c["name"] == args.export)
+        scaler_params = {}
+        if not forest.fused:
+            scaler_params = {"scaler_mean": teacher.scaler_mean, "scaler_scale": teacher.scaler_scale}
+        manifest = save_model_artifact(
+            args.export_dir,
+            forest,
+            feature_columns=teacher.feature_columns,
+            threshold=teacher.threshold,
+            metadata={
+                **teacher.manifest.get("metadata", {}),
+                "compressed_from": teacher.version,
+                "compression": spec,
+                "avg_precision": candidate["average_precision"],
+                "roc_auc": candidate["roc_auc"],
+                "latency": candidate["latency"]
+            },
+            **scaler_params
+        )
+        print(f"Exported {args.export} as model artifact {manifest['version']} to {args.export_dir}")
+        if args.register:
+            register_model(engine, args.export, manifest, candidate)
+            print("Registered; upload it with "
+                  f"python helpers/upload_to_s3.py --dir {args.export_dir} to make it the active model")
+
+    timer.report()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from sqlalchemy import bindparam, create_engine, text
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from machine_learning.streaming import FEATURE_COLUMNS, FEATURE_DTYPE
+
+# Local columnar copy of the transactions table for training. Each partition
+# covers a transaction_id range and holds three raw .npy files (ids, features,
+# labels) that are memory-mapped on read. Features and labels never change once
+# set, so a refresh fetches rows above the watermark, the highest id already
+# stored, plus the labels of stored rows that had none yet (transactions
+# scored through the API are labelled later, if ever).
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+# Labels are int8 so rows still waiting for a label can be stored and skipped on read
+UNLABELLED = -1
+
+class SnapshotStore:
+    def __init__(self, directory, feature_columns=FEATURE_COLUMNS):
+        self.directory = directory
+        self.feature_columns = list(feature_columns)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {
+                "format_version": FORMAT_VERSION,
+                "feature_columns": self.feature_columns,
+                "watermark": 0,
+                "partitions": []
+            }
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version: {manifest.get('format_version')}")
+        if manifest["feature_columns"] != self.feature_columns:
+            raise ValueError(f"Snapshot in {self.directory} has different feature columns; rebuild it with --full")
+        return manifest
+
+    def _save_manifest(self):
+        # Partitions are written before the manifest that references them, so a
+        # crash mid-refresh leaves the previous snapshot intact
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f".{MANIFEST_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=4)
+        os.replace(tmp_path, os.path.join(self.directory, MANIFEST_FILE))
+
+    @property
+    def watermark(self):
+        return self.manifest["watermark"]
+
+    @property
+    def rows(self):
+        return sum(partition["rows"] for partition in self.manifest["partitions"])
+
+    def _write_partition(self, ids, X, y):
+        name = f"part-{int(ids[0]):012d}-{int(ids[-1]):012d}"
+        os.makedirs(self.directory, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.directory, prefix=f".{name}-")
+        np.save(os.path.join(staging, "ids.npy"), np.ascontiguousarray(ids, dtype=np.int64))
+        np.save(os.path.join(staging, "X.npy"), np.ascontiguousarray(X, dtype=FEATURE_DTYPE))
+        np.save(os.path.join(staging, "y.npy"), np.ascontiguousarray(y, dtype=np.int8))
+        target = os.path.join(self.directory, name)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.rename(staging, target)
+        return {
+            "name": name,
+            "min_id": int(ids[0]),
+            "max_id": int(ids[-1]),
+            "rows": int(len(ids)),
+            "frauds": int(np.sum(y == 1)),
+            "unlabelled": int(np.sum(y == UNLABELLED))
+        }
+
+    def read_partition(self, partition):
+        path = os.path.join(self.directory, partition["name"])
+        return tuple(
+            np.load(os.path.join(path, f"{array}.npy"), mmap_mode="r", allow_pickle=False)
+            for array in ("ids", "X", "y")
+        )
+
+    def _update_labels(self, partition, y):
+        # Only y.npy is rewritten, staged and swapped in atomically like a partition
+        path = os.path.join(self.directory, partition["name"])
+        tmp_path = os.path.join(path, ".y.npy.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(y, dtype=np.int8))
+        os.replace(tmp_path, os.path.join(path, "y.npy"))
+        partition["frauds"] = int(np.sum(y == 1))
+        partition["unlabelled"] = int(np.sum(y == UNLABELLED))
+
+    def refresh_labels(self, engine, chunk_rows=50000):
+        """
+        Fetch the labels of stored rows that were unlabelled when fetched.
+
+        Returns the number of rows that got a label.
+        """
+        query = text(
+            "SELECT transaction_id, is_fraud FROM transactions "
+            "WHERE transaction_id IN :ids AND is_fraud IS NOT NULL"
+        ).bindparams(bindparam("ids", expanding=True))
+        labelled = 0
+        with engine.connect() as conn:
+            for partition in self.manifest["partitions"]:
+                if not partition["unlabelled"]:
+                    continue
+                ids, _, y = self.read_partition(partition)
+                y = np.array(y)
+                pending = ids[y == UNLABELLED]
+                updated = 0
+                for start in range(0, len(pending), chunk_rows):
+                    rows = conn.execute(query, {"ids": pending[start:start + chunk_rows].tolist()}).all()
+                    if rows:
+                        found = np.array(rows, dtype=np.int64)
+                        y[np.searchsorted(ids, found[:, 0])] = found[:, 1]
+                        updated += len(rows)
+                if updated:
+                    self._update_labels(partition, y)
+                    labelled += updated
+        if labelled:
+            self._save_manifest()
+        return labelled
+
+    def refresh(self, engine, chunk_rows=50000, partition_rows=1000000):
+        """
+        Fill in labels that arrived since the last refresh, then append every
+        row above the watermark as new partitions.
+
+        Returns the number of rows fetched.
+        """
+        self.refresh_labels(engine, chunk_rows)
+        columns = ", ".join(["transaction_id"] + self.feature_columns + ["is_fraud"])
+        query = text(
+            f"SELECT {columns} FROM transactions WHERE transaction_id > :watermark ORDER BY transaction_id"
+        )
+        fetched = 0
+        buffered, buffered_rows = [], 0
+
+        def flush():
+            ids = np.concatenate([block[:, 0] for block in buffered]).astype(np.int64)
+            X = np.concatenate([block[:, 1:-1] for block in buffered]).astype(FEATURE_DTYPE)
+            labels = np.concatenate([block[:, -1] for block in buffered])
+            y = np.where(np.isnan(labels), UNLABELLED, labels).astype(np.int8)
+            self.manifest["partitions"].append(self._write_partition(ids, X, y))
+            self.manifest["watermark"] = int(ids[-1])
+            self._save_manifest()
+
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, max_row_buffer=chunk_rows).execute(
+                query, {"watermark": self.watermark}
+            )
+            for partition in result.partitions(chunk_rows):
+                # NULL labels become NaN here and UNLABELLED on disk
+                block = np.array(partition, dtype=np.float64)
+                buffered.append(block)
+                buffered_rows += len(block)
+                fetched += len(block)
+                if buffered_rows >= partition_rows:
+                    flush()
+                    buffered, buffered_rows = [], 0
+        if buffered:
+            flush()
+        return fetched
+
+    def iter_chunks(self, labelled_only=True):
+        # Same (ids, features, labels) chunks as a database stream, read from the mapped files
+        for partition in self.manifest["partitions"]:
+            ids, X, y = self.read_partition(partition)
+            if labelled_only:
+                mask = y != UNLABELLED
+                yield ids[mask], np.asarray(X[mask]), y[mask].astype(bool)
+            else:
+                yield ids, X, y
+
+    def compact(self, partition_rows=1000000):
+        """
+        Merge runs of small partitions (left by frequent small refreshes) into
+        partitions of up to partition_rows rows.
+        """
+        old_partitions = self.manifest["partitions"]
+        new_partitions = []
+        group, group_rows = [], 0
+
+        def merge():
+            if len(group) == 1:
+                new_partitions.append(group[0])
+                return
+            arrays = [self.read_partition(partition) for partition in group]
+            new_partitions.append(self._write_partition(
+                np.concatenate([a[0] for a in arrays]),
+                np.concatenate([a[1] for a in arrays]),
+                np.concatenate([a[2] for a in arrays])
+            ))
+
+        for partition in old_partitions:
+            if group and group_rows + partition["rows"] > partition_rows:
+                merge()
+                group, group_rows = [], 0
+            group.append(partition)
+            group_rows += partition["rows"]
+        if group:
+            merge()
+
+        self.manifest["partitions"] = new_partitions
+        self._save_manifest()
+        kept = {partition["name"] for partition in new_partitions}
+        for partition in old_partitions:
+            if partition["name"] not in kept:
+                shutil.rmtree(os.path.join(self.directory, partition["name"]), ignore_errors=True)
+        return len(old_partitions), len(new_partitions)
+
+    def inspect(self):
+        size = 0
+        for root, _, files in os.walk(self.directory):
+            size += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        partitions = self.manifest["partitions"]
+        print(f"Snapshot: {self.directory}")
+        print(f"Watermark: transaction_id {self.watermark}")
+        print(f"Rows: {self.rows} ({sum(p['frauds'] for p in partitions)} frauds, "
+              f"{sum(p['unlabelled'] for p in partitions)} unlabelled)")
+        print(f"Partitions: {len(partitions)}, {size / (1024 * 1024):.1f} MB on disk")
+        for partition in partitions:
+            print(f"  {partition['name']}: {partition['rows']} rows, {partition['frauds']} frauds")
+
+def create_db_engine():
+    load_dotenv()
+    db_url = f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
+    return create_engine(db_url)
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local training snapshot of the transactions table")
+    parser.add_argument("command", choices=["refresh", "inspect", "compact"])
+    parser.add_argument("--dir", default="data/snapshot", help="Snapshot directory")
+    parser.add_argument("--full", action="store_true", help="refresh: drop the snapshot and rebuild it")
+    parser.add_argument("--chunk-rows", type=int, default=50000, help="Rows fetched per round trip")
+    parser.add_argument("--partition-rows", type=int, default=1000000, help="Target rows per partition")
+    args = parser.parse_args()
+
+    if args.command == "refresh" and args.full:
+        shutil.rmtree(args.dir, ignore_errors=True)
+    store = SnapshotStore(args.dir)
+
+    if args.command == "refresh":
+        fetched = store.refresh(create_db_engine(), chunk_rows=args.chunk_rows, partition_rows=args.partition_rows)
+        print(f"Fetched {fetched} rows; watermark is now {store.watermark}")
+    elif args.command == "compact":
+        before, after = store.compact(partition_rows=args.partition_rows)
+        print(f"Compacted {before} partitions into {after}")
+    else:
+        store.inspect()
+
+if __name__ == "__main__":
+    main()
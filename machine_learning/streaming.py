@@ -0,0 +1,196 @@
+import os
+import time
+import resource
+import numpy as np
+from sqlalchemy import text
+
+FEATURE_COLUMNS = ["time"] + [f"v{i}" for i in range(1, 29)] + ["amount"]
+
+# Float32 is what the trees train on anyway, so storing it halves memory at no cost in accuracy
+FEATURE_DTYPE = np.float32
+# Copies of each sample alive at once while training, for sizing the samples to a memory budget
+TRAIN_SAMPLE_COPIES = 5
+TEST_SAMPLE_COPIES = 2
+TEST_ROWS_PER_TRAIN_ROW = 0.5
+
+def current_rss_mb():
+    # Resident set size right now; falls back to the peak where /proc is unavailable
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+class PhaseTimer:
+    """Records wall-clock time and RSS for each named phase of a run."""
+    def __init__(self):
+        self.phases = []
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def report(self):
+        print("\n=== Phase timings ===")
+        print(f"{'phase':<12} {'seconds':>10} {'rss MB':>10} {'peak MB':>10}")
+        for phase in self.phases:
+            print(f"{phase['phase']:<12} {phase['seconds']:>10.2f} {phase['rss_mb']:>10.1f} {phase['peak_rss_mb']:>10.1f}")
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.phases.append({
+            "phase": self.name,
+            "seconds": time.perf_counter() - self.started,
+            "rss_mb": current_rss_mb(),
+            # Process-wide high-water mark at the end of the phase
+            "peak_rss_mb": peak_rss_mb()
+        })
+        return False
+
+class Reservoir:
+    """
+    Uniform fixed-size sample of a stream of rows (Algorithm R, vectorized per chunk).
+
+    Rows are stored in a preallocated float32 array, so memory use is fixed by
+    capacity no matter how many rows are streamed through. Each row past the
+    first capacity takes exactly one draw from rng, which must not be shared,
+    so the sample depends only on the order of the rows and not on how they
+    are split into chunks.
+    """
+    def __init__(self, capacity, n_features, rng):
+        self.capacity = capacity
+        self.rows = np.empty((capacity, n_features), dtype=FEATURE_DTYPE)
+        self.seen = 0
+        self.rng = rng
+
+    def add(self, chunk):
+        n = len(chunk)
+        if n == 0:
+            return
+        filled = min(self.seen, self.capacity)
+        take = min(self.capacity - filled, n)
+        self.rows[filled:filled + take] = chunk[:take]
+
+        if take < n:
+            # Row number i (1-based over the stream) replaces a random slot with probability capacity / i.
+            # Fancy assignment keeps the last write per slot, matching the sequential algorithm.
+            positions = np.arange(self.seen + take + 1, self.seen + n + 1)
+            slots = (self.rng.random(n - take) * positions).astype(np.int64)
+            accepted = slots < self.capacity
+            self.rows[slots[accepted]] = chunk[take:][accepted]
+        self.seen += n
+
+    @property
+    def size(self):
+        return min(self.seen, self.capacity)
+
+    def sample(self):
+        return self.rows[:self.size]
+
+def iter_transaction_chunks(engine, feature_cols, chunk_rows):
+    """
+    Stream (transaction_id, features, labels) chunks through a server-side cursor.
+
+    Only chunk_rows rows are held by the driver at a time.
+    """
+    columns = ", ".join(["transaction_id"] + feature_cols + ["is_fraud"])
+    # In id order, like a snapshot, so both sources feed the reservoirs the same rows in the same order
+    query = text(f"SELECT {columns} FROM transactions WHERE is_fraud IS NOT NULL ORDER BY transaction_id")
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunk_rows).execute(query)
+        for partition in result.partitions(chunk_rows):
+            block = np.array(partition, dtype=np.float64)
+            yield (
+                block[:, 0].astype(np.int64),
+                block[:, 1:-1].astype(FEATURE_DTYPE),
+                block[:, -1].astype(bool)
+            )
+
+def is_test_row(transaction_ids, test_size):
+    # Deterministic split on the id, so reruns and resumed runs hold out the same rows
+    hashed = (transaction_ids.astype(np.uint64) * np.uint64(2654435761)) % np.uint64(1 << 32)
+    return hashed < np.uint64(test_size * (1 << 32))
+
+def stream_training_data(chunks, n_features, scaler, memory_budget_mb,
+                         test_size=0.2, legit_per_fraud=None, random_state=42):
+    """
+    Reduce a stream of (transaction_id, features, labels) chunks to bounded
+    train and test samples. The chunks come from iter_transaction_chunks or a
+    SnapshotStore.
+
+    The stream is split into train and test by transaction id. Within each
+    side, frauds and legitimate rows are kept in separate reservoirs sized from
+    memory_budget_mb, so the legitimate class is undersampled while streaming and
+    every row has the same chance of being kept. The budget covers the samples
+    and the copies training makes of them, not the fitted model. The scaler is fitted
+    incrementally on every training row, not only on the kept ones.
+
+    Returns a dict with the sampled arrays and the per-class row counts seen,
+    including test sample weights that undo the undersampling in metrics.
+    """
+    rng = np.random.default_rng(random_state)
+    row_bytes = n_features * np.dtype(FEATURE_DTYPE).itemsize
+
+    # Sized for the peak in train_forest.py, while SMOTE runs: the train sample,
+    # its scaled copy, the synthetic rows (up to one sample) and the stacked
+    # output (up to two), next to the test sample and its scaled copy. The
+    # forest's trees are not included.
+    budget_bytes = memory_budget_mb * 1024 * 1024
+    sample_bytes = row_bytes * (TRAIN_SAMPLE_COPIES + TEST_SAMPLE_COPIES * TEST_ROWS_PER_TRAIN_ROW)
+    train_rows = max(int(budget_bytes / sample_bytes), 1000)
+    test_rows = max(int(train_rows * TEST_ROWS_PER_TRAIN_ROW), 1000)
+    # Frauds are rare; a tenth of each sample is far more than the dataset holds.
+    # Every reservoir draws from its own generator, derived from random_state.
+    streams = iter(np.random.SeedSequence(random_state).spawn(4))
+    reservoirs = {
+        split: (
+            Reservoir(rows // 10, n_features, np.random.default_rng(next(streams))),
+            Reservoir(rows - rows // 10, n_features, np.random.default_rng(next(streams)))
+        )
+        for split, rows in (("train", train_rows), ("test", test_rows))
+    }
+
+    for transaction_ids, X_chunk, y_chunk in chunks:
+        test_mask = is_test_row(transaction_ids, test_size)
+        for split, mask in (("train", ~test_mask), ("test", test_mask)):
+            X_split, y_split = X_chunk[mask], y_chunk[mask]
+            if split == "train" and len(X_split):
+                scaler.partial_fit(X_split)
+            fraud_reservoir, legit_reservoir = reservoirs[split]
+            fraud_reservoir.add(X_split[y_split])
+            legit_reservoir.add(X_split[~y_split])
+
+    data = {}
+    for split, (fraud_reservoir, legit_reservoir) in reservoirs.items():
+        X_fraud, X_legit = fraud_reservoir.sample(), legit_reservoir.sample()
+        if split == "train" and legit_per_fraud is not None and len(X_fraud):
+            keep = min(len(X_legit), int(legit_per_fraud * len(X_fraud)))
+            X_legit = X_legit[rng.choice(len(X_legit), keep, replace=False)]
+        X_split = np.concatenate([X_legit, X_fraud])
+        y_split = np.concatenate([np.zeros(len(X_legit), dtype=bool), np.ones(len(X_fraud), dtype=bool)])
+        order = rng.permutation(len(X_split))
+
+        data[f"X_{split}"] = X_split[order]
+        data[f"y_{split}"] = y_split[order]
+        data[f"{split}_seen"] = {"fraud": fraud_reservoir.seen, "legit": legit_reservoir.seen}
+        if split == "test":
+            # Each kept row stands for seen / kept rows of its class
+            weights = np.where(
+                y_split,
+                fraud_reservoir.seen / max(len(X_fraud), 1),
+                legit_reservoir.seen / max(len(X_legit), 1)
+            )
+            data["test_weights"] = weights[order]
+    return data
@@ -1,4 +1,6 @@
 import os
+import sys
+import argparse
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -11,7 +13,6 @@ from datetime import datetime
 import json
 
 # ML imports
-from sklearn.model_selection import train_test_split, GridSearchCV, cross_val_score
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import (
@@ -21,6 +22,44 @@ from sklearn.metrics import (
 )
 from imblearn.over_sampling import SMOTE
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.services.flat_forest import FlatForest, verify_flat_forest, verify_fused_forest
+from api.services.model_artifact import save_model_artifact
+from machine_learning.streaming import FEATURE_COLUMNS, PhaseTimer, iter_transaction_chunks, stream_training_data
+from machine_learning.snapshot import SnapshotStore
+
+parser = argparse.ArgumentParser(description="Train the fraud detection Random Forest")
+parser.add_argument(
+    "--fused", action="store_true",
+    help="Export the serving artifact with the scaler folded into the split thresholds"
+)
+parser.add_argument(
+    "--memory-budget-mb", type=int, default=int(os.getenv("TRAIN_MEMORY_BUDGET_MB", "2048")),
+    help="Memory for the sampled training and test data; the table is streamed, never loaded whole"
+)
+parser.add_argument(
+    "--chunk-rows", type=int, default=50000,
+    help="Rows fetched per server-side cursor round trip"
+)
+parser.add_argument(
+    "--snapshot-dir", default="data/snapshot",
+    help="Local snapshot to train from; only rows newer than it are fetched from PostgreSQL"
+)
+parser.add_argument(
+    "--no-snapshot", action="store_true",
+    help="Stream the whole table from PostgreSQL instead of the snapshot"
+)
+parser.add_argument(
+    "--legit-per-fraud", type=float, default=None,
+    help="Undersample legitimate training rows to this many per fraud before SMOTE"
+)
+parser.add_argument(
+    "--params",
+    help="JSON file of forest parameters overriding the defaults, e.g. best_params.json from tune_forest.py"
+)
+args = parser.parse_args()
+timer = PhaseTimer()
+
 load_dotenv()
 
 db_url = f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
@@ -29,30 +68,45 @@ engine = create_engine(db_url)
 os.makedirs("models", exist_ok=True)
 os.makedirs("machine_learning/evaluation", exist_ok=True)
 
-print("Loading data from PostgreSQL...")
-query = "SELECT * FROM transactions"
-df = pd.read_sql(query, engine)
-print(f"Loaded {len(df)} transactions")
+feature_cols = list(FEATURE_COLUMNS)
 
-fraud_count = df['is_fraud'].sum()
-print(f"Number of fraudulent transactions: {fraud_count} ({fraud_count/len(df)*100:.3f}%)")
-print(f"Number of legitimate transactions: {len(df)-fraud_count}")
-
-X = df.drop(['transaction_id', 'is_fraud', 'processed_at', 'source'], axis=1)
-y = df['is_fraud']
-
-feature_cols = X.columns.tolist()
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
-
-print(f"Training set: {X_train.shape[0]} samples ({y_train.sum()} frauds)")
-print(f"Test set: {X_test.shape[0]} samples ({y_test.sum()} frauds)")
+if args.no_snapshot:
+    print(f"Streaming data from PostgreSQL (memory budget {args.memory_budget_mb} MB)...")
+    chunks = iter_transaction_chunks(engine, feature_cols, args.chunk_rows)
+else:
+    snapshot = SnapshotStore(args.snapshot_dir, feature_cols)
+    with timer.phase("refresh"):
+        fetched = snapshot.refresh(engine, chunk_rows=args.chunk_rows)
+    print(f"Snapshot refreshed with {fetched} new rows ({snapshot.rows} rows, watermark {snapshot.watermark})")
+    print(f"Streaming data from the snapshot (memory budget {args.memory_budget_mb} MB)...")
+    chunks = snapshot.iter_chunks()
 
 scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
+with timer.phase("load"):
+    data = stream_training_data(
+        chunks, len(feature_cols), scaler,
+        memory_budget_mb=args.memory_budget_mb,
+        test_size=0.2,
+        legit_per_fraud=args.legit_per_fraud,
+        random_state=42
+    )
+
+X_train, y_train = data["X_train"], data["y_train"]
+X_test, y_test, test_weights = data["X_test"], data["y_test"], data["test_weights"]
+total_seen = sum(data["train_seen"].values()) + sum(data["test_seen"].values())
+fraud_count = data["train_seen"]["fraud"] + data["test_seen"]["fraud"]
+print(f"Streamed {total_seen} transactions")
+print(f"Number of fraudulent transactions: {fraud_count} ({fraud_count/max(total_seen, 1)*100:.3f}%)")
+print(f"Number of legitimate transactions: {total_seen-fraud_count}")
+
+print(f"Training set: {X_train.shape[0]} samples ({y_train.sum()} frauds) sampled from {sum(data['train_seen'].values())}")
+print(f"Test set: {X_test.shape[0]} samples ({y_test.sum()} frauds) sampled from {sum(data['test_seen'].values())}")
+
+with timer.phase("scale"):
+    # The scaler was fitted on every streamed training row. transform() keeps
+    # float32 input in float32, so each scaled array is a single same-sized copy.
+    X_train_scaled = scaler.transform(X_train).astype(np.float32, copy=False)
+    X_test_scaled = scaler.transform(X_test).astype(np.float32, copy=False)
 
 # Save the scaler for future use
 with open("models/scaler.pkl", "wb") as f:
@@ -60,8 +114,10 @@ with open("models/scaler.pkl", "wb") as f:
 print("Feature scaler saved to models/scaler.pkl")
 
 print("Applying SMOTE to handle class imbalance.")
-smote = SMOTE(random_state=42)
-X_train_resampled, y_train_resampled = smote.fit_resample(X_train_scaled, y_train)
+with timer.phase("smote"):
+    smote = SMOTE(random_state=42)
+    X_train_resampled, y_train_resampled = smote.fit_resample(X_train_scaled, y_train)
+    del X_train_scaled
 
 print(f"Original training set shape: {np.bincount(y_train.astype(int))}")
 print(f"Resampled training set shape: {np.bincount(y_train_resampled.astype(int))}")
@@ -70,7 +126,7 @@ print(f"Resampled training set shape: {np.bincount(y_train_resampled.astype(int)
 print("\nTraining Random Forest model")
 start_time = time.time()
 
-rf_model = RandomForestClassifier(
+rf_params = dict(
     n_estimators=100,        # Number of trees
     max_depth=15,            # Maximum depth of trees
     min_samples_split=10,    # Minimum samples required to split node
@@ -80,21 +136,32 @@ rf_model = RandomForestClassifier(
     class_weight='balanced', # Handle class imbalance
     random_state=42          # For reproducibility
 )
+if args.params:
+    with open(args.params) as f:
+        rf_params.update(json.load(f))
+    print(f"Using forest parameters from {args.params}: {rf_params}")
+
+# Trees are independent, so fit them on every core, whatever the params file says
+rf_model = RandomForestClassifier(**{**rf_params, "n_jobs": -1})
 
-rf_model.fit(X_train_resampled, y_train_resampled)
+with timer.phase("fit"):
+    rf_model.fit(X_train_resampled, y_train_resampled)
+    del X_train_resampled, y_train_resampled
 
 training_time = time.time() - start_time
 print(f"Model trained in {training_time:.2f} seconds")
 
-y_pred = rf_model.predict(X_test_scaled)
-y_prob = rf_model.predict_proba(X_test_scaled)[:, 1]
+with timer.phase("evaluate"):
+    y_pred = rf_model.predict(X_test_scaled)
+    y_prob = rf_model.predict_proba(X_test_scaled)[:, 1]
 
-accuracy = accuracy_score(y_test, y_pred)
-precision = precision_score(y_test, y_pred)
-recall = recall_score(y_test, y_pred)
-f1 = f1_score(y_test, y_pred)
-auc = roc_auc_score(y_test, y_prob)
-avg_precision = average_precision_score(y_test, y_prob)
+# Test weights undo the undersampling, so metrics describe the full table
+accuracy = accuracy_score(y_test, y_pred, sample_weight=test_weights)
+precision = precision_score(y_test, y_pred, sample_weight=test_weights)
+recall = recall_score(y_test, y_pred, sample_weight=test_weights)
+f1 = f1_score(y_test, y_pred, sample_weight=test_weights)
+auc = roc_auc_score(y_test, y_prob, sample_weight=test_weights)
+avg_precision = average_precision_score(y_test, y_prob, sample_weight=test_weights)
 
 print("\n=== Model Performance ===")
 print(f"Accuracy: {accuracy:.4f}")
@@ -104,17 +171,19 @@ print(f"F1 Score: {f1:.4f}")
 print(f"ROC AUC: {auc:.4f}")
 print(f"Average Precision: {avg_precision:.4f}")
 
-cm = confusion_matrix(y_test, y_pred)
+# Weighted like the other metrics: estimated counts over the full table, not the undersampled test set
+cm = np.rint(confusion_matrix(y_test, y_pred, sample_weight=test_weights)).astype(np.int64)
+cm_sample = confusion_matrix(y_test, y_pred)
 plt.figure(figsize=(10, 8))
 sns.heatmap(cm, annot=True, fmt='d', cmap='Blues')
-plt.title('Confusion Matrix - Random Forest')
+plt.title('Confusion Matrix - Random Forest (estimated counts over all transactions)')
 plt.ylabel('True Label')
 plt.xlabel('Predicted Label')
 plt.savefig("machine_learning/evaluation/rf_confusion_matrix.png")
 print("Confusion matrix saved to machine_learning/evaluation/rf_confusion_matrix.png")
 
 plt.figure(figsize=(10, 8))
-fpr, tpr, _ = roc_curve(y_test, y_prob)
+fpr, tpr, _ = roc_curve(y_test, y_prob, sample_weight=test_weights)
 plt.plot(fpr, tpr, label=f'ROC Curve (AUC = {auc:.4f})')
 plt.plot([0, 1], [0, 1], 'k--')
 plt.xlabel('False Positive Rate')
@@ -125,7 +194,7 @@ plt.savefig("machine_learning/evaluation/rf_roc_curve.png")
 print("ROC curve saved to machine_learning/evaluation/rf_roc_curve.png")
 
 plt.figure(figsize=(10, 8))
-precision_curve, recall_curve, _ = precision_recall_curve(y_test, y_prob)
+precision_curve, recall_curve, _ = precision_recall_curve(y_test, y_prob, sample_weight=test_weights)
 plt.plot(recall_curve, precision_curve, label=f'PR Curve (AP = {avg_precision:.4f})')
 plt.xlabel('Recall')
 plt.ylabel('Precision')
@@ -150,11 +219,16 @@ plt.savefig("machine_learning/evaluation/rf_feature_importance.png")
 print("Feature importance plot saved to machine_learning/evaluation/rf_feature_importance.png")
 
 print("\n=== Classification Report ===")
-print(classification_report(y_test, y_pred))
+print(classification_report(y_test, y_pred, sample_weight=test_weights))
 
 results = {
     "model_type": "Random Forest",
     "training_time": training_time,
+    "rows_streamed": total_seen,
+    "train_rows": int(len(X_train)),
+    "test_rows": int(len(X_test)),
+    "memory_budget_mb": args.memory_budget_mb,
+    "phases": timer.phases,
     "performance_metrics": {
         "accuracy": float(accuracy),
         "precision": float(precision),
@@ -164,6 +238,7 @@ results = {
         "avg_precision": float(avg_precision)
     },
     "confusion_matrix": cm.tolist(),
+    "confusion_matrix_test_sample": cm_sample.tolist(),
     "feature_importance": {
         feature: float(importance) 
         for feature, importance in zip(feature_cols, rf_model.feature_importances_)
@@ -184,6 +259,37 @@ with open(f"{app_model_dir}/fraud_model.pkl", "wb") as f:
     pickle.dump(rf_model, f)
 print(f"Model saved to {app_model_dir}/fraud_model.pkl for API use")
 
+# Export the forest as a memory-mappable array artifact for the API
+with timer.phase("export"):
+    flat_forest = FlatForest.from_sklearn(rf_model)
+    max_diff = verify_flat_forest(rf_model, flat_forest, X_test_scaled)
+    print(f"Flat forest matches predict_proba on the test set (max |diff| = {max_diff:.2e})")
+
+    serving_forest = flat_forest
+    scaler_params = {"scaler_mean": scaler.mean_, "scaler_scale": scaler.scale_}
+    if args.fused:
+        # Verify on the held-out raw test set before the artifact is written
+        serving_forest = flat_forest.fuse_scaler(scaler.mean_, scaler.scale_)
+        fused_stats = verify_fused_forest(rf_model, scaler, serving_forest, X_test)
+        print(f"Fused forest verified against scaler + model on the test set: {fused_stats}")
+        scaler_params = {}
+
+    artifact_dir = f"{app_model_dir}/fraud_model"
+    manifest = save_model_artifact(
+        artifact_dir,
+        serving_forest,
+        feature_columns=feature_cols,
+        threshold=0.5,
+        metadata={
+            "model_type": "Random Forest",
+            "training_time": training_time,
+            "roc_auc": float(auc),
+            "avg_precision": float(avg_precision)
+        },
+        **scaler_params
+    )
+print(f"Model artifact {manifest['version']} ({serving_forest.n_trees} trees, {serving_forest.n_nodes} nodes, fused={serving_forest.fused}) saved to {artifact_dir}")
+
 model_metadata = {
     "model_name": "Random Forest",
     "description": f"Fraud detection Random Forest model trained on {len(X_train)} samples with SMOTE resampling",
@@ -200,25 +306,26 @@ model_metadata = {
 with engine.connect() as conn:
     from sqlalchemy import text
     
-    conn.execute(text("UPDATE ml_models SET active = FALSE"))
-    
+    # Registered inactive: helpers/upload_to_s3.py activates it once the artifact
+    # is uploaded, and API workers then hot-swap to it
     insert_query = text("""
-    INSERT INTO ml_models (model_name, description, performance_metrics, active)
-    VALUES (:model_name, :description, :metrics, TRUE)
+    INSERT INTO ml_models (model_name, description, performance_metrics, active, version)
+    VALUES (:model_name, :description, :metrics, FALSE, :version)
     """)
     
     conn.execute(insert_query, {
         "model_name": model_metadata["model_name"],
         "description": model_metadata["description"],
-        "metrics": json.dumps(model_metadata["performance_metrics"])
+        "metrics": json.dumps(model_metadata["performance_metrics"]),
+        "version": manifest["version"]
     })
     
     conn.commit()
-print("Model metadata saved to database")
+print("Model metadata saved to database; it becomes active once uploaded with helpers/upload_to_s3.py")
 
 def test_prediction(transaction_data):
 
-    sample = pd.DataFrame([transaction_data])
+    sample = np.array([[transaction_data[col] for col in feature_cols]])
     
     sample_scaled = scaler.transform(sample)
     
@@ -231,13 +338,14 @@ def test_prediction(transaction_data):
         "confidence": float(2 * abs(prob - 0.5))
     }
 
-legitimate_sample = X[y == 0].iloc[0].to_dict()
+legitimate_sample = dict(zip(feature_cols, X_test[~y_test][0]))
 print("\n=== Sample Prediction (Legitimate Transaction) ===")
 print(test_prediction(legitimate_sample))
 
-if len(X[y == 1]) > 0:
-    fraud_sample = X[y == 1].iloc[0].to_dict()
+if y_test.any():
+    fraud_sample = dict(zip(feature_cols, X_test[y_test][0]))
     print("\n=== Sample Prediction (Fraudulent Transaction) ===")
     print(test_prediction(fraud_sample))
 
+timer.report()
 print("\nRandom Forest model training and evaluation complete!")
\ No newline at end of file
@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from sklearn.model_selection import StratifiedKFold
+from sklearn.preprocessing import StandardScaler
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import average_precision_score
+from imblearn.over_sampling import SMOTE
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.services.flat_forest import FlatForest
+from machine_learning.streaming import FEATURE_COLUMNS, PhaseTimer, iter_transaction_chunks, stream_training_data
+from machine_learning.snapshot import SnapshotStore, create_db_engine
+
+DEFAULT_GRID = {
+    "n_estimators": [50, 100, 200],
+    "max_depth": [8, 12, 15, None],
+    "min_samples_leaf": [1, 4, 10],
+    "max_features": ["sqrt", 0.5]
+}
+
+# Fixed forest settings from train_forest.py that are not searched
+BASE_PARAMS = {
+    "min_samples_split": 10,
+    "bootstrap": True,
+    "class_weight": "balanced",
+    "random_state": 42
+}
+
+def expand_grid(grid):
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+class FoldCache:
+    """
+    SMOTE-resampled cross-validation folds, computed once and stored as .npy files.
+
+    The cache key covers the data, the fold layout and the SMOTE seed, so every
+    candidate, round and run on the same data reuses the same folds. Workers
+    memory-map the files, so the folds are shared instead of copied per process.
+    """
+    def __init__(self, directory, X, y, n_splits, random_state=42):
+        fingerprint = hashlib.sha256()
+        fingerprint.update(np.ascontiguousarray(X).tobytes())
+        fingerprint.update(np.ascontiguousarray(y).tobytes())
+        fingerprint.update(f"{n_splits}-{random_state}".encode("utf-8"))
+        self.directory = os.path.join(directory, fingerprint.hexdigest()[:16])
+        self.n_splits = n_splits
+        self.random_state = random_state
+
+    def _path(self, fold, name):
+        return os.path.join(self.directory, f"fold-{fold}-{name}.npy")
+
+    def build(self, X, y):
+        # The data is passed here rather than kept on the cache, which is pickled into every task
+        if os.path.exists(os.path.join(self.directory, "complete")):
+            print(f"Reusing cached folds in {self.directory}")
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        folds = StratifiedKFold(n_splits=self.n_splits, shuffle=True, random_state=self.random_state)
+        for fold, (train_idx, val_idx) in enumerate(folds.split(X, y)):
+            X_resampled, y_resampled = SMOTE(random_state=self.random_state).fit_resample(
+                X[train_idx], y[train_idx]
+            )
+            # Shuffle once so any prefix is a stratified-enough subsample for early halving rounds
+            order = np.random.default_rng(self.random_state + fold).permutation(len(X_resampled))
+            np.save(self._path(fold, "X_train"), X_resampled[order].astype(np.float32))
+            np.save(self._path(fold, "y_train"), y_resampled[order].astype(bool))
+            np.save(self._path(fold, "X_val"), X[val_idx].astype(np.float32))
+            np.save(self._path(fold, "y_val"), y[val_idx].astype(bool))
+            print(f"Fold {fold}: {len(train_idx)} rows resampled to {len(X_resampled)}, {len(val_idx)} validation rows")
+        open(os.path.join(self.directory, "complete"), "w").close()
+
+    def load(self, fold):
+        return tuple(
+            np.load(self._path(fold, name), mmap_mode="r")
+            for name in ("X_train", "y_train", "X_val", "y_val")
+        )
+
+def measure_latency(flat_forest, X, batch_size, repeats):
+    # Serving cost on the path the API actually uses: the flattened forest
+    rows = np.asarray(X[:batch_size], dtype=np.float64)
+    flat_forest.predict_fraud_proba(rows)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        flat_forest.predict_fraud_proba(rows)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings)) / len(rows)
+
+def evaluate(task):
+    cache, fold, params, train_fraction = task
+    X_train, y_train, X_val, y_val = cache.load(fold)
+    n_rows = max(int(len(X_train) * train_fraction), 100)
+
+    # Parallelism comes from the process pool; a grid entry must not override it
+    model = RandomForestClassifier(**{**BASE_PARAMS, **params, "n_jobs": 1})
+    started = time.perf_counter()
+    model.fit(X_train[:n_rows], y_train[:n_rows])
+    train_seconds = time.perf_counter() - started
+
+    y_prob = model.predict_proba(X_val)[:, 1]
+    flat_forest = FlatForest.from_sklearn(model)
+    return {
+        "fold": fold,
+        "train_rows": n_rows,
+        "average_precision": float(average_precision_score(y_val, y_prob)),
+        "train_seconds": train_seconds,
+        "latency_single_row_us": measure_latency(flat_forest, X_val, 1, 200) * 1e6,
+        "latency_per_row_batch64_us": measure_latency(flat_forest, X_val, 64, 50) * 1e6,
+        "n_nodes": flat_forest.n_nodes
+    }
+
+def run_round(executor, cache, candidates, train_fraction):
+    tasks = [
+        (cache, fold, params, train_fraction)
+        for params in candidates
+        for fold in range(cache.n_splits)
+    ]
+    fold_results = list(executor.map(evaluate, tasks))
+
+    results = []
+    for i, params in enumerate(candidates):
+        folds = fold_results[i * cache.n_splits:(i + 1) * cache.n_splits]
+        scores = [result["average_precision"] for result in folds]
+        results.append({
+            "params": params,
+            "train_fraction": train_fraction,
+            "train_rows": folds[0]["train_rows"],
+            "mean_average_precision": float(np.mean(scores)),
+            "std_average_precision": float(np.std(scores)),
+            "mean_train_seconds": float(np.mean([result["train_seconds"] for result in folds])),
+            "latency_single_row_us": float(np.median([result["latency_single_row_us"] for result in folds])),
+            "latency_per_row_batch64_us": float(np.median([result["latency_per_row_batch64_us"] for result in folds])),
+            "n_nodes": int(np.median([result["n_nodes"] for result in folds]))
+        })
+    results.sort(key=lambda result: result["mean_average_precision"], reverse=True)
+    return results
+
+def search(cache, candidates, jobs, strategy, factor):
+    """
+    Grid search evaluates every candidate on the full folds. Successive halving
+    starts every candidate on a fraction of the training rows and keeps the top
+    1/factor after each round, giving survivors factor times more rows, until the
+    last round trains on all of them.
+    """
+    rounds = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        if strategy == "grid":
+            rounds.append(run_round(executor, cache, candidates, 1.0))
+            return rounds
+
+        n_rounds = max(int(np.ceil(np.log(len(candidates)) / np.log(factor))), 1)
+        survivors = candidates
+        for round_num in range(n_rounds + 1):
+            # A lone survivor goes straight to the full folds
+            train_fraction = 1.0 if len(survivors) == 1 else 1.0 / factor ** (n_rounds - round_num)
+            started = time.perf_counter()
+            results = run_round(executor, cache, survivors, train_fraction)
+            rounds.append(results)
+            print(
+                f"Round {round_num}: {len(survivors)} candidates on {results[0]['train_rows']} rows per fold, "
+                f"best AP {results[0]['mean_average_precision']:.4f} ({time.perf_counter() - started:.1f}s)"
+            )
+            if train_fraction >= 1.0:
+                break
+            survivors = [result["params"] for result in results[:max(len(results) // factor, 1)]]
+    return rounds
+
+def print_results(results, top):
+    print(f"\n{'AP':>8} {'±':>7} {'train s':>8} {'1-row us':>9} {'b64 us/row':>11} {'nodes':>8}  params")
+    for result in results[:top]:
+        print(
+            f"{result['mean_average_precision']:>8.4f} {result['std_average_precision']:>7.4f} "
+            f"{result['mean_train_seconds']:>8.2f} {result['latency_single_row_us']:>9.1f} "
+            f"{result['latency_per_row_batch64_us']:>11.2f} {result['n_nodes']:>8}  {result['params']}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Search Random Forest hyperparameters by cross-validated average precision")
+    parser.add_argument("--grid", help="JSON file mapping parameter names to candidate lists (default: built-in grid)")
+    parser.add_argument("--search", choices=["halving", "grid"], default="halving")
+    parser.add_argument("--factor", type=int, default=3, help="Successive halving reduction factor")
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--memory-budget-mb", type=int, default=int(os.getenv("TRAIN_MEMORY_BUDGET_MB", "2048")))
+    parser.add_argument("--legit-per-fraud", type=float, default=None)
+    parser.add_argument("--chunk-rows", type=int, default=50000)
+    parser.add_argument("--snapshot-dir", default="data/snapshot")
+    parser.add_argument("--no-snapshot", action="store_true")
+    parser.add_argument("--cache-dir", default="data/tuning_cache", help="Where resampled folds are cached")
+    parser.add_argument("--output", default="machine_learning/evaluation/tuning_results.json")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+    candidates = expand_grid(grid)
+    timer = PhaseTimer()
+
+    engine = create_db_engine()
+    with timer.phase("load"):
+        if args.no_snapshot:
+            chunks = iter_transaction_chunks(engine, FEATURE_COLUMNS, args.chunk_rows)
+        else:
+            snapshot = SnapshotStore(args.snapshot_dir)
+            snapshot.refresh(engine, chunk_rows=args.chunk_rows)
+            chunks = snapshot.iter_chunks()
+        scaler = StandardScaler()
+        # Tuning only needs the training side; the held-out test split stays untouched
+        data = stream_training_data(
+            chunks, len(FEATURE_COLUMNS), scaler,
+            memory_budget_mb=args.memory_budget_mb,
+            legit_per_fraud=args.legit_per_fraud
+        )
+        X = scaler.transform(data["X_train"]).astype(np.float32)
+        y = data["y_train"]
+    print(f"Tuning on {len(X)} rows ({int(y.sum())} frauds), {len(candidates)} candidates, {args.jobs} workers")
+
+    with timer.phase("folds"):
+        cache = FoldCache(args.cache_dir, X, y, args.folds)
+        cache.build(X, y)
+
+    with timer.phase("search"):
+        rounds = search(cache, candidates, args.jobs, args.search, args.factor)
+
+    final = rounds[-1]
+    print_results(final, args.top)
+    best = final[0]
+    print(f"\nBest parameters: {best['params']} (AP {best['mean_average_precision']:.4f})")
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({
+            "search": args.search,
+            "factor": args.factor,
+            "folds": args.folds,
+            "rows": int(len(X)),
+            "best_params": best["params"],
+            "rounds": rounds,
+            "phases": timer.phases
+        }, f, indent=4)
+    best_params_path = os.path.join(os.path.dirname(args.output), "best_params.json")
+    with open(best_params_path, "w") as f:
+        json.dump(best["params"], f, indent=4)
+    print(f"Results saved to {args.output}; best parameters to {best_params_path}")
+    timer.report()
+
+if __name__ == "__main__":
+    main()
@@ -1,71 +1,389 @@
 import os
+import sys
 import json
-import pika
+import time
+import signal
+import argparse
 import logging
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+import multiprocessing
+import pika
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.core.config import settings
+from api.core.callback_urls import parse_allowed_hosts
+from api.dependencies.database import SessionLocal
+from api.models.transaction import Transaction, FraudPrediction, MLModel
+from api.services.ml_model import model_service, FEATURE_COLUMNS
+from api.services.model_registry import active_model_cache, to_active_model
+from api.controllers.fraud_detection import build_prediction_row, prediction_from_row
+from api.services.rollups import refresh_rollups, apply_late_predictions
+from rabbit.webhooks import WebhookSender
 
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(process)d - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger("transaction_consumer")
-load_dotenv()
 
-db_url = f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
-engine = create_engine(db_url)
+RETRY_HEADER = "x-retries"
 
-def callback(ch, method, properties, body):
-    try:
-        transaction_data = json.loads(body)
-        transaction_id = transaction_data.get('transaction_id')
-        logger.info(f"Received transaction: {transaction_id}")
-        
-        with engine.connect() as conn:
-            result = conn.execute(
-                text("SELECT transaction_id FROM transactions WHERE transaction_id = :id"),
-                {"id": transaction_id}
-            )
-            exists = result.fetchone() is not None
-            
-            if exists:
-                logger.info(f"Transaction {transaction_id} verified in database")
-            else:
-                logger.warning(f"Transaction {transaction_id} not found in database. Adding log entry.")
-        
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-        
-    except Exception as e:
-        logger.error(f"Error processing message: {e}")
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+def dead_letter_queue():
+    return settings.RABBITMQ_QUEUE_DEAD_LETTER or f"{settings.RABBITMQ_QUEUE_TRANSACTIONS}.dead"
 
-def main():
-    logger.info("Starting transaction verification consumer.")
-    
+def default_connection_factory():
     credentials = pika.PlainCredentials(
-        os.getenv('RABBITMQ_USER'),
-        os.getenv('RABBITMQ_PASSWORD')
+        settings.RABBITMQ_USER,
+        settings.RABBITMQ_PASSWORD
     )
     parameters = pika.ConnectionParameters(
-        host=os.getenv('RABBITMQ_HOST'),
-        port=int(os.getenv('RABBITMQ_PORT')),
-        credentials=credentials
+        host=settings.RABBITMQ_HOST,
+        port=int(settings.RABBITMQ_PORT),
+        credentials=credentials,
+        heartbeat=30
     )
-    
-    connection = pika.BlockingConnection(parameters)
-    channel = connection.channel()
-    queue_name = os.getenv('RABBITMQ_QUEUE_TRANSACTIONS')
-    channel.queue_declare(queue=queue_name, durable=True)
-    channel.basic_consume(queue=queue_name, on_message_callback=callback)
-    
-    logger.info(f"Listening for messages on {queue_name}. Press CTRL+C to exit.")
+    return pika.BlockingConnection(parameters)
+
+class PoisonMessage(Exception):
+    pass
+
+def parse_message(body):
+    try:
+        message = json.loads(body)
+    except ValueError as e:
+        raise PoisonMessage(f"invalid JSON: {e}")
+    if not isinstance(message, dict) or not isinstance(message.get("transaction_id"), int):
+        raise PoisonMessage("missing transaction_id")
+    if "prediction" not in message:
+        missing = [col for col in FEATURE_COLUMNS if not isinstance(message.get(col), (int, float))]
+        if missing:
+            raise PoisonMessage(f"missing or non-numeric features: {missing}")
+    return message
+
+def get_active_model_id(db):
+    active_model = active_model_cache.get()
+    if active_model is None:
+        active_model = to_active_model(db.query(MLModel).filter(MLModel.active == True).first())
+        if active_model is not None:
+            active_model_cache.set(active_model)
+    return active_model.model_id if active_model else None
+
+class ScoringWorker:
+    """
+    Scores transactions from RABBITMQ_QUEUE_TRANSACTIONS in micro-batches.
+
+    Up to WORKER_PREFETCH unacked messages are delivered at once. They are
+    collected into batches of WORKER_BATCH_SIZE (or whatever arrived within
+    WORKER_BATCH_MAX_DELAY_MS), scored with one vectorized predict_batch call,
+    written with one multi-row insert and acknowledged with a single
+    basic_ack(multiple=True). Every result is published to
+    RABBITMQ_QUEUE_PROCESSED.
+
+    Messages the API already scored and stored carry a "prediction" and are
+    only forwarded. Messages that cannot be parsed, or whose transaction does not
+    exist, go straight to the dead-letter queue. Messages enqueued with a
+    callback_url get their result POSTed there as well. A batch that fails is
+    republished with an incremented retry header and dead-lettered after
+    WORKER_MAX_RETRIES attempts, so a poison message can never loop forever.
+
+    Every ROLLUP_REFRESH_INTERVAL_SECONDS the worker also folds newly settled
+    transactions into the analytics rollups. With several workers, one of them
+    takes each step and the others skip it.
+    """
+    def __init__(self, connection_factory=default_connection_factory, session_factory=SessionLocal):
+        self.connection_factory = connection_factory
+        self.session_factory = session_factory
+        self.webhooks = WebhookSender(
+            max_workers=settings.WEBHOOK_WORKERS,
+            timeout=settings.WEBHOOK_TIMEOUT_SECONDS,
+            max_attempts=settings.WEBHOOK_MAX_ATTEMPTS,
+            backoff=settings.WEBHOOK_BACKOFF_SECONDS,
+            allowed_hosts=parse_allowed_hosts(settings.WEBHOOK_ALLOWED_HOSTS),
+            allow_private=settings.WEBHOOK_ALLOW_PRIVATE_ADDRESSES
+        )
+        self.batch_size = settings.WORKER_BATCH_SIZE
+        self.max_delay = settings.WORKER_BATCH_MAX_DELAY_MS / 1000.0
+
+        self.connection = None
+        self.channel = None
+        self.pending = []
+        self.first_received_at = None
+        self.stopping = False
+        self.rollups_refreshed_at = 0.0
+
+        self.messages_total = 0
+        self.scored_total = 0
+        self.dead_lettered_total = 0
+        self.retried_total = 0
+        self.late_scored_total = 0
+
+    def connect(self):
+        self.connection = self.connection_factory()
+        self.channel = self.connection.channel()
+        # Retries and dead letters replace a message that is acked right after, so they must be confirmed
+        self.channel.confirm_delivery()
+        for queue in (settings.RABBITMQ_QUEUE_TRANSACTIONS, settings.RABBITMQ_QUEUE_PROCESSED, dead_letter_queue()):
+            self.channel.queue_declare(queue=queue, durable=True)
+        self.channel.basic_qos(prefetch_count=settings.WORKER_PREFETCH)
+        self.channel.basic_consume(queue=settings.RABBITMQ_QUEUE_TRANSACTIONS, on_message_callback=self._on_message)
+
+    def _on_message(self, ch, method, properties, body):
+        if not self.pending:
+            self.first_received_at = time.monotonic()
+        self.pending.append((method, properties, body))
+
+    def run(self):
+        self.connect()
+        logger.info(f"Listening for messages on {settings.RABBITMQ_QUEUE_TRANSACTIONS}")
+        while not self.stopping:
+            timeout = 1.0
+            if self.pending:
+                timeout = max(0.0, self.first_received_at + self.max_delay - time.monotonic())
+            self.connection.process_data_events(time_limit=timeout)
+
+            if self.pending and (
+                len(self.pending) >= self.batch_size
+                or time.monotonic() - self.first_received_at >= self.max_delay
+            ):
+                batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+                if self.pending:
+                    self.first_received_at = time.monotonic()
+                self.process_batch(batch)
+
+            self.refresh_rollups()
+
+        # Unprocessed deliveries go back to the queue for another worker
+        if self.pending:
+            self.channel.basic_nack(delivery_tag=self.pending[-1][0].delivery_tag, multiple=True, requeue=True)
+            self.pending = []
+        self.connection.close()
+
+    def process_batch(self, batch):
+        self.messages_total += len(batch)
+        try:
+            self._process_batch(batch)
+        except (pika.exceptions.NackError, pika.exceptions.UnroutableError) as e:
+            # A result, retry or dead letter was not accepted: redeliver the batch
+            # rather than ack messages whose replacement may be lost. Stored
+            # predictions are not duplicated on redelivery.
+            logger.error(f"Publish not confirmed, requeueing batch of {len(batch)}: {e}")
+            self.channel.basic_nack(delivery_tag=batch[-1][0].delivery_tag, multiple=True, requeue=True)
+            return
+        # Every message of the batch has been stored, forwarded, retried or dead-lettered
+        self.channel.basic_ack(delivery_tag=batch[-1][0].delivery_tag, multiple=True)
+
+    def _process_batch(self, batch):
+        messages = []
+        for method, properties, body in batch:
+            try:
+                messages.append((method, properties, body, parse_message(body)))
+            except PoisonMessage as e:
+                self._dead_letter(properties, body, str(e))
+
+        try:
+            results = self._score_and_store([message for _, _, _, message in messages])
+        except Exception as e:
+            logger.error(f"Error processing batch of {len(messages)}: {e}")
+            time.sleep(settings.WORKER_RETRY_DELAY_SECONDS)
+            for _, properties, body, _ in messages:
+                self._retry(properties, body, str(e))
+        else:
+            for (_, properties, body, message), result in zip(messages, results):
+                if isinstance(result, str):
+                    self._dead_letter(properties, body, result)
+                    continue
+                self._publish(settings.RABBITMQ_QUEUE_PROCESSED, json.dumps(result))
+                if message.get("callback_url"):
+                    self.webhooks.send(message["callback_url"], {"status": "scored", **result})
+
+    def refresh_rollups(self):
+        interval = settings.ROLLUP_REFRESH_INTERVAL_SECONDS
+        if interval <= 0 or time.monotonic() - self.rollups_refreshed_at < interval:
+            return
+        self.rollups_refreshed_at = time.monotonic()
+        db = self.session_factory()
+        try:
+            refresh_rollups(db, settings.ROLLUP_BATCH_ROWS, settings.ROLLUP_SETTLE_SECONDS)
+        except Exception as e:
+            # Analytics lag behind until the next attempt; scoring carries on
+            logger.error(f"Error refreshing rollups: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _score_and_store(self, messages):
+        # Returns one entry per message: the processed result, or the reason it is dead-lettered
+        results = [None] * len(messages)
+        to_score = [i for i, message in enumerate(messages) if "prediction" not in message]
+        for i, message in enumerate(messages):
+            if "prediction" in message:
+                results[i] = {"transaction_id": message["transaction_id"], "prediction": message["prediction"]}
+        if not to_score:
+            return results
+
+        transaction_ids = [messages[i]["transaction_id"] for i in to_score]
+        db = self.session_factory()
+        try:
+            existing = set(db.execute(
+                select(Transaction.transaction_id).where(Transaction.transaction_id.in_(transaction_ids))
+            ).scalars())
+            # Redelivered messages must not insert a second prediction. The unique
+            # index settles races between workers; this only skips the common case.
+            already_scored = set(db.execute(
+                select(FraudPrediction.transaction_id).where(FraudPrediction.transaction_id.in_(transaction_ids))
+            ).scalars())
+
+            # One prediction per transaction: redeliveries and duplicates in the batch are not scored again
+            scorable, queued = [], set()
+            for i in to_score:
+                transaction_id = messages[i]["transaction_id"]
+                if transaction_id not in existing:
+                    results[i] = f"transaction {transaction_id} not found"
+                elif transaction_id not in already_scored and transaction_id not in queued:
+                    scorable.append(i)
+                    queued.add(transaction_id)
+
+            predictions = model_service.predict_batch([messages[i] for i in scorable])
+            if predictions and predictions[0]["model_id"] is None:
+                model_id = get_active_model_id(db)
+                for prediction in predictions:
+                    prediction["model_id"] = model_id
+
+            scored = {}
+            rows = []
+            for i, prediction in zip(scorable, predictions):
+                transaction_id = messages[i]["transaction_id"]
+                scored[transaction_id] = prediction
+                if prediction["model_id"] is not None:
+                    rows.append(build_prediction_row(transaction_id, prediction))
+            inserted = []
+            if rows:
+                inserted = db.execute(
+                    insert(FraudPrediction)
+                    .on_conflict_do_nothing(index_elements=["transaction_id"])
+                    .returning(FraudPrediction.transaction_id),
+                    rows
+                ).scalars().all()
+                # Rows rolled up while still waiting in the queue move to the model that scored them
+                self.late_scored_total += apply_late_predictions(db, inserted)
+
+            # Stored earlier, or by another worker in the meantime: publish what is stored
+            lost_race = {row["transaction_id"] for row in rows} - set(inserted)
+            stored = self._stored_predictions(db, sorted(already_scored | lost_race))
+            db.commit()
+            for i in to_score:
+                transaction_id = messages[i]["transaction_id"]
+                if transaction_id in existing:
+                    prediction = stored.get(transaction_id) or scored[transaction_id]
+                    results[i] = {"transaction_id": transaction_id, "prediction": prediction}
+            self.scored_total += len(scorable)
+        finally:
+            db.close()
+        return results
+
+    def _stored_predictions(self, db, transaction_ids):
+        if not transaction_ids:
+            return {}
+        rows = db.execute(
+            select(FraudPrediction, MLModel.version)
+            .outerjoin(MLModel, MLModel.model_id == FraudPrediction.model_id)
+            .where(FraudPrediction.transaction_id.in_(transaction_ids))
+        ).all()
+        return {prediction.transaction_id: prediction_from_row(prediction, version) for prediction, version in rows}
+
+    def _publish(self, queue, body, headers=None):
+        self.channel.basic_publish(
+            exchange='',
+            routing_key=queue,
+            body=body,
+            properties=pika.BasicProperties(delivery_mode=2, headers=headers),
+            mandatory=True
+        )
+
+    def _dead_letter(self, properties, body, reason):
+        logger.warning(f"Dead-lettering message: {reason}")
+        headers = dict(properties.headers or {})
+        headers["x-death-reason"] = reason
+        self._publish(dead_letter_queue(), body, headers)
+        self.dead_lettered_total += 1
+
+    def _retry(self, properties, body, reason):
+        headers = dict(properties.headers or {})
+        retries = int(headers.get(RETRY_HEADER, 0)) + 1
+        if retries > settings.WORKER_MAX_RETRIES:
+            self._dead_letter(properties, body, f"failed {retries - 1} times: {reason}")
+            return
+        headers[RETRY_HEADER] = retries
+        self._publish(settings.RABBITMQ_QUEUE_TRANSACTIONS, body, headers)
+        self.retried_total += 1
+
+    def stop(self, *args):
+        self.stopping = True
+
+def run_worker():
+    # Each process maps the same model artifact files, so extra workers cost little memory
+    try:
+        model_service.initialize()
+    except RuntimeError as e:
+        logger.error(f"{e}; refusing to consume")
+        sys.exit(1)
+    model_service.start_watcher()
+
+    worker = ScoringWorker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    while not worker.stopping:
+        try:
+            worker.run()
+        except pika.exceptions.AMQPConnectionError as e:
+            # Unacked deliveries are requeued by the broker when the connection drops
+            logger.error(f"Lost connection to RabbitMQ, reconnecting: {e}")
+            worker.pending = []
+            time.sleep(settings.RABBITMQ_RECONNECT_DELAY_SECONDS)
+    model_service.stop_watcher()
+    worker.webhooks.close()
+    logger.info(
+        f"Worker stopped: {worker.messages_total} messages, {worker.scored_total} scored, "
+        f"{worker.retried_total} retried, {worker.dead_lettered_total} dead-lettered, "
+        f"{worker.late_scored_total} moved in rollups, "
+        f"{worker.webhooks.delivered_total} webhooks delivered, {worker.webhooks.failed_total} failed"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Fraud scoring queue worker")
+    parser.add_argument("--workers", type=int, default=settings.WORKER_PROCESSES or os.cpu_count(),
+                        help="Number of worker processes (default: one per core)")
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        logger.info("Starting transaction scoring worker.")
+        run_worker()
+        return
+
+    logger.info(f"Starting {args.workers} transaction scoring workers.")
+    processes = [
+        multiprocessing.Process(target=run_worker, name=f"scoring-worker-{i}")
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def shutdown(*_):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
     try:
-        channel.start_consuming()
+        for process in processes:
+            process.join()
     except KeyboardInterrupt:
-        logger.info("Shutting down consumer.")
-        channel.stop_consuming()
-    finally:
-        connection.close()
+        logger.info("Shutting down workers.")
+        shutdown()
+        for process in processes:
+            process.join()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,92 @@
+import json
+import time
+import socket
+import logging
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from api.core.callback_urls import UnsafeCallbackURL, resolve_callback_url
+
+logger = logging.getLogger("transaction_consumer")
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    # Connects to an address resolved and checked beforehand, never re-resolving the host
+    def __init__(self, host, port, address, timeout):
+        super().__init__(host, port, timeout=timeout)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, host, port, address, timeout):
+        super().__init__(host, port, timeout=timeout)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        # Certificate and SNI are still checked against the host name
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+class WebhookSender:
+    """
+    Delivers scoring results to client callback URLs in background threads.
+
+    Each delivery is a JSON POST, retried with exponential backoff up to
+    max_attempts times on connection errors, 5xx and 429. The URL is checked
+    again before every attempt and the connection goes to the checked
+    address; redirects are never followed, and a 3xx or other 4xx answer ends
+    the delivery. Failures are logged and never hold up the queue: the result
+    is already stored and can still be polled.
+    """
+    def __init__(self, max_workers, timeout, max_attempts, backoff, allowed_hosts=(), allow_private=False):
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.allowed_hosts = allowed_hosts
+        self.allow_private = allow_private
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="webhook")
+
+        self.delivered_total = 0
+        self.failed_total = 0
+
+    def send(self, url, payload):
+        self.executor.submit(self._deliver, url, json.dumps(payload, default=str).encode("utf-8"))
+
+    def _post(self, url, body):
+        # Returns the response status; raises UnsafeCallbackURL or a connection error
+        parts, address = resolve_callback_url(url, self.allowed_hosts, self.allow_private)
+        connection_class = _PinnedHTTPSConnection if parts.scheme == "https" else _PinnedHTTPConnection
+        connection = connection_class(parts.hostname, parts.port, address, self.timeout)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        try:
+            connection.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    def _deliver(self, url, body):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                status = self._post(url, body)
+                if 200 <= status < 300:
+                    self.delivered_total += 1
+                    return
+                error = f"HTTP {status}"
+                retryable = status >= 500 or status == 429
+            except UnsafeCallbackURL as e:
+                error, retryable = str(e), False
+            except (OSError, http.client.HTTPException) as e:
+                error, retryable = str(e) or type(e).__name__, True
+
+            if not retryable or attempt == self.max_attempts:
+                logger.error(f"Webhook to {url} failed after {attempt} attempts: {error}")
+                self.failed_total += 1
+                return
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+from fakes import prepare_environment
+
+# Settings are read at import time; placeholders stand in for the required ones
+prepare_environment()
@@ -0,0 +1,99 @@
+"""
+FlatForest against sklearn: the plain export, the scaler-fused export and
+compacted forests must give the probabilities sklearn gives.
+
+    python -m pytest tests/test_flat_forest.py
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.services.flat_forest import FlatForest
+
+@pytest.fixture(scope="module")
+def data():
+    X, y = make_classification(
+        n_samples=3000, n_features=12, n_informative=6, weights=[0.9, 0.1], random_state=7
+    )
+    # Raw features on very different scales, like time and amount next to the PCA components
+    X_raw = X * np.linspace(0.5, 5000.0, X.shape[1]) + np.linspace(-100.0, 100000.0, X.shape[1])
+    return X_raw[:2000], y[:2000], X_raw[2000:]
+
+@pytest.fixture(scope="module")
+def fitted(data):
+    X_train, y_train, _ = data
+    scaler = StandardScaler().fit(X_train)
+    model = RandomForestClassifier(n_estimators=15, max_depth=8, random_state=7)
+    model.fit(scaler.transform(X_train), y_train)
+    return scaler, model
+
+def truncated_proba(model, trees, max_depth, X):
+    # Mean class-1 fraction of the deepest node each row reaches within max_depth, per sklearn's own paths
+    X = np.asarray(X, dtype=np.float32)
+    per_tree = []
+    for index in trees:
+        tree = model.estimators_[index].tree_
+        depth = np.zeros(tree.node_count, dtype=int)
+        for node in range(tree.node_count):
+            if tree.children_left[node] != -1:
+                depth[tree.children_left[node]] = depth[tree.children_right[node]] = depth[node] + 1
+        path = model.estimators_[index].decision_path(X)
+        reached = [
+            max((node for node in path.indices[path.indptr[row]:path.indptr[row + 1]] if depth[node] <= max_depth),
+                key=lambda node: depth[node])
+            for row in range(len(X))
+        ]
+        counts = tree.value[reached, 0, :]
+        per_tree.append(counts[:, 1] / counts.sum(axis=1))
+    return np.mean(per_tree, axis=0)
+
+def test_from_sklearn_matches_predict_proba(data, fitted):
+    _, _, X_test = data
+    scaler, model = fitted
+    X = scaler.transform(X_test)
+    flat = FlatForest.from_sklearn(model)
+    np.testing.assert_allclose(flat.predict_proba(X), model.predict_proba(X), atol=1e-9)
+
+def test_fused_scaler_matches_scaled_predict_proba(data, fitted):
+    _, _, X_test = data
+    scaler, model = fitted
+    fused = FlatForest.from_sklearn(model).fuse_scaler(scaler.mean_, scaler.scale_)
+    expected = model.predict_proba(scaler.transform(X_test))
+    actual = fused.predict_proba(X_test)
+    # Rows within float32 rounding of a split may branch differently
+    mismatched = np.any(np.abs(actual - expected) > 1e-9, axis=1)
+    assert np.mean(mismatched) <= 1e-3
+    assert np.max(np.abs(actual - expected)) < 0.5
+
+def test_compact_without_cuts_is_unchanged(data, fitted):
+    _, _, X_test = data
+    scaler, model = fitted
+    X = scaler.transform(X_test)
+    compacted = FlatForest.from_sklearn(model).compact()
+    np.testing.assert_allclose(compacted.predict_proba(X), model.predict_proba(X), atol=1e-9)
+
+@pytest.mark.parametrize("trees, max_depth", [([0, 3, 7, 11], 3), (list(range(15)), 5), ([2], 1)])
+def test_compact_matches_truncated_sklearn_trees(data, fitted, trees, max_depth):
+    _, _, X_test = data
+    scaler, model = fitted
+    X = scaler.transform(X_test)
+    compacted = FlatForest.from_sklearn(model).compact(trees, max_depth)
+    assert compacted.n_trees == len(trees)
+    assert compacted.max_depth <= max_depth
+    np.testing.assert_allclose(
+        compacted.predict_fraud_proba(X), truncated_proba(model, trees, max_depth, X), atol=1e-9
+    )
+
+def test_compacted_fused_forest_scores_raw_features(data, fitted):
+    _, _, X_test = data
+    scaler, model = fitted
+    fused = FlatForest.from_sklearn(model).fuse_scaler(scaler.mean_, scaler.scale_).compact([1, 4], 4)
+    expected = truncated_proba(model, [1, 4], 4, scaler.transform(X_test))
+    mismatched = np.abs(fused.predict_fraud_proba(X_test) - expected) > 1e-9
+    assert np.mean(mismatched) <= 1e-3
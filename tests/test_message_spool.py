@@ -0,0 +1,121 @@
+"""
+Publisher spool shared by several processes: each spools to its own
+directory, and segments are only adopted from processes that are gone.
+Messages the publisher could not get confirmed before shutdown end up there.
+
+    python -m pytest tests/test_message_spool.py
+"""
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.services.message_queue import MessageSpool, RabbitMQPublisher
+from fakes import FakeBrokerConnection, FakeChannel, FakeIOLoop
+
+def spool_and_wait(directory, messages, ready, done):
+    spool = MessageSpool(directory, segment_messages=3)
+    for i in range(messages):
+        spool.append("transactions", f"{os.getpid()}-{i}")
+    ready.set()
+    done.wait(30)
+
+def adopt_and_drain(directory, results):
+    spool = MessageSpool(directory, segment_messages=3)
+    spool.open()
+    drained = []
+    while len(spool):
+        drained.extend(body for _, body in spool.pop_segment())
+    spool.close()
+    results.put(drained)
+
+def start_owner(context, directory, messages):
+    ready = context.Event()
+    done = context.Event()
+    process = context.Process(target=spool_and_wait, args=(directory, messages, ready, done))
+    process.start()
+    assert ready.wait(30)
+    return process, done
+
+def drain(spool):
+    drained = []
+    while len(spool):
+        drained.extend(body for _, body in spool.pop_segment())
+    return drained
+
+def test_round_trip_and_clean_close(tmp_path):
+    spool = MessageSpool(str(tmp_path), segment_messages=2)
+    for i in range(5):
+        spool.append("transactions", i)
+    assert len(spool) == 5
+    assert drain(spool) == [0, 1, 2, 3, 4]
+    spool.close()
+    assert os.listdir(tmp_path) == []
+
+def test_live_owner_keeps_its_segments(tmp_path):
+    context = multiprocessing.get_context("fork")
+    owner, done = start_owner(context, str(tmp_path), 7)
+    try:
+        spool = MessageSpool(str(tmp_path))
+        spool.open()
+        assert len(spool) == 0
+        assert spool.pop_segment() == []
+        spool.close()
+    finally:
+        done.set()
+        owner.join()
+
+def test_segments_of_dead_process_are_adopted_once(tmp_path):
+    context = multiprocessing.get_context("fork")
+    owner, _ = start_owner(context, str(tmp_path), 7)
+    os.kill(owner.pid, signal.SIGKILL)
+    owner.join()
+
+    results = context.Queue()
+    adopters = [context.Process(target=adopt_and_drain, args=(str(tmp_path), results)) for _ in range(4)]
+    for adopter in adopters:
+        adopter.start()
+    drained = [results.get(timeout=30) for _ in adopters]
+    for adopter in adopters:
+        adopter.join()
+
+    bodies = [body for batch in drained for body in batch]
+    assert bodies == [f"{owner.pid}-{i}" for i in range(7)]
+    assert os.listdir(tmp_path) == []
+
+class UnreachableBroker:
+    # Connection factory whose every connection attempt fails
+    def __init__(self, on_open, on_open_error, on_close):
+        self.ioloop = FakeIOLoop()
+        self.ioloop.add_callback_threadsafe(lambda: on_open_error(self, "connection refused"))
+
+class SilentChannel(FakeChannel):
+    # Accepts publishes but never confirms them
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.connection.published += 1
+
+class SilentBroker(FakeBrokerConnection):
+    def channel(self, on_open_callback):
+        channel = SilentChannel(self)
+        self.ioloop.add_callback_threadsafe(lambda: on_open_callback(channel))
+
+@pytest.mark.parametrize("broker", [UnreachableBroker, SilentBroker])
+def test_close_spools_unpublished_messages(tmp_path, broker):
+    publisher = RabbitMQPublisher(
+        ["transactions"], connection_factory=broker, reconnect_delay=0.01,
+        spool=MessageSpool(str(tmp_path), segment_messages=3)
+    )
+    for i in range(5):
+        assert publisher.publish("transactions", f"message-{i}")
+    time.sleep(0.1)
+    publisher.close(timeout=0.2)
+    assert publisher.stats()["spooled_total"] == 5
+
+    spool = MessageSpool(str(tmp_path))
+    spool.open()
+    assert sorted(drain(spool)) == [f"message-{i}" for i in range(5)]
+    spool.close()
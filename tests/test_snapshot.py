@@ -0,0 +1,66 @@
+"""
+Training snapshot refreshes against a SQLite stand-in for the transactions
+table, including labels that arrive after a row was first fetched.
+
+    python -m pytest tests/test_snapshot.py
+"""
+import os
+import sys
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from machine_learning.snapshot import SnapshotStore
+from machine_learning.streaming import FEATURE_COLUMNS
+
+def make_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'transactions.db'}")
+    columns = ", ".join(f"{column} REAL" for column in FEATURE_COLUMNS)
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE transactions (transaction_id INTEGER PRIMARY KEY, {columns}, is_fraud BOOLEAN)"))
+    return engine
+
+def insert_rows(engine, labels, first_id):
+    columns = ["transaction_id"] + FEATURE_COLUMNS + ["is_fraud"]
+    statement = text(f"INSERT INTO transactions ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)})")
+    rows = []
+    for offset, label in enumerate(labels):
+        row = {column: float(first_id + offset) for column in FEATURE_COLUMNS}
+        row.update(transaction_id=first_id + offset, is_fraud=label)
+        rows.append(row)
+    with engine.begin() as conn:
+        conn.execute(statement, rows)
+
+def labelled(store):
+    chunks = list(store.iter_chunks())
+    ids = np.concatenate([chunk[0] for chunk in chunks])
+    y = np.concatenate([chunk[2] for chunk in chunks])
+    return dict(zip(ids.tolist(), y.tolist()))
+
+def test_refresh_appends_rows_above_the_watermark(tmp_path):
+    engine = make_engine(tmp_path)
+    store = SnapshotStore(str(tmp_path / "snapshot"))
+    insert_rows(engine, [False, True, False], first_id=1)
+    assert store.refresh(engine, chunk_rows=2) == 3
+    insert_rows(engine, [True], first_id=4)
+    assert store.refresh(engine, chunk_rows=2) == 1
+    assert store.watermark == 4
+    assert labelled(SnapshotStore(str(tmp_path / "snapshot"))) == {1: False, 2: True, 3: False, 4: True}
+
+def test_label_arriving_between_refreshes_is_picked_up(tmp_path):
+    engine = make_engine(tmp_path)
+    store = SnapshotStore(str(tmp_path / "snapshot"))
+    insert_rows(engine, [False, None, True, None], first_id=1)
+    store.refresh(engine)
+    assert labelled(store) == {1: False, 3: True}
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE transactions SET is_fraud = TRUE WHERE transaction_id = 2"))
+    insert_rows(engine, [False], first_id=5)
+    store.refresh(engine)
+
+    reopened = SnapshotStore(str(tmp_path / "snapshot"))
+    assert labelled(reopened) == {1: False, 2: True, 3: True, 5: False}
+    assert [partition["unlabelled"] for partition in reopened.manifest["partitions"]] == [1, 0]
+    assert sum(partition["frauds"] for partition in reopened.manifest["partitions"]) == 2